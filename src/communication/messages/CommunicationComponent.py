@@ -1,10 +1,9 @@
-import json
-import pickle
 import socket
 import threading
 import os
 from typing import Union, Generic, TypeVar, List, Callable
-from utilities import component, ipc
+from utilities import component, ipc, tracing
+import communication.messages.frames as frames
 import time
 from dataclasses import dataclass
 
@@ -21,11 +20,11 @@ def clear_route(_route: str) -> str:
     return _route
 
 
-def sanitize_log_data(data: dict) -> dict:
+def sanitize_log_data(data: dict) -> List[dict]:
     """
-    This method is used to sanitize data of IPC log message for base station
+    This method is used to sanitize data of IPC log message for base station, a message holds a batch of log records
     """
-    return pickle.loads(data)
+    return [log.to_dict() for log in data["logs"]]
 
 
 T = TypeVar('T')
@@ -69,10 +68,17 @@ class SensorEvent:
 class CommunicationComponent(component.Component):
     """
     This component is responsible for forwarding messages from redis IPC to the base station and vice-versa.
+    Messages are sent as binary frames once the base station accepted a binary version, as legacy JSON frames
+    otherwise, see :mod:`src.communication.messages.frames`.
+    Frames are sent by a single writer thread, from a bounded queue, see :class:`FrameWriter
+    <src.communication.messages.frames.FrameWriter>`.
     """
 
     NAME = "communication"
 
+    #: The maximum number of frames waiting to be sent, frames are dropped beyond
+    OUTBOUND_QUEUE_SIZE = 1024
+
     def __init__(self, ipc_node: ipc.IpcNode):
         super().__init__(ipc_node)
 
@@ -83,7 +89,10 @@ class CommunicationComponent(component.Component):
 
         self.waiting_time_before_reconnection = 0.5
         self.client_socket: Union[socket.socket, None] = None
-        self.emission_thread = None
+        #: The encoder of the frames sent on the current connection
+        self.encoder = frames.FrameEncoder()
+        #: The writer of the current connection
+        self.writer: Union[frames.FrameWriter, None] = None
         self.reception_thread = None
         self.heartbeat_emission_thread = None
         self.time_between_heartbeats = 1.5
@@ -116,8 +125,8 @@ class CommunicationComponent(component.Component):
 
         retry = 1
         while self.alive:
-            self.logger.info(f"Trying to connect to {self.host}:{self.port} (attempt {retry})",
-                             self.NAME)
+            self.logger.info("Trying to connect to {host}:{port} (attempt {attempt})", self.NAME,
+                             fields={"host": self.host, "port": self.port, "attempt": retry})
 
             # Close the socket if it is already open
             if self.client_socket:
@@ -125,6 +134,8 @@ class CommunicationComponent(component.Component):
 
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_socket.settimeout(5)
+            # Frames are gathered by the writer, they must not wait for more data
+            self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
             try:
                 self.client_socket.connect((self.host, self.port))
@@ -132,13 +143,19 @@ class CommunicationComponent(component.Component):
                                  self.NAME)
                 self.stop_threads = False
 
+                # Legacy frames until the base station answers the hello frame with a binary version
+                self.encoder = frames.FrameEncoder()
+                self.writer = frames.FrameWriter(self.client_socket, self.OUTBOUND_QUEUE_SIZE, self.handle_writer_error)
+                self.send_frame(self.encoder.hello())
+
                 self.create_threads()
 
             except Exception as e:
-                self.logger.info(f"Connection error: {e}", self.NAME)
+                self.logger.info("Connection error: {error}", self.NAME, fields={"error": e})
                 self.logger.info(
-                    f"Retrying in {self.waiting_time_before_reconnection} seconds (retry {retry})",
+                    "Retrying in {delay} seconds (retry {attempt})",
                     self.NAME,
+                    fields={"delay": self.waiting_time_before_reconnection, "attempt": retry},
                 )
                 retry += 1
 
@@ -163,31 +180,44 @@ class CommunicationComponent(component.Component):
         # Wait for the threads to be finished
         self.heartbeat_emission_thread.join()
         self.reception_thread.join()
+        self.writer.stop(timeout=1)
 
     def handle_reception(self):
         """
         Method used to handle the reception of messages from the server.
         """
-        while not self.stop_threads:
-            try:
-                message_length_bytes = self.client_socket.recv(4)
-                message_length = int.from_bytes(message_length_bytes, byteorder="big")
-                message = self.client_socket.recv(message_length).decode()
-
-                if message:
-                    if message == "heartbeat":
-                        # TODO: handle heartbeat
-                        continue
-
-                    # TODO: refacto this piece of shit
-                    data = json.loads(json.loads(message))
-                    if "route" in data and "data" in data:
-                        self.ipc_node.send(data["route"], data["data"])
+        # Frames are read through a buffer, a burst of frames costs a single recv syscall
+        reader = frames.FrameReader(self.client_socket)
+        try:
+            for message in reader:
+                if self.stop_threads:
+                    break
+
+                try:
+                    frame = frames.decode(message)
+                except ValueError as e:
+                    # The length framing is intact, only this frame is lost
+                    self.logger.warning("Invalid frame skipped: {error}", self.NAME, fields={"error": e})
+                    continue
+
+                if frame.type == "heartbeat":
+                    # TODO: handle heartbeat
+                    continue
+
+                if frame.type == "hello":
+                    if self.encoder.negotiate(frame):
+                        self.logger.info("Using binary frames version {version}", self.NAME,
+                                         fields={"version": self.encoder.version})
+                    continue
+
+                if frame.type == "command":
+                    # Commands are traced from their reception to follow their latency through each hop
+                    with tracing.trace(self.ipc_node, f"communication:reception:{frame.data['route']}"):
+                        self.ipc_node.send(frame.data["route"], frame.data["data"])
 
-            except Exception as e:
-                self.logger.error(f"Reception error: {e}", self.NAME)
-                self.stop_threads = True
-                break
+        except Exception as e:
+            self.logger.error("Reception error: {error}", self.NAME, fields={"error": e})
+            self.stop_threads = True
 
     def handle_heartbeat_emission(self):
         """
@@ -196,12 +226,11 @@ class CommunicationComponent(component.Component):
         """
         while not self.stop_threads:
             try:
-                self.client_socket.send(len("heartbeat").to_bytes(4, byteorder="big"))
-                self.client_socket.send("heartbeat".encode())
+                self.send_frame(self.encoder.encode("heartbeat"))
 
                 time.sleep(self.time_between_heartbeats)
             except Exception as e:
-                self.logger.error(f"Heartbeat emission error: {e}", self.NAME)
+                self.logger.error("Heartbeat emission error: {error}", self.NAME, fields={"error": e})
                 self.stop_threads = True
 
     @ipc.Route([
@@ -218,7 +247,7 @@ class CommunicationComponent(component.Component):
         """
         Method used to handle the emission of messages to the server.
         """
-        if not self.client_socket or self.stop_threads:
+        if not self.writer or self.stop_threads:
             return
 
         try:
@@ -232,21 +261,47 @@ class CommunicationComponent(component.Component):
 
             if _channel.startswith("log"):
                 _channel = clear_route(_channel)
-                data = sanitize_log_data(data)
-
-            message = {
-                "type": _channel,
-                "data": data
-            }
+                messages = [self.encoder.encode(_channel, log) for log in sanitize_log_data(data)]
+            else:
+                messages = [self.encoder.encode(_channel, data)]
 
-            data = str(json.dumps(message))
-            self.client_socket.send(len(data).to_bytes(4, byteorder="big"))
-            self.client_socket.send(data.encode())
+            for message in messages:
+                self.send_frame(message)
 
         except Exception as e:
-            self.logger.error(f"Emission error: {e}", self.NAME)
+            self.logger.error("Emission error: {error}", self.NAME, fields={"error": e})
             self.stop_threads = True
 
+    def send_frame(self, frame: bytes):
+        """
+        Queue a frame to be sent to the server by the writer
+        :param frame: The encoded frame
+        """
+        self.writer.put(frame)
+
+    def handle_writer_error(self, error: Exception):
+        """
+        Method called by the writer thread when a send fails, the connection is closed to reconnect
+        """
+        self.logger.error("Emission error: {error}", self.NAME, fields={"error": error})
+        self.stop_threads = True
+        try:
+            # Unblock the reception thread
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    @ipc.Route(["communication:metrics"], True).decorator
+    def metrics(self, call_data: ipc.CallData, payload: dict):
+        """
+        Get the metrics of the link to the server, see :meth:`FrameWriter.metrics
+        <src.communication.messages.frames.FrameWriter.metrics>`
+        """
+        metrics = self.writer.metrics() if self.writer is not None else {}
+        metrics["connected"] = self.writer is not None and not self.stop_threads
+        metrics["version"] = self.encoder.version
+        return metrics
+
     def stop(self):
         self.alive = False
         self.stop_threads = True
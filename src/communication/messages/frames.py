@@ -0,0 +1,493 @@
+"""
+Frames exchanged with the base station, each frame is sent after its length as a 4 bytes big endian integer.
+
+Two formats coexist on the link, a frame is recognized by its first byte:
+ - legacy frames are text, "heartbeat" or JSON, the drone sends {"type", "data"} and the base station sends
+   {"route", "data"} encoded twice
+ - binary frames start with an 8 bytes header (version, type id, flags, sequence number) followed by a payload encoded
+   per type, the version byte is never a printable character so it can not be confused with a legacy frame
+
+The drone sends a legacy hello frame listing the binary versions it supports when it connects, and keeps sending legacy
+frames until the base station answers with a binary hello frame holding the chosen version. Base stations not knowing
+the binary format never answer, the link stays in legacy mode.
+"""
+import collections
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+import typing
+from dataclasses import dataclass
+
+
+#: The binary versions supported, the preferred one last
+SUPPORTED_VERSIONS = (1,)
+
+#: The length prefixing every frame
+LENGTH = struct.Struct("!I")
+#: The header of binary frames: version, type id, flags and sequence number
+HEADER = struct.Struct("!BHBI")
+
+#: Flag of payloads encoded as JSON instead of their compact encoding
+FLAG_JSON = 0x01
+
+#: The maximum frame length accepted, a larger length means the stream is corrupted
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+#: The legacy heartbeat frame
+LEGACY_HEARTBEAT = b"heartbeat"
+
+
+class FrameType:
+    """
+    Type ids of binary frames
+    """
+    HELLO = 0
+    HEARTBEAT = 1
+    #: A command from the base station, a route and its data
+    COMMAND = 2
+    #: A message to the base station, a type and its data
+    MESSAGE = 3
+    #: A log record
+    LOG = 4
+    #: The sense hat attitude and compass
+    SENSE_HAT = 5
+
+
+#: The type names of the frame types with a fixed type, the other messages are sent as MESSAGE frames
+TYPE_NAMES = {
+    FrameType.HELLO: "hello",
+    FrameType.HEARTBEAT: "heartbeat",
+    FrameType.COMMAND: "command",
+    FrameType.LOG: "log",
+    FrameType.SENSE_HAT: "sensors:sense_hat:data",
+}
+TYPE_IDS = {name: type_id for type_id, name in TYPE_NAMES.items()}
+
+#: The fields of the sense hat frames, sent as float32
+SENSE_HAT_FIELDS = ("roll", "pitch", "yaw", "compassX", "compassY", "compassZ")
+_SENSE_HAT = struct.Struct(f"!{len(SENSE_HAT_FIELDS)}f")
+#: The length prefixing routes and channels
+_LONG = struct.Struct("!H")
+
+
+@dataclass
+class Frame:
+    """
+    A decoded frame
+    """
+
+    #: The type name, e.g. "heartbeat", "command" or the channel of a message
+    type: str
+    #: The decoded data
+    data: typing.Any = None
+    #: The binary version, None for legacy frames
+    version: typing.Optional[int] = None
+    #: The sequence number, None for legacy frames
+    sequence: typing.Optional[int] = None
+
+
+def _json(data: typing.Any) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def _encode_payload(type_id: int, type_name: str, data: typing.Any) -> typing.Tuple[bytes, int]:
+    """
+    Encode the payload of a binary frame
+    :return: The payload and the flags
+    """
+    if type_id == FrameType.HELLO:
+        return bytes([len(data["versions"]), *data["versions"]]), 0
+    if type_id == FrameType.HEARTBEAT:
+        return b"", 0
+    if type_id == FrameType.SENSE_HAT:
+        try:
+            return _SENSE_HAT.pack(*(data[f] for f in SENSE_HAT_FIELDS)), 0
+        except (KeyError, TypeError, struct.error):
+            return _json(data), FLAG_JSON
+    if type_id == FrameType.COMMAND:
+        route = data["route"].encode()
+        return _LONG.pack(len(route)) + route + _json(data["data"]), FLAG_JSON
+    if type_id == FrameType.MESSAGE:
+        name = type_name.encode()
+        return _LONG.pack(len(name)) + name + _json(data), FLAG_JSON
+    return _json(data), FLAG_JSON
+
+
+def encode_binary(type_name: str, data: typing.Any, sequence: int, version: int = SUPPORTED_VERSIONS[-1]) -> bytes:
+    """
+    Encode a binary frame, without its length
+    :param type_name: The type name, the channel of a message
+    :param data: The data
+    :param sequence: The sequence number, wrapped to 32 bits
+    :param version: The binary version
+    """
+    type_id = TYPE_IDS.get(type_name, FrameType.MESSAGE)
+    payload, flags = _encode_payload(type_id, type_name, data)
+    return HEADER.pack(version, type_id, flags, sequence & 0xFFFFFFFF) + payload
+
+
+def encode_legacy(type_name: str, data: typing.Any) -> bytes:
+    """
+    Encode a legacy frame, without its length
+    :param type_name: The type name, the channel of a message
+    :param data: The data
+    """
+    if type_name == "heartbeat":
+        return LEGACY_HEARTBEAT
+    return json.dumps({"type": type_name, "data": data}).encode()
+
+
+def _split_prefixed(payload: memoryview) -> typing.Tuple[str, memoryview]:
+    """
+    Split a payload starting with a length prefixed string, a route or a channel
+    :param payload: The payload
+    :return: The string and the rest of the payload
+    :raises ValueError: If the payload is shorter than the string length
+    """
+    if len(payload) < _LONG.size:
+        raise ValueError(f"Truncated payload ({len(payload)} bytes), missing the string length")
+    (length,) = _LONG.unpack_from(payload)
+    end = _LONG.size + length
+    if end > len(payload):
+        raise ValueError(f"Truncated payload ({len(payload)} bytes), string of {length} bytes")
+    return bytes(payload[_LONG.size:end]).decode(), payload[end:]
+
+
+def decode(frame: typing.Union[bytes, bytearray, memoryview]) -> Frame:
+    """
+    Decode a frame, binary or legacy, without its length
+    :param frame: The frame
+    :raises ValueError: If the frame is invalid, truncated or of an unsupported version
+    """
+    if not frame:
+        raise ValueError("Empty frame")
+
+    version = frame[0]
+    if version not in SUPPORTED_VERSIONS:
+        # Legacy frames are text, their first byte is printable
+        if 0x20 <= version < 0x7F:
+            return _decode_legacy(bytes(frame))
+        raise ValueError(f"Unsupported frame version {version}")
+
+    if len(frame) < HEADER.size:
+        raise ValueError(f"Truncated frame header ({len(frame)} bytes)")
+    version, type_id, flags, sequence = HEADER.unpack_from(frame)
+    payload = memoryview(frame)[HEADER.size:]
+
+    if type_id == FrameType.HELLO:
+        if not payload or len(payload) < 1 + payload[0]:
+            raise ValueError(f"Truncated hello payload ({len(payload)} bytes)")
+        data = {"versions": list(payload[1:1 + payload[0]])}
+    elif type_id == FrameType.HEARTBEAT:
+        data = None
+    elif type_id == FrameType.COMMAND:
+        route, payload = _split_prefixed(payload)
+        data = {"route": route, "data": json.loads(bytes(payload))}
+    elif type_id == FrameType.MESSAGE:
+        name, payload = _split_prefixed(payload)
+        return Frame(name, json.loads(bytes(payload)), version, sequence)
+    elif type_id == FrameType.SENSE_HAT and not flags & FLAG_JSON:
+        if len(payload) != _SENSE_HAT.size:
+            raise ValueError(f"Invalid sense hat payload ({len(payload)} bytes, expected {_SENSE_HAT.size})")
+        data = dict(zip(SENSE_HAT_FIELDS, _SENSE_HAT.unpack(payload)))
+    elif type_id in TYPE_NAMES:
+        data = json.loads(bytes(payload))
+    else:
+        raise ValueError(f"Unknown frame type {type_id}")
+
+    return Frame(TYPE_NAMES[type_id], data, version, sequence)
+
+
+def _decode_legacy(frame: bytes) -> Frame:
+    """
+    Decode a legacy frame
+    """
+    if frame == LEGACY_HEARTBEAT:
+        return Frame("heartbeat")
+
+    data = json.loads(frame)
+    # Commands of the base station are encoded twice
+    if isinstance(data, str):
+        data = json.loads(data)
+
+    if isinstance(data, dict) and "route" in data:
+        return Frame("command", {"route": data["route"], "data": data.get("data")})
+    if isinstance(data, dict) and "type" in data:
+        return Frame(data["type"], data.get("data"))
+    raise ValueError("Invalid legacy frame, neither a command nor a message")
+
+
+class FrameEncoder:
+    """
+    Encode the frames sent on a connection, in the negotiated format
+    """
+
+    def __init__(self, version: typing.Optional[int] = None):
+        """
+        :param version: The binary version, None for legacy frames
+        """
+        self.version = version
+        self._sequence = itertools.count()
+
+    def negotiate(self, frame: Frame) -> bool:
+        """
+        Switch to the binary version chosen by the peer hello frame
+        :param frame: The hello frame of the peer
+        :return: Whether the version is supported, the format is unchanged otherwise
+        """
+        versions = [v for v in frame.data["versions"] if v in SUPPORTED_VERSIONS]
+        if not versions:
+            return False
+        self.version = max(versions)
+        return True
+
+    def hello(self) -> bytes:
+        """
+        Encode the hello frame sent on connection, always legacy so any base station can read it
+        """
+        return encode_legacy("hello", {"versions": list(SUPPORTED_VERSIONS)})
+
+    def encode(self, type_name: str, data: typing.Any = None) -> bytes:
+        """
+        Encode a frame, without its length
+        :param type_name: The type name, the channel of a message
+        :param data: The data
+        """
+        if self.version is None:
+            return encode_legacy(type_name, data)
+        # next on itertools.count is atomic, frames encoded by concurrent threads get distinct numbers
+        return encode_binary(type_name, data, next(self._sequence), self.version)
+
+
+class FrameReader:
+    """
+    Read the frames of a connection through a preallocated buffer, each recv_into call reads as many bytes as
+    available so a burst of frames costs a single syscall, and frames are handed out as memoryview slices of the
+    buffer without copy. Frames split across reads are kept until they are complete.
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int = 65536):
+        """
+        :param sock: The connected socket
+        :param buffer_size: The initial buffer size, the buffer grows to fit larger frames
+        """
+        self._socket = sock
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        #: The start of the first unread frame and the end of the received bytes in the buffer
+        self._start = 0
+        self._end = 0
+
+    def _compact(self, needed: int) -> None:
+        """
+        Move the partial frame to the start of the buffer and grow the buffer if it can not hold needed bytes
+        :param needed: The number of bytes the buffer must hold from the start of the partial frame
+        """
+        remaining = self._end - self._start
+        if self._start:
+            self._buffer[:remaining] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, remaining
+
+        if needed > len(self._buffer):
+            # The buffer can not be resized while a view of it exists
+            self._view.release()
+            self._buffer.extend(bytes(max(needed, 2 * len(self._buffer)) - len(self._buffer)))
+            self._view = memoryview(self._buffer)
+
+    def __iter__(self) -> typing.Iterator[memoryview]:
+        """
+        Iterate over the frames, without their length, until the connection is closed
+        A frame is only valid until the next one is requested, it must be decoded or copied first.
+        :raises ConnectionError: If the connection is closed
+        :raises ValueError: If a frame length is larger than MAX_FRAME_SIZE
+        """
+        while True:
+            # Hand out every complete frame received
+            while self._end - self._start >= LENGTH.size:
+                (length,) = LENGTH.unpack_from(self._buffer, self._start)
+                if length > MAX_FRAME_SIZE:
+                    raise ValueError(f"Frame length {length} larger than {MAX_FRAME_SIZE}")
+
+                end = self._start + LENGTH.size + length
+                if end > self._end:
+                    break
+
+                frame = self._view[self._start + LENGTH.size:end]
+                self._start = end
+                if length:
+                    yield frame
+                frame.release()
+
+            # Make room for the rest of the partial frame, at least its length
+            needed = LENGTH.size
+            if self._end - self._start >= LENGTH.size:
+                needed += LENGTH.unpack_from(self._buffer, self._start)[0]
+            if self._start == self._end:
+                self._start = self._end = 0
+            elif self._start + needed > len(self._buffer):
+                self._compact(needed)
+
+            received = self._socket.recv_into(self._view[self._end:])
+            if not received:
+                raise ConnectionError("Connection closed by the peer")
+            self._end += received
+
+
+class FrameWriter:
+    """
+    Send the frames of a connection from a single writer thread, frames are queued by any thread in a bounded queue
+    and the writer sends every queued frame with their lengths in a single gathered sendmsg call.
+    Frames queued while the queue is full are dropped and counted.
+    """
+
+    #: The maximum number of frames sent per call, each frame takes 2 buffers of the IOV_MAX (1024 on Linux) limit
+    MAX_BATCH = 256
+    #: The window in seconds the sent bytes rate is computed over
+    RATE_WINDOW = 5.0
+
+    def __init__(self, sock: socket.socket, max_queue: int = 1024,
+                 on_error: typing.Optional[typing.Callable[[Exception], None]] = None):
+        """
+        :param sock: The connected socket
+        :param max_queue: The maximum number of queued frames
+        :param on_error: Called from the writer thread when a send fails, the writer stops
+        """
+        self._socket = sock
+        self._max_queue = max_queue
+        self._on_error = on_error
+
+        #: The queued frames, without their length
+        self._queue = collections.deque()
+        #: Condition guarding the queue and the counters, notified when frames are queued
+        self._condition = threading.Condition()
+
+        #: The counters
+        self._sent_frames = 0
+        self._sent_bytes = 0
+        self._dropped = 0
+        #: The sent bytes counter over time, as (monotonic timestamp, sent bytes), to compute the rate
+        self._rate_samples = collections.deque([(time.monotonic(), 0)])
+
+        self._alive = True
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def put(self, frame: bytes) -> bool:
+        """
+        Queue a frame to be sent
+        :param frame: The encoded frame, without its length
+        :return: Whether the frame was queued, False if the queue is full or the writer stopped
+        """
+        with self._condition:
+            if not self._alive or len(self._queue) >= self._max_queue:
+                self._dropped += 1
+                return False
+
+            self._queue.append(frame)
+            self._condition.notify()
+            return True
+
+    def _send(self, batch: typing.List[bytes]) -> None:
+        """
+        Send a batch of frames with their lengths, in a single call unless the socket accepts only part of it
+        :param batch: The frames
+        """
+        buffers = []
+        for frame in batch:
+            buffers.append(LENGTH.pack(len(frame)))
+            buffers.append(frame)
+
+        if not hasattr(self._socket, "sendmsg"):
+            self._socket.sendall(b"".join(buffers))
+            return
+
+        while buffers:
+            sent = self._socket.sendmsg(buffers)
+            # Drop the sent buffers, and the sent part of the first one left
+            i = 0
+            while i < len(buffers) and sent >= len(buffers[i]):
+                sent -= len(buffers[i])
+                i += 1
+            buffers = buffers[i:]
+            if sent:
+                buffers[0] = memoryview(buffers[0])[sent:]
+
+    def _writer(self) -> None:
+        """
+        Send the queued frames until the writer is stopped or a send fails
+        """
+        while True:
+            with self._condition:
+                while self._alive and not self._queue:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.MAX_BATCH))]
+
+            try:
+                self._send(batch)
+            except Exception as e:
+                with self._condition:
+                    self._alive = False
+                    self._dropped += len(batch) + len(self._queue)
+                    self._queue.clear()
+                if self._on_error is not None:
+                    self._on_error(e)
+                return
+
+            with self._condition:
+                self._sent_frames += len(batch)
+                self._sent_bytes += sum(LENGTH.size + len(frame) for frame in batch)
+                now = time.monotonic()
+                self._rate_samples.append((now, self._sent_bytes))
+                self._prune_rate_samples(now)
+
+    def _prune_rate_samples(self, now: float) -> None:
+        """
+        Drop the rate samples older than the rate window, the last one before the window is kept as the rate reference
+        Called with the condition held, after every batch so the samples stay bounded when the metrics are never read.
+        :param now: The monotonic timestamp
+        """
+        since = now - self.RATE_WINDOW
+        while len(self._rate_samples) > 1 and self._rate_samples[1][0] <= since:
+            self._rate_samples.popleft()
+
+    def metrics(self) -> dict:
+        """
+        Get the writer metrics
+        :return: The metrics:
+            - "queue_depth": The number of queued frames
+            - "queue_size": The maximum number of queued frames
+            - "sent_frames": The number of sent frames
+            - "sent_bytes": The number of sent bytes, lengths included
+            - "dropped": The number of dropped frames
+            - "bytes_per_second": The sent bytes rate over the last RATE_WINDOW seconds
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._prune_rate_samples(now)
+            start, start_bytes = self._rate_samples[0]
+            window = min(self.RATE_WINDOW, now - start) or self.RATE_WINDOW
+
+            return {
+                "queue_depth": len(self._queue),
+                "queue_size": self._max_queue,
+                "sent_frames": self._sent_frames,
+                "sent_bytes": self._sent_bytes,
+                "dropped": self._dropped,
+                "bytes_per_second": (self._sent_bytes - start_bytes) / window,
+            }
+
+    def stop(self, timeout: typing.Optional[float] = None) -> None:
+        """
+        Stop the writer once the queued frames are sent
+        :param timeout: The time in seconds to wait for the queued frames to be sent
+        """
+        with self._condition:
+            self._alive = False
+            self._condition.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
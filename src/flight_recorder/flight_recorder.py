@@ -0,0 +1,392 @@
+import json
+import math
+import os
+import threading
+import time
+import typing
+from datetime import datetime
+
+import numpy as np
+
+import flight_recorder.telemetry as telemetry
+from utilities import component, ipc
+
+
+#: The name of the stream index file
+INDEX_FILE = "index.json"
+
+
+def stream_name(channel: str) -> str:
+    """
+    Get the name of the stream recording a channel, used as its directory name
+    :param channel: The channel
+    """
+    return channel.replace(":", ".")
+
+
+def flatten(payload: typing.Any) -> typing.Dict[str, float]:
+    """
+    Flatten a payload to its numeric fields, numeric sequences give one field per item and scalar payloads a "value"
+    field, the other fields are not recorded
+    :param payload: The payload
+    :return: The numeric fields by name
+    """
+    if not isinstance(payload, dict):
+        payload = {"value": payload}
+
+    fields = {}
+    for name, value in payload.items():
+        if isinstance(value, (bool, int, float)):
+            fields[name] = float(value)
+        elif isinstance(value, (list, tuple)) and all(isinstance(v, (bool, int, float)) for v in value):
+            for i, v in enumerate(value):
+                fields[f"{name}_{i}"] = float(v)
+    return fields
+
+
+def _type_name(values: typing.Iterable) -> str:
+    """
+    Get the name of the narrowest type of numeric values, bool, int or float
+    :param values: The values
+    """
+    values = list(values)
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    if all(isinstance(v, int) for v in values):
+        return "int"
+    return "float"
+
+
+def shape(payload: typing.Any) -> typing.Dict[str, list]:
+    """
+    Get the shape of a payload, used to rebuild payloads from recorded samples
+    :param payload: The payload
+    :return: The type name and the sequence length (None for scalars) of the recorded fields by payload key, a scalar
+        payload has a single "value" field
+    """
+    if not isinstance(payload, dict):
+        payload = {"value": payload}
+
+    fields = {}
+    for name, value in payload.items():
+        if isinstance(value, (bool, int, float)):
+            fields[name] = [_type_name([value]), None]
+        elif isinstance(value, (list, tuple)) and all(isinstance(v, (bool, int, float)) for v in value):
+            fields[name] = [_type_name(value) if value else "float", len(value)]
+    return fields
+
+
+#: The types of the recorded fields by name
+_TYPES = {"bool": bool, "int": int, "float": float}
+
+
+def unflatten(sample: np.void, payload_shape: typing.Dict[str, list], scalar: bool = False) -> typing.Any:
+    """
+    Rebuild a payload from a recorded sample, the inverse of flatten for the recorded fields
+    :param sample: The sample, a row of a stream
+    :param payload_shape: The payload shape recorded in the stream index
+    :param scalar: Whether the payload is a scalar, as recorded in the stream index
+    :return: The payload, NaN fields are not set
+    """
+    payload = {}
+    for name, (type_name, length) in payload_shape.items():
+        cast = _TYPES[type_name]
+        if length is None:
+            value = sample[name].item()
+            if not math.isnan(value):
+                payload[name] = cast(value)
+        else:
+            values = [sample[f"{name}_{i}"].item() for i in range(length)]
+            if not any(math.isnan(v) for v in values):
+                payload[name] = tuple(cast(v) for v in values)
+    return payload.get("value") if scalar else payload
+
+
+def latest_flight(directory: str) -> typing.Optional[str]:
+    """
+    Get the directory of the latest recorded flight
+    :param directory: The directory flights are recorded to
+    :return: The flight directory, None if there is no flight
+    """
+    if not os.path.isdir(directory):
+        return None
+    flights = sorted(name for name in os.listdir(directory) if name.startswith("flight-"))
+    return os.path.join(directory, flights[-1]) if flights else None
+
+
+def read_index(directory: str) -> dict:
+    """
+    Read the index of a stream
+    :param directory: The stream directory
+    """
+    with open(os.path.join(directory, INDEX_FILE), "r") as f:
+        return json.load(f)
+
+
+def load_stream(directory: str) -> np.ndarray:
+    """
+    Load the recorded samples of a stream, chunks are memory-mapped read only
+    :param directory: The stream directory
+    :return: The samples structured array, "t" is the reception timestamp followed by the payload fields
+    """
+    index = read_index(directory)
+    chunks = [
+        np.load(os.path.join(directory, chunk["file"]), mmap_mode="r")[:chunk["count"]]
+        for chunk in index["chunks"]
+        if chunk["count"] > 0
+    ]
+    if not chunks:
+        return np.empty(0, dtype=[(name, "<f8") for name in ["t"] + index["fields"]])
+    return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+class _Stream:
+    """
+    A recorded stream, samples are appended to preallocated memory-mapped chunks of a structured array
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        channel: str,
+        fields: typing.List[str],
+        payload_shape: typing.Dict[str, list],
+        scalar: bool,
+        chunk_samples: int,
+    ):
+        self.directory = directory
+        self.channel = channel
+        self.fields = fields
+        self.dtype = np.dtype([(name, "<f8") for name in ["t"] + fields])
+        self.chunk_samples = chunk_samples
+
+        #: The index, rewritten after every batch
+        self.index = {
+            "channel": channel,
+            "fields": fields,
+            "shape": payload_shape,
+            "scalar": scalar,
+            "chunk_samples": chunk_samples,
+            "chunks": [],
+        }
+        #: The current chunk, a writable memory map, and the number of samples written to it
+        self.chunk = None
+        self.count = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_chunk(self) -> None:
+        """
+        Close the current chunk and preallocate the next one
+        """
+        self.close()
+        name = f"{len(self.index['chunks']):05d}.npy"
+        self.chunk = np.lib.format.open_memmap(
+            os.path.join(self.directory, name), mode="w+", dtype=self.dtype, shape=(self.chunk_samples,)
+        )
+        self.count = 0
+        self.index["chunks"].append({"file": name, "count": 0, "start": None, "end": None})
+
+    def append(self, samples: typing.List[typing.Tuple[float, dict]]) -> None:
+        """
+        Append a batch of samples, fields missing from a sample are recorded as NaN and unknown fields are ignored
+        :param samples: The samples, as (reception timestamp, payload)
+        """
+        rows = np.empty(len(samples), dtype=self.dtype)
+        rows["t"] = [t for t, _ in samples]
+        flat = [flatten(payload) for _, payload in samples]
+        for name in self.fields:
+            rows[name] = [f.get(name, math.nan) for f in flat]
+
+        written = 0
+        while written < len(rows):
+            if self.chunk is None or self.count == self.chunk_samples:
+                self._open_chunk()
+
+            n = min(len(rows) - written, self.chunk_samples - self.count)
+            self.chunk[self.count:self.count + n] = rows[written:written + n]
+            self.count += n
+            written += n
+
+            entry = self.index["chunks"][-1]
+            entry["count"] = self.count
+            entry["start"] = float(self.chunk["t"][0])
+            entry["end"] = float(self.chunk["t"][self.count - 1])
+
+        self._write_index()
+
+    def _write_index(self) -> None:
+        """
+        Replace the index, written to a temporary file first so it is never partial
+        """
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.index, f)
+        os.replace(f"{path}.tmp", path)
+
+    def sync(self) -> None:
+        """
+        Sync the current chunk to the storage
+        """
+        if self.chunk is not None:
+            self.chunk.flush()
+
+    def close(self) -> None:
+        """
+        Sync and close the current chunk
+        """
+        if self.chunk is not None:
+            self.chunk.flush()
+            del self.chunk
+            self.chunk = None
+
+
+class FlightRecorderComponent(component.Component):
+    """
+    This component records the full rate sensor streams and the rc and propulsion setpoints to the on-board storage.
+    Each channel is a stream of samples appended to memory-mapped NumPy structured arrays, preallocated in chunks of
+    CHUNK_SAMPLES samples, with a small JSON index listing the chunks, their sample count and time range.
+    A sample holds the reception timestamp "t" and the numeric fields of the payload, fixed by the first sample, the
+    index also holds the payload shape so the replay component can rebuild the payloads.
+    Samples are queued by the route and written in batches by a writer thread, the chunks are synced at a bounded rate.
+    The recorded streams are queried with the telemetry:query route, decimated in worker processes, see
+    :mod:`src.flight_recorder.telemetry`.
+    """
+    NAME = "flight_recorder"
+
+    #: The directory flights are recorded to, one sub directory per flight
+    DIRECTORY = os.environ.get("NEMESIS_FLIGHT_DIR", "/app/flights")
+
+    #: The number of samples preallocated per chunk
+    CHUNK_SAMPLES = 65536
+    #: The time in seconds samples wait to be written
+    FLUSH_INTERVAL = 0.5
+    #: The minimum time in seconds between two syncs
+    SYNC_INTERVAL = 10.0
+
+    def __init__(self, ipc_node: ipc.IpcNode):
+        #: The samples received and not written yet by channel, as (reception timestamp, payload), set before the
+        #: routes are bound
+        self._pending: typing.Dict[str, typing.List[typing.Tuple[float, typing.Any]]] = {}
+        #: Lock guarding the pending samples
+        self._pending_lock = threading.Lock()
+
+        #: Lock guarding the streams
+        self._write_lock = threading.Lock()
+        #: The recorded streams by channel
+        self._streams: typing.Dict[str, _Stream] = {}
+        #: The directory of the current flight
+        self._flight_directory = os.path.join(self.DIRECTORY, f"flight-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        #: The monotonic timestamp of the last sync
+        self._last_sync = time.monotonic()
+
+        self._writer_alive = False
+        self._writer_event = threading.Event()
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+
+        super().__init__(ipc_node)
+
+    @ipc.Route(["sensors:*", "rc:channels", "propulsion:speed"], False).decorator
+    def record(self, call_data: ipc.CallData, payload: typing.Any):
+        """
+        Queue a sample to be written
+        """
+        # Status updates are not samples
+        if call_data.channel.endswith(":status"):
+            return
+
+        with self._pending_lock:
+            self._pending.setdefault(call_data.channel, []).append((time.time(), payload))
+
+    @staticmethod
+    @ipc.Route(["telemetry:query"], True, ordering_key=ipc.by_payload("channel"), executor="process").decorator
+    def query(self, call_data: ipc.CallData, payload: dict):
+        """
+        Query a recorded stream from start to end at a step, blocking route run in a worker process (self is None)
+        The latest flight is looked up in DIRECTORY as imported by the worker, from NEMESIS_FLIGHT_DIR. The queries of a
+        channel always run in the same worker, so they hit its cache of query results.
+        Payload:
+         - channel: The recorded channel
+         - flight (optional): The flight directory, defaults to the latest flight
+         - fields (optional): The queried fields, defaults to all the recorded fields
+         - start (optional): The range start timestamp, defaults to the first sample
+         - end (optional): The range end timestamp, defaults to the last sample
+         - step: The step in seconds
+         - method (optional): "minmax" (default) or "lttb"
+        :return: The decimated samples as NumPy arrays, see :meth:`src.flight_recorder.telemetry.query`
+        """
+        flight = payload.get("flight") or latest_flight(FlightRecorderComponent.DIRECTORY)
+        directory = os.path.join(flight, stream_name(payload["channel"])) if flight is not None else None
+        if directory is None or not os.path.isfile(os.path.join(directory, INDEX_FILE)):
+            raise ValueError(f"No recorded stream of {payload['channel']} in {flight}")
+
+        return telemetry.query(
+            directory,
+            payload.get("fields"),
+            payload.get("start"),
+            payload.get("end"),
+            payload["step"],
+            payload.get("method", "minmax"),
+        )
+
+    def _write_pending(self) -> None:
+        """
+        Write the pending samples, one batch per stream, a batch failing to be written is logged and dropped so the
+        other streams are still written
+        """
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+
+            for channel, samples in pending.items():
+                try:
+                    stream = self._streams.get(channel)
+                    if stream is None:
+                        stream = _Stream(
+                            os.path.join(self._flight_directory, stream_name(channel)),
+                            channel,
+                            list(flatten(samples[0][1])),
+                            shape(samples[0][1]),
+                            not isinstance(samples[0][1], dict),
+                            self.CHUNK_SAMPLES,
+                        )
+                        self._streams[channel] = stream
+                    stream.append(samples)
+                except Exception as e:
+                    self.logger.error(
+                        "Flight recorder failed to write {count} samples of {channel}: {error}",
+                        self.NAME,
+                        fields={"count": len(samples), "channel": channel, "error": e},
+                    )
+
+            if time.monotonic() - self._last_sync >= self.SYNC_INTERVAL:
+                for stream in self._streams.values():
+                    stream.sync()
+                self._last_sync = time.monotonic()
+
+    def _writer(self):
+        """
+        Write the pending samples every FLUSH_INTERVAL
+        """
+        while self._writer_alive:
+            self._writer_event.wait(self.FLUSH_INTERVAL)
+
+            # The writer must keep running for the rest of the flight, whatever the error
+            try:
+                self._write_pending()
+            except Exception as e:
+                self.logger.error("Flight recorder failed to write samples: {error}", self.NAME, fields={"error": e})
+
+    def start(self):
+        self._writer_alive = True
+        self._writer_thread.start()
+
+    def stop(self):
+        self._writer_alive = False
+        self._writer_event.set()
+        self._writer_thread.join()
+
+        self._write_pending()
+        with self._write_lock:
+            for stream in self._streams.values():
+                stream.close()
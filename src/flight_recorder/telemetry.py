@@ -0,0 +1,197 @@
+import functools
+import os
+import typing
+
+import numpy as np
+
+import flight_recorder.flight_recorder as flight_recorder
+
+
+#: The number of query results cached per process, the telemetry:query route runs the queries of a channel in the
+#: same worker process
+CACHE_SIZE = 128
+
+#: The decimation methods
+METHODS = ("minmax", "lttb")
+
+
+def load_range(directory: str, fields: typing.List[str], start: float, end: float) -> typing.Dict[str, np.ndarray]:
+    """
+    Load the samples of a stream within a time range, only the chunks overlapping it are read
+    :param directory: The stream directory
+    :param fields: The fields to load, "t" is always loaded
+    :param start: The range start timestamp
+    :param end: The range end timestamp
+    :return: The contiguous arrays by field
+    """
+    index = flight_recorder.read_index(directory)
+    columns = ["t"] + fields
+    parts = {name: [] for name in columns}
+    for chunk in index["chunks"]:
+        if chunk["count"] == 0 or chunk["end"] < start or chunk["start"] > end:
+            continue
+
+        samples = np.load(os.path.join(directory, chunk["file"]), mmap_mode="r")[:chunk["count"]]
+        t = samples["t"]
+        first, last = np.searchsorted(t, start, "left"), np.searchsorted(t, end, "right")
+        for name in columns:
+            parts[name].append(samples[name][first:last])
+
+    return {name: np.concatenate(p) if p else np.empty(0) for name, p in parts.items()}
+
+
+def minmax(t: np.ndarray, values: typing.Dict[str, np.ndarray], start: float, step: float) -> dict:
+    """
+    Decimate samples to the min, max and mean of each step, NaN values are ignored
+    :param t: The sorted timestamps
+    :param values: The values by field
+    :param start: The timestamp of the first step
+    :param step: The step in seconds
+    :return: The start timestamps and sample counts of the non empty steps, and the min, max and mean by field
+    """
+    buckets = np.floor((t - start) / step).astype(np.int64)
+    # Offsets of the non empty steps, samples are sorted so the steps are contiguous
+    offsets = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if len(t) else np.empty(0, dtype=np.int64)
+
+    result = {"t": start + buckets[offsets] * step, "count": np.diff(np.r_[offsets, len(t)]), "fields": {}}
+    for name, v in values.items():
+        if not len(t):
+            result["fields"][name] = {"min": v, "max": v, "mean": v}
+            continue
+
+        valid = ~np.isnan(v)
+        count = np.add.reduceat(valid, offsets)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result["fields"][name] = {
+                "min": np.fmin.reduceat(v, offsets),
+                "max": np.fmax.reduceat(v, offsets),
+                "mean": np.add.reduceat(np.where(valid, v, 0.0), offsets) / count,
+            }
+    return result
+
+
+def _lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Select the points to keep with the Largest-Triangle-Three-Buckets algorithm, for several series sharing timestamps
+    The bucket ranges and the next buckets averages are computed for all the buckets at once, only the selection of the
+    largest triangle, which depends on the previously selected point, loops over the buckets, for every series at once.
+    :param x: The sorted timestamps, more than threshold
+    :param y: The values of the series, one row per series, without NaN
+    :param threshold: The number of points to keep, at least 3
+    :return: The indices of the kept points, one row per series
+    """
+    n = len(x)
+    rows = np.arange(len(y))
+
+    # The first and last points are kept, the others are split in threshold - 2 buckets
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    sizes = np.diff(edges)
+    # The average of the next bucket of each bucket, the last point for the last bucket
+    next_x = np.r_[(np.add.reduceat(x[:-1], edges[:-1]) / sizes)[1:], x[-1]]
+    next_y = np.c_[(np.add.reduceat(y[:, :-1], edges[:-1], axis=1) / sizes)[:, 1:], y[:, -1]]
+
+    selected = np.empty((len(y), threshold), dtype=np.int64)
+    selected[:, 0], selected[:, -1] = 0, n - 1
+    a = selected[:, 0].copy()
+    for i in range(threshold - 2):
+        first, last = edges[i], edges[i + 1]
+        xa, ya = x[a], y[rows, a]
+        # Twice the triangle areas (a, b, next average) expanded to p * yb + q * xb + c, the constant factor does not
+        # change the largest one
+        p, q = xa - next_x[i], next_y[:, i] - ya
+        c = -p * ya - q * xa
+        areas = np.abs(p[:, None] * y[:, first:last] + q[:, None] * x[first:last] + c[:, None])
+        a = first + np.argmax(areas, axis=1)
+        selected[:, i + 1] = a
+    return selected
+
+
+def lttb(t: np.ndarray, values: typing.Dict[str, np.ndarray], threshold: int) -> typing.Dict[str, np.ndarray]:
+    """
+    Select the points to keep with the Largest-Triangle-Three-Buckets algorithm, NaN values are dropped first
+    The series without NaN values are decimated together.
+    :param t: The sorted timestamps
+    :param values: The values by field
+    :param threshold: The number of points to keep
+    :return: The indices of the kept points by field
+    """
+    kept = {}
+    complete = [name for name, v in values.items() if not np.isnan(v).any()]
+    if complete and 3 <= threshold < len(t):
+        for name, indices in zip(complete, _lttb(t, np.stack([values[name] for name in complete]), threshold)):
+            kept[name] = indices
+    else:
+        kept.update((name, np.arange(len(t))) for name in complete)
+
+    for name, v in values.items():
+        if name in kept:
+            continue
+        indices = np.flatnonzero(~np.isnan(v))
+        if 3 <= threshold < len(indices):
+            indices = indices[_lttb(t[indices], v[indices][None], threshold)[0]]
+        kept[name] = indices
+    return kept
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _query(
+    directory: str,
+    version: int,
+    fields: typing.Tuple[str, ...],
+    start: float,
+    end: float,
+    step: float,
+    method: str,
+) -> dict:
+    """
+    Run a query, cached per process
+    :param version: The number of recorded samples, so queries of a stream still recording are not served stale
+    """
+    columns = load_range(directory, list(fields), start, end)
+    t = columns.pop("t")
+
+    if method == "minmax":
+        return minmax(t, columns, start, step)
+
+    kept = lttb(t, columns, int(np.ceil((end - start) / step)))
+    return {"fields": {name: {"t": t[kept[name]], "value": v[kept[name]]} for name, v in columns.items()}}
+
+
+def query(
+    directory: str,
+    fields: typing.Optional[typing.List[str]],
+    start: typing.Optional[float],
+    end: typing.Optional[float],
+    step: float,
+    method: str = "minmax",
+) -> dict:
+    """
+    Query a recorded stream from start to end at a step
+    :param directory: The stream directory
+    :param fields: The queried fields, all of them if None
+    :param start: The range start timestamp, the first sample if None
+    :param end: The range end timestamp, the last sample if None
+    :param step: The step in seconds
+    :param method: The decimation method, "minmax" for the min, max and mean of each step, "lttb" to keep one point per
+        step with the Largest-Triangle-Three-Buckets algorithm
+    :return: The decimated samples, see minmax and lttb
+    :raises ValueError: If the method, the step or a field is invalid
+    """
+    if method not in METHODS:
+        raise ValueError(f"Invalid method '{method}', must be one of {METHODS}")
+    if step <= 0:
+        raise ValueError(f"Invalid step {step}, must be positive")
+
+    index = flight_recorder.read_index(directory)
+    fields = index["fields"] if fields is None else fields
+    unknown = set(fields) - set(index["fields"])
+    if unknown:
+        raise ValueError(f"Unknown fields {sorted(unknown)} of {index['channel']}")
+
+    chunks = [chunk for chunk in index["chunks"] if chunk["count"] > 0]
+    start = start if start is not None else (chunks[0]["start"] if chunks else 0.0)
+    end = end if end is not None else (chunks[-1]["end"] if chunks else 0.0)
+    version = sum(chunk["count"] for chunk in chunks)
+
+    return _query(directory, version, tuple(fields), float(start), float(end), float(step), method)
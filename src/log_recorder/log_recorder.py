@@ -0,0 +1,290 @@
+import gzip
+import json
+import os
+import threading
+import time
+import typing
+from datetime import datetime
+
+from utilities import component, ipc
+
+
+class LogRecorderComponent(component.Component):
+    """
+    This component records the logs published on the ipc to the on-board storage, so they can be retrieved after the
+    flight even if the base station was not connected.
+    Logs are appended in batches to rotating segment files, each batch is written as a gzip member so a segment is a
+    valid gzip file of JSON lines (readable with zcat). Each segment has an index file listing the offset, time range,
+    labels and levels of its batches, queries only decompress the batches they need.
+    Writes are batched and fsync is bounded to protect the SD card.
+    """
+    NAME = "log_recorder"
+
+    #: The directory segments are written to
+    DIRECTORY = os.environ.get("NEMESIS_LOG_DIR", "/app/logs")
+
+    #: The time in seconds logs wait to be written
+    FLUSH_INTERVAL = 1.0
+    #: The number of pending logs written right away
+    FLUSH_SIZE = 500
+    #: The minimum time in seconds between two fsync
+    FSYNC_INTERVAL = 10.0
+
+    #: The size in bytes a segment is rotated at
+    SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+    #: The age in seconds a segment is rotated at
+    SEGMENT_MAX_AGE = 3600
+    #: The number of segments kept, the oldest ones are deleted first
+    MAX_SEGMENTS = 100
+
+    #: The default maximum number of logs returned by a query
+    QUERY_LIMIT = 10000
+
+    def __init__(self, ipc_node: ipc.IpcNode):
+        #: The logs received and not written yet, set before the routes are bound
+        self._pending = []
+        #: Condition guarding the pending logs, notified when enough logs are pending
+        self._pending_condition = threading.Condition()
+
+        #: Lock guarding the current segment files
+        self._write_lock = threading.Lock()
+        #: The current segment and index files
+        self._segment = None
+        self._index = None
+        #: The monotonic timestamp the current segment was opened at
+        self._segment_opened = 0.0
+        #: The monotonic timestamp of the last fsync
+        self._last_fsync = 0.0
+
+        self._writer_alive = False
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+
+        super().__init__(ipc_node)
+
+    @ipc.Route(["log:INFO:*", "log:WARNING:*", "log:ERROR:*", "log:CRITICAL:*"], False).decorator
+    def record(self, call_data: ipc.CallData, payload: dict):
+        """
+        Queue a batch of logs to be written
+        """
+        with self._pending_condition:
+            self._pending.extend(payload["logs"])
+            if len(self._pending) >= self.FLUSH_SIZE:
+                self._pending_condition.notify()
+
+    @ipc.Route(["log_recorder:query"], True).decorator
+    def query(self, call_data: ipc.CallData, payload: dict):
+        """
+        Query the recorded logs, blocking or streamed route
+        Payload:
+         - start (optional): Only the logs from this timestamp
+         - end (optional): Only the logs until this timestamp
+         - labels (optional): Only the logs of these labels
+         - levels (optional): Only the logs of these levels
+         - limit (optional): The maximum number of logs returned, defaults to QUERY_LIMIT
+        :return: The logs as dicts, oldest first
+        """
+        self._write_pending()
+
+        start = payload.get("start", float("-inf"))
+        end = payload.get("end", float("inf"))
+        labels = set(payload["labels"]) if payload.get("labels") is not None else None
+        levels = set(payload["levels"]) if payload.get("levels") is not None else None
+        limit = payload.get("limit", self.QUERY_LIMIT)
+
+        count = 0
+        for path in self._segments():
+            for entry in self._read_index(path):
+                if entry["end"] < start or entry["start"] > end:
+                    continue
+                if labels is not None and labels.isdisjoint(entry["labels"]):
+                    continue
+                if levels is not None and levels.isdisjoint(entry["levels"]):
+                    continue
+
+                for log in self._read_batch(path, entry):
+                    if not start <= log["timestamp"] <= end:
+                        continue
+                    if (labels is not None and str(log["label"]) not in labels) or (
+                        levels is not None and log["level"] not in levels
+                    ):
+                        continue
+
+                    yield log
+                    count += 1
+                    if count >= limit:
+                        return
+
+    def _segments(self) -> typing.List[str]:
+        """
+        Get the segments paths, oldest first
+        """
+        if not os.path.isdir(self.DIRECTORY):
+            return []
+        return sorted(
+            os.path.join(self.DIRECTORY, name) for name in os.listdir(self.DIRECTORY) if name.endswith(".jsonl.gz")
+        )
+
+    @staticmethod
+    def _read_index(path: str) -> typing.List[dict]:
+        """
+        Read the index of a segment
+        :param path: The segment path
+        """
+        try:
+            with open(f"{path}.idx", "r") as f:
+                # The last line may be partial if the component was killed while writing it
+                return [json.loads(line) for line in f if line.endswith("\n")]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _read_batch(path: str, entry: dict) -> typing.List[dict]:
+        """
+        Read a batch of logs from a segment
+        :param path: The segment path
+        :param entry: The index entry of the batch
+        """
+        with open(path, "rb") as f:
+            f.seek(entry["offset"])
+            data = gzip.decompress(f.read(entry["length"]))
+        return [json.loads(line) for line in data.splitlines()]
+
+    def _rotate(self) -> None:
+        """
+        Close the current segment and open a new one, the oldest segments are deleted beyond MAX_SEGMENTS
+        """
+        self._close_segment()
+
+        os.makedirs(self.DIRECTORY, exist_ok=True)
+        path = os.path.join(self.DIRECTORY, f"logs-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}")
+        self._segment = open(f"{path}.jsonl.gz", "ab")
+        self._index = open(f"{path}.jsonl.gz.idx", "a")
+        self._segment_opened = time.monotonic()
+
+        for old in self._segments()[:-self.MAX_SEGMENTS]:
+            os.remove(old)
+            if os.path.exists(f"{old}.idx"):
+                os.remove(f"{old}.idx")
+
+    def _close_segment(self) -> None:
+        """
+        Sync and close the current segment
+        """
+        if self._segment is None:
+            return
+
+        self._fsync()
+        self._segment.close()
+        self._index.close()
+        self._segment = None
+        self._index = None
+
+    def _fsync(self) -> None:
+        """
+        Sync the current segment to the storage
+        """
+        os.fsync(self._segment.fileno())
+        os.fsync(self._index.fileno())
+        self._last_fsync = time.monotonic()
+
+    @staticmethod
+    def _to_record(log: typing.Any) -> dict:
+        """
+        Convert a log to the dict written to the segment
+        :param log: The log, a :class:`Log <utilities.logger.Log>`
+        :raises ValueError: If the log is malformed
+        """
+        if not hasattr(log, "to_dict"):
+            raise ValueError(f"Not a log: {log!r}")
+
+        record = log.to_dict()
+        if not all(isinstance(record.get(key), (int, float)) for key in ("timestamp", "first_timestamp")):
+            raise ValueError(f"Log without timestamps: {record!r}")
+        if not isinstance(record.get("level"), str) or "label" not in record:
+            raise ValueError(f"Log without level or label: {record!r}")
+        return record
+
+    def _write_pending(self) -> None:
+        """
+        Write the pending logs as a single batch, a gzip member in the segment and an entry in the index
+        Malformed logs are skipped so the rest of the batch is still written.
+        """
+        # Held while taking the pending logs too, so concurrent batches are written in order
+        with self._write_lock:
+            with self._pending_condition:
+                logs, self._pending = self._pending, []
+
+            records, lines = [], []
+            for log in logs:
+                try:
+                    record = self._to_record(log)
+                    lines.append(json.dumps(record) + "\n")
+                    records.append(record)
+                except (TypeError, ValueError) as e:
+                    # Printed only, a log would be recorded again
+                    print(f"Log recorder skipped a log: {e}", flush=True)
+            if not records:
+                return
+
+            member = gzip.compress("".join(lines).encode())
+
+            if (
+                self._segment is None
+                or self._segment.tell() >= self.SEGMENT_MAX_BYTES
+                or time.monotonic() - self._segment_opened >= self.SEGMENT_MAX_AGE
+            ):
+                self._rotate()
+
+            offset = self._segment.tell()
+            self._segment.write(member)
+            self._segment.flush()
+
+            # Written once the batch is, an index entry never points to missing data
+            self._index.write(
+                json.dumps(
+                    {
+                        "offset": offset,
+                        "length": len(member),
+                        "count": len(records),
+                        "start": min(r["first_timestamp"] for r in records),
+                        "end": max(r["timestamp"] for r in records),
+                        "labels": sorted({str(r["label"]) for r in records}),
+                        "levels": sorted({r["level"] for r in records}),
+                    }
+                )
+                + "\n"
+            )
+            self._index.flush()
+
+            if time.monotonic() - self._last_fsync >= self.FSYNC_INTERVAL:
+                self._fsync()
+
+    def _writer(self):
+        """
+        Write the pending logs every FLUSH_INTERVAL or as soon as FLUSH_SIZE logs are pending
+        """
+        while self._writer_alive:
+            with self._pending_condition:
+                if len(self._pending) < self.FLUSH_SIZE:
+                    self._pending_condition.wait(self.FLUSH_INTERVAL)
+
+            # The writer must keep running, the pending logs would grow without bound otherwise
+            try:
+                self._write_pending()
+            except Exception as e:
+                # Printed only, a log would be recorded again
+                print(f"Log recorder failed to write logs: {e}", flush=True)
+
+    def start(self):
+        self._writer_alive = True
+        self._writer_thread.start()
+
+    def stop(self):
+        self._writer_alive = False
+        with self._pending_condition:
+            self._pending_condition.notify()
+        self._writer_thread.join()
+
+        self._write_pending()
+        with self._write_lock:
+            self._close_segment()
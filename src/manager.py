@@ -1,11 +1,13 @@
+import json
 import multiprocessing
 import os
 import signal
 import threading
+import time
 import typing
 
 import redis
-from utilities import ipc, component as component_module, logger
+from utilities import ipc, component as component_module, logger, history
 
 import hello as hello
 import sim7600.sim7600 as sim7600
@@ -16,11 +18,23 @@ import propulsion.Propulsion as propulsion
 import rc.rc as rc
 import config.config as config
 import nvs.nvs as nvs
+import tracer.tracer as tracer
+import log_recorder.log_recorder as log_recorder
+import flight_recorder.flight_recorder as flight_recorder
+import replay.replay as replay
 
 
 #: The time in seconds to wait for the components to stop before killing them
 STOP_TIMOUT = 15
 
+#: The redis keys of the latest sensor and status values returned by the system snapshot, with the components states
+SNAPSHOT_KEYS = [
+    "sensors:sense_hat:data", "sensors:vl53:ranges", "sensors:sim7600:gnss", "rc:channels", "propulsion:armed",
+    "propulsion:speed", "sensors:sense_hat:status", "sensors:vl53:status", "sensors:sim7600:status", "rc:status"
+]
+#: The time in seconds a system snapshot is reused, so bursts of callers share a single fetch
+SNAPSHOT_CACHE_TIME = float(os.environ.get("NEMESIS_SNAPSHOT_CACHE_TIME", "0.005"))
+
 # ----------------------------------------------------------------------------------------------------------------------
 #                                             Components Configuration
 # ----------------------------------------------------------------------------------------------------------------------
@@ -36,6 +50,10 @@ components = {
     "propulsion": propulsion.PropulsionComponent,
     "rc": rc.RcComponent,
     "NVS": nvs.NVSComponent,
+    "tracer": tracer.TracerComponent,
+    "log_recorder": log_recorder.LogRecorderComponent,
+    "flight_recorder": flight_recorder.FlightRecorderComponent,
+    "replay": replay.ReplayComponent,
 }
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -43,7 +61,17 @@ components = {
 # ----------------------------------------------------------------------------------------------------------------------
 profiles = {
     # name: [list of components]
-    "default": ["communication", "config", "sim7600", "sense_hat", "vl53", "propulsion", "rc", "NVS"],
+    "default": [
+        "communication", "config", "sim7600", "sense_hat", "vl53", "propulsion", "rc", "NVS", "log_recorder",
+        "flight_recorder"
+    ],
+    # Run with NEMESIS_TRACING=1 to trace base station commands
+    "trace": [
+        "communication", "config", "sim7600", "sense_hat", "vl53", "propulsion", "rc", "NVS", "log_recorder",
+        "flight_recorder", "tracer"
+    ],
+    # Replays a recorded flight instead of running the sensors, see NEMESIS_REPLAY_FLIGHT
+    "replay": ["communication", "config", "log_recorder", "replay"],
     # "dev": ["test"],
 }
 
@@ -65,6 +93,12 @@ class Manager:
             typing.Dict)[str, typing.Dict[str, typing.Union[multiprocessing.Process, None, threading.Lock]]] = \
             {c: {"process": None, "lock": threading.Lock(), "timeout_lock": threading.Lock()} for c in components}
 
+        #: The last system snapshot and the monotonic timestamp it was fetched at
+        self._snapshot = None
+        self._snapshot_time = 0.0
+        #: Lock guarding the snapshot, held while fetching so concurrent callers wait for the same fetch
+        self._snapshot_lock = threading.Lock()
+
     def stop(self):
         """
         Stop the manager
@@ -97,12 +131,74 @@ class Manager:
             self._components[component]["process"].kill()
 
             # Force his state
-            self._ipc_node.redis.set(f"state:{component}", component_module.ComponentState.STOPPED)
-            self._ipc_node.send(f"state:{component}:{component_module.ComponentState.STOPPED}",
-                                {"component": component}, loopback=True)
+            self._ipc_node.publish_state(f"state:{component}",
+                                         f"state:{component}:{component_module.ComponentState.STOPPED}",
+                                         {"component": component}, value=component_module.ComponentState.STOPPED,
+                                         loopback=True)
             self._ipc_node.logger.info(f"component is {component_module.ComponentState.STOPPED}", component,
                                        "state")
 
+    def get_components_status(self, timeout: float = 1.0) -> typing.Dict[str, str]:
+        """
+        Get the state of every component in a single round trip, running components are asked through a
+        `component:status` gather request, the others are read from redis
+        :param timeout: The time in seconds to wait for the running components to answer
+        :return: The state of every component, one of :class:`ComponentState <component_module.ComponentState>`
+        """
+        states = self._ipc_node.redis.mget([f"state:{c}" for c in self._components])
+        status = {
+            c: s.decode() if s is not None else component_module.ComponentState.STOPPED
+            for c, s in zip(self._components, states)
+        }
+
+        running = [c for c in status if status[c] != component_module.ComponentState.STOPPED]
+        if not running:
+            return status
+
+        responses = self._ipc_node.gather("component:status", {}, timeout=timeout, expected=len(running))
+        status.update({c: r for c, r in responses.items() if c in status and isinstance(r, str)})
+
+        return status
+
+    @staticmethod
+    def _decode_value(value: typing.Optional[bytes]) -> typing.Any:
+        """
+        Decode a redis value, JSON values are loaded and the others are returned as strings
+        :param value: The redis value
+        :return: The decoded value, None if the key is not set or empty
+        """
+        if not value:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value.decode()
+
+    def get_system_snapshot(self) -> typing.Dict[str, typing.Any]:
+        """
+        Get the latest sensor and status values and the state of every component, fetched with a single MGET
+        The snapshot is reused for SNAPSHOT_CACHE_TIME seconds, concurrent callers wait for the same fetch
+        :return: The snapshot:
+            - "timestamp": The time the snapshot was fetched at
+            - "values": The decoded values by SNAPSHOT_KEYS key, None if not set
+            - "components": The state of every component
+        """
+        with self._snapshot_lock:
+            if self._snapshot is not None and time.monotonic() - self._snapshot_time < SNAPSHOT_CACHE_TIME:
+                return self._snapshot
+
+            values = self._ipc_node.redis.mget(SNAPSHOT_KEYS + [f"state:{c}" for c in self._components])
+            self._snapshot = {
+                "timestamp": time.time(),
+                "values": {k: self._decode_value(v) for k, v in zip(SNAPSHOT_KEYS, values)},
+                "components": {
+                    c: v.decode() if v is not None else component_module.ComponentState.STOPPED
+                    for c, v in zip(self._components, values[len(SNAPSHOT_KEYS):])
+                },
+            }
+            self._snapshot_time = time.monotonic()
+            return self._snapshot
+
     def _start_component(self, component: str):
         """
         Start a component
@@ -191,6 +287,27 @@ class Manager:
         self._components[payload["component"]]["timeout_lock"].release()
 
     # --- IPC Bindings ---
+    @ipc.Route(["manager:status"], True).decorator
+    def _status_route(self, call_data: ipc.CallData, payload: dict):
+        """
+        Get the state of every component
+        """
+        return self.get_components_status()
+
+    @ipc.Route(["system:snapshot"], True).decorator
+    def _snapshot_route(self, call_data: ipc.CallData, payload: dict):
+        """
+        Get the latest sensor and status values and the state of every component
+        """
+        return self.get_system_snapshot()
+
+    @ipc.Route(["sensors:history"], True).decorator
+    def _sensor_history_route(self, call_data: ipc.CallData, payload: dict):
+        """
+        Get the recent samples and aggregated windows of a sensor, read in a single round trip
+        """
+        return history.read(self._ipc_node.redis, payload["key"], payload.get("seconds"))
+
     @ipc.Route(["state:start:*"], True).decorator
     def _start_component_route(self, call_data: ipc.CallData, payload: dict):
         """
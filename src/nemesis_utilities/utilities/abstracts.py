@@ -11,6 +11,7 @@ class IIpcNode(abc.ABC):
     :attr:`logger` is the logger instance.
     :attr:`ipc_id` is the IPC ID.
     :meth:`send` sends a message to the IPC.
+    :meth:`listened` checks whether a node listens to a channel.
     """
 
     @property
@@ -48,3 +49,15 @@ class IIpcNode(abc.ABC):
         """
 
         raise NotImplementedError
+
+    @abc.abstractmethod
+    def listened(self, channel: str, loopback: bool = False) -> bool:
+        """Checks whether a node listens to a channel.
+
+        :param channel: The channel.
+        :param loopback: Whether the message is a loopback or not, the node itself only listens to loopbacks.
+
+        :return: True if a node listens to the channel, False otherwise.
+        """
+
+        raise NotImplementedError
@@ -83,6 +83,9 @@ class Component:
         #: The ipc route to stop the component
         self._stop_component = ipc.Route([f"state:{self.NAME}:stop"], False).decorator(Component._stop_component)
 
+        #: The ipc route answering component status gather requests
+        self._status_component = ipc.Route(["component:status"], False).decorator(Component._status_component)
+
         # Route binding and ipc node start
         self._ipc_node.bind_routes(self)
         self._ipc_node.start()
@@ -114,9 +117,10 @@ class Component:
         # Local update
         self._state = state
 
-        # Redis update
-        self._ipc_node.redis.set(f"state:{self.NAME}", state)
-        self._ipc_node.send(f"state:{self.NAME}:{state}", {"component": self.NAME})
+        # Redis update, the state key and the state message are written at once
+        self._ipc_node.publish_state(
+            f"state:{self.NAME}", f"state:{self.NAME}:{state}", {"component": self.NAME}, value=state
+        )
         self._ipc_node.logger.info(f"component is {state}", self.NAME, "state")
 
     def _set_starting(self) -> None:
@@ -152,6 +156,16 @@ class Component:
         self.stop()
         self._set_stopped()
 
+    def _status_component(self, call_data, payload) -> str:
+        """Get the current local state of the component, answers `component:status` gather requests
+
+        :param call_data: The call data of the call
+        :param payload: The payload of the call
+
+        :return: The state of the component, one of :class:`ComponentState`
+        """
+        return self._state
+
     def start(self) -> None:
         """Do some stuff when starting the component"""
         raise NotImplementedError()
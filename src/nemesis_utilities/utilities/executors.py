@@ -0,0 +1,179 @@
+"""Executors running IPC route calls outside of the listener thread.
+
+:class:`KeyedExecutor` runs tasks in a thread pool, in order for tasks sharing the same key.
+
+:class:`ProcessExecutor` runs route handlers in a warm process pool.
+"""
+import collections
+import concurrent.futures
+import functools
+import importlib
+import inspect
+import multiprocessing
+import threading
+import typing
+
+
+class KeyedExecutor:
+    """Run tasks in a thread pool, tasks submitted with the same key run one after the other in submission order while
+    tasks with different keys run in parallel.
+
+    Each key with pending tasks is drained by a single pool worker, a key never occupies more than one worker.
+
+    :meth:`submit` Submit a task.
+    :meth:`shutdown` Shutdown the executor.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        """Create a new keyed executor.
+
+        :param max_workers: The maximum number of keys running in parallel.
+        :param thread_name_prefix: The workers thread name prefix.
+        """
+        #: The thread pool draining the keys queues.
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix)
+
+        #: The pending tasks by key, a key is present while a worker drains it.
+        self._queues: typing.Dict[typing.Hashable, typing.Deque[typing.Tuple[typing.Callable, tuple]]] = {}
+
+        #: Lock guarding the queues.
+        self._lock = threading.Lock()
+
+    def submit(self, key: typing.Hashable, function: typing.Callable, *args) -> None:
+        """Submit a task, it will run after the tasks previously submitted with the same key.
+
+        :param key: The ordering key.
+        :param function: The function to call.
+        :param args: The function arguments.
+        """
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append((function, args))
+                return
+
+            self._queues[key] = collections.deque([(function, args)])
+        self._pool.submit(self._drain, key)
+
+    def _drain(self, key: typing.Hashable) -> None:
+        """Run the tasks of a key until its queue is empty.
+
+        :param key: The ordering key.
+        """
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                function, args = queue.popleft()
+
+            try:
+                function(*args)
+            except Exception:
+                # Tasks report their own errors, the remaining tasks of the key must still run.
+                pass
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shutdown the executor, the pending tasks still run.
+
+        :param wait: Whether to wait for the pending tasks to complete.
+        """
+        self._pool.shutdown(wait)
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve(module: str, qualname: str) -> typing.Callable:
+    """Resolve a route handler in a worker process.
+
+    :param module: The handler module name.
+    :param qualname: The handler qualified name.
+
+    :return: The wrapped function of the route.
+    """
+    obj = importlib.import_module(module)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+
+    # Decorated methods are replaced by the route dead wrapper, holding the route and the wrapped function.
+    return obj.route._wrapped_function if hasattr(obj, "route") else obj
+
+
+def _warm(module: str) -> None:
+    """Import the handler module in a worker process, so the first calls do not pay for it.
+
+    :param module: The handler module name.
+    """
+    importlib.import_module(module)
+
+
+def _call(module: str, qualname: str, call_data) -> typing.Any:
+    """Call a route handler in a worker process, without instance.
+
+    :param module: The handler module name.
+    :param qualname: The handler qualified name.
+    :param call_data: The call data.
+
+    :return: The handler return value, generators are consumed into a list.
+    """
+    r = _resolve(module, qualname)(None, call_data, call_data.payload)
+    return list(r) if inspect.isgenerator(r) else r
+
+
+class ProcessExecutor:
+    """Run route handlers in a pool of worker processes, away from the GIL of the node process.
+
+    Handlers are resolved in the workers by module and qualified name, they must be defined at module level (or as a
+    static method of a module level class) and are called with `self` set to None, so they can not use the instance
+    state. The call data and the return value must be picklable.
+
+    The workers are started with the "spawn" method: the node process already runs threads (listener, logger flusher,
+    loopback dispatcher) and forking it could copy a lock held by one of them into the workers. A spawned worker
+    imports the handler module afresh, so class attributes changed at runtime in the node process are not seen.
+
+    Keyed executors give each worker its own queue and submit the calls of a key to the same worker, in order, so the
+    state a handler keeps per process (e.g. a cache) is reused by the next calls of the key.
+
+    :meth:`submit` Submit a handler call.
+    :meth:`shutdown` Shutdown the executor.
+    """
+
+    def __init__(self, function: typing.Callable, max_workers: int, keyed: bool = False):
+        """Create a new process executor and start its workers.
+
+        :param function: The route handler.
+        :param max_workers: The number of worker processes.
+        :param keyed: Whether the calls are submitted with a key, run by the worker the key is assigned to.
+        """
+        #: The handler module name.
+        self._module = function.__module__
+        #: The handler qualified name.
+        self._qualname = function.__qualname__
+
+        #: The worker processes pools, one pool of max_workers or one pool per worker when keyed.
+        sizes = [1] * max_workers if keyed else [max_workers]
+        context = multiprocessing.get_context("spawn")
+        self._pools = [concurrent.futures.ProcessPoolExecutor(size, context) for size in sizes]
+
+        # Start every worker now, not on the first calls.
+        for future in [pool.submit(_warm, self._module) for pool, size in zip(self._pools, sizes) for _ in range(size)]:
+            future.result()
+
+    def submit(self, call_data, key: typing.Hashable = None) -> concurrent.futures.Future:
+        """Submit a handler call.
+
+        :param call_data: The call data.
+        :param key: The call key of a keyed executor, calls with the same key run in the same worker.
+
+        :return: The future of the handler return value.
+        """
+        pool = self._pools[hash(key) % len(self._pools)]
+        return pool.submit(_call, self._module, self._qualname, call_data)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shutdown the executor, the pending calls are cancelled.
+
+        :param wait: Whether to wait for the running calls to complete.
+        """
+        for pool in self._pools:
+            pool.shutdown(wait, cancel_futures=True)
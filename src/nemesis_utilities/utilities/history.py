@@ -0,0 +1,193 @@
+"""Bounded sensor histories kept in redis, so late joiners can fetch the recent samples of a sensor in one call.
+
+A history is written in the same pipeline as the sensor state, see :meth:`IpcNode.publish_state
+<utilities.ipc.IpcNode.publish_state>`. The samples are packed as float32 fields after a float64 timestamp in a capped
+redis list, newest first, and the min, max and mean of the fields are aggregated over fixed time windows, also kept in a
+capped redis list.
+
+:class:`SensorHistory` bounded history of a sensor.
+
+:meth:`read` read the history of a sensor.
+"""
+import collections
+import json
+import math
+import os
+import struct
+import threading
+import time
+import typing
+
+import redis
+
+
+#: The number of samples kept by the sensor histories, the histories are disabled if 0.
+HISTORY_SIZE = int(os.environ.get("NEMESIS_SENSOR_HISTORY", "0"))
+
+#: Whether the sensor histories are enabled.
+ENABLED = HISTORY_SIZE > 0
+
+
+def _keys(key: str) -> typing.Tuple[str, str, str]:
+    """Get the redis keys of a history.
+
+    :param key: The sensor state key.
+
+    :return: The keys of the history metadata, samples and windows.
+    """
+    return f"history:{key}", f"history:{key}:samples", f"history:{key}:windows"
+
+
+class SensorHistory:
+    """Bounded history of a sensor, samples are buffered by :meth:`append` and written by :meth:`write`.
+
+    :attr:`key` The sensor state key.
+    :attr:`fields` The recorded numeric fields of the payloads.
+    :attr:`size` The maximum number of samples kept.
+    :attr:`window` The aggregation window in seconds.
+    :attr:`windows` The maximum number of aggregated windows kept.
+
+    :meth:`append` Buffer a sample.
+    :meth:`write` Queue the buffered samples and the closed windows in a redis pipeline.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        fields: typing.List[str],
+        size: int = HISTORY_SIZE,
+        window: float = 1.0,
+        windows: int = 60,
+    ):
+        """Create a new sensor history.
+
+        :param key: The sensor state key.
+        :param fields: The recorded numeric fields of the payloads, missing or non-numeric fields are recorded as NaN.
+        :param size: The maximum number of samples kept, defaults to :data:`HISTORY_SIZE`.
+        :param window: The aggregation window in seconds, defaults to 1.
+        :param windows: The maximum number of aggregated windows kept, defaults to 60.
+        """
+        self.key = key
+        self.fields = list(fields)
+        self.size = size
+        self.window = window
+        self.windows = windows
+
+        self._meta_key, self._samples_key, self._windows_key = _keys(key)
+        self._meta = json.dumps({"fields": self.fields, "window": window})
+        self._struct = struct.Struct(f"<d{len(self.fields)}f")
+
+        #: Lock guarding the buffers and the current window.
+        self._lock = threading.Lock()
+        #: The packed samples not written yet, the oldest ones are dropped beyond the history size.
+        self._samples = collections.deque(maxlen=size)
+        #: The closed windows not written yet, as JSON.
+        self._closed = collections.deque(maxlen=windows)
+
+        #: The current window start and its running count, min, max and sum by field.
+        self._window_start = None
+        self._count = [0] * len(self.fields)
+        self._min = [math.inf] * len(self.fields)
+        self._max = [-math.inf] * len(self.fields)
+        self._sum = [0.0] * len(self.fields)
+
+    def _close_window(self) -> None:
+        """Close the current window, it is buffered to be written if it has samples."""
+        if any(self._count):
+            self._closed.append(
+                json.dumps(
+                    {
+                        "start": self._window_start,
+                        "end": self._window_start + self.window,
+                        "count": max(self._count),
+                        "min": {f: self._min[i] for i, f in enumerate(self.fields) if self._count[i]},
+                        "max": {f: self._max[i] for i, f in enumerate(self.fields) if self._count[i]},
+                        "mean": {f: self._sum[i] / self._count[i] for i, f in enumerate(self.fields) if self._count[i]},
+                    }
+                )
+            )
+
+        n = len(self.fields)
+        self._count, self._min, self._max, self._sum = [0] * n, [math.inf] * n, [-math.inf] * n, [0.0] * n
+
+    def append(self, payload: dict, timestamp: typing.Union[float, None] = None) -> None:
+        """Buffer a sample and aggregate it in the current window.
+
+        :param payload: The sensor payload.
+        :param timestamp: The sample timestamp, defaults to the current time.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        values = [payload.get(f) for f in self.fields]
+        values = [float(v) if isinstance(v, (int, float)) else math.nan for v in values]
+
+        with self._lock:
+            start = math.floor(timestamp / self.window) * self.window
+            if self._window_start != start:
+                self._close_window()
+                self._window_start = start
+
+            for i, v in enumerate(values):
+                if not math.isnan(v):
+                    self._count[i] += 1
+                    self._min[i] = min(self._min[i], v)
+                    self._max[i] = max(self._max[i], v)
+                    self._sum[i] += v
+
+            self._samples.append(self._struct.pack(timestamp, *values))
+
+    def write(self, pipeline: redis.client.Pipeline) -> None:
+        """Queue the buffered samples and the closed windows in a redis pipeline.
+
+        :param pipeline: The pipeline, executed by the caller.
+        """
+        with self._lock:
+            samples, self._samples = self._samples, collections.deque(maxlen=self.size)
+            closed, self._closed = self._closed, collections.deque(maxlen=self.windows)
+
+        pipeline.set(self._meta_key, self._meta)
+        if samples:
+            pipeline.lpush(self._samples_key, *samples)
+            pipeline.ltrim(self._samples_key, 0, self.size - 1)
+        if closed:
+            pipeline.lpush(self._windows_key, *closed)
+            pipeline.ltrim(self._windows_key, 0, self.windows - 1)
+
+
+def read(_redis: redis.Redis, key: str, seconds: typing.Union[float, None] = None) -> typing.Union[dict, None]:
+    """Read the history of a sensor in a single round trip.
+
+    :param _redis: The redis instance to use.
+    :param key: The sensor state key.
+    :param seconds: Only the samples and windows of the last seconds, defaults to all of them.
+
+    :return: The history as a dict, None if the sensor has no history:
+        - "fields": The recorded fields.
+        - "window": The aggregation window in seconds.
+        - "samples": The samples as dicts of the timestamp and the fields, oldest first, NaN fields are not set.
+        - "windows": The closed windows as dicts of the start, end, count, min, max and mean by field, oldest first.
+    """
+    meta_key, samples_key, windows_key = _keys(key)
+
+    pipeline = _redis.pipeline(transaction=True)
+    pipeline.get(meta_key)
+    pipeline.lrange(samples_key, 0, -1)
+    pipeline.lrange(windows_key, 0, -1)
+    meta, samples, windows = pipeline.execute()
+    if meta is None:
+        return None
+
+    meta = json.loads(meta)
+    fields = meta["fields"]
+    since = time.time() - seconds if seconds is not None else -math.inf
+
+    history = []
+    for sample in struct.iter_unpack(f"<d{len(fields)}f", b"".join(reversed(samples))):
+        if sample[0] >= since:
+            history.append({"timestamp": sample[0], **{f: v for f, v in zip(fields, sample[1:]) if not math.isnan(v)}})
+
+    return {
+        "fields": fields,
+        "window": meta["window"],
+        "samples": history,
+        "windows": [w for w in (json.loads(w) for w in reversed(windows)) if w["end"] > since],
+    }
@@ -5,26 +5,54 @@ using regular expressions and implemented with a simple decorator.
 
 :class:`CallData` represents the data of an IPC function call.
 
+:class:`IpcStream` iterates over the chunks of a streamed response.
+
 :class:`Route` represents an IPC route used to route IPC function calls.
 
+:meth:`by_channel` ordering key of route calls by channel.
+:meth:`by_payload` ordering key of route calls by payload field.
+
 :class:`IpcNode` represents an IPC node used to communicate with other IPC nodes through redis pub/sub.
 """
+import collections.abc
+import contextlib
 import inspect
+import json
 import pickle
+import queue
 import re
+import struct
 import threading
-import traceback
+import time
 import typing
 import uuid
+from concurrent import futures
 
 import redis
 
-from utilities import abstracts
+from utilities import abstracts, executors
+from utilities import history as hs
 from utilities import logger as lg
+from utilities import tracing
 
 
 VERBOSE_PAYLOAD_LOGGING = False
 
+#: The pickle protocol used to serialize call data, protocol 5 allows out-of-band buffers.
+PICKLE_PROTOCOL = 5
+
+# Call data serialized with out-of-band buffers starts with this magic, never the start of a pickle stream, followed
+# by the frames count and the length of each frame.
+_OOB_MAGIC = b"NOB5"
+_OOB_HEADER = struct.Struct("!4sI")
+_OOB_LENGTH = struct.Struct("!Q")
+
+#: The redis hash the IPC nodes advertise their routes regexes in, by node id, also the channel changes are notified on.
+ROUTES_REGISTRY = "ipc:routes"
+
+#: The time in seconds a stream responder waits for the requester to grant credits before giving up.
+STREAM_CREDIT_TIMEOUT = 30.0
+
 
 class IpcTimeoutError(Exception):
     """Raised when a blocking call times out."""
@@ -44,6 +72,9 @@ class CallData:
     function returns.
     :attr:`blocking_response_channel` The channel to send the blocking response on if applicable.
     :attr:`blocking` Whether the call is blocking or not.
+    :attr:`stream_credit` The initial credit granted to the responder if the call is a stream request.
+    :attr:`stream` Whether the call is a stream request or not.
+    :attr:`trace` The trace context if the call is part of a trace.
 
     :meth:`dumps` Serialize the calldata into bytes.
     :meth:`loads` Deserialize the calldata from bytes.
@@ -58,6 +89,8 @@ class CallData:
         payload: dict,
         concurrent: bool = None,
         blocking_response_channel: typing.Union[str, None] = None,
+        stream_credit: typing.Union[int, None] = None,
+        trace: typing.Union[tracing.TraceContext, None] = None,
     ):
         """Create a new calldata.
 
@@ -69,6 +102,9 @@ class CallData:
         thread. If set to False, will run the function in the listener thread, the listener will be blocked until
         the function returns.
         :param blocking_response_channel: The channel to send the blocking response on if applicable, defaults to None.
+        :param stream_credit: The initial credit, in chunks, granted to the responder if the call is a stream request,
+            defaults to None.
+        :param trace: The trace context if the call is part of a trace, defaults to None.
         """
 
         # Fields are accessed through the properties to ensure immutability.
@@ -78,6 +114,8 @@ class CallData:
         self._payload = payload
         self._concurrent = concurrent
         self._blocking_response_channel = blocking_response_channel
+        self._stream_credit = stream_credit
+        self._trace = trace
 
     @property
     def channel(self) -> str:
@@ -116,12 +154,31 @@ class CallData:
         """Whether the call is blocking or not."""
         return self._blocking_response_channel is not None
 
+    @property
+    def stream_credit(self) -> typing.Union[int, None]:
+        """The initial credit, in chunks, granted to the responder if the call is a stream request."""
+        return self._stream_credit
+
+    @property
+    def stream(self) -> bool:
+        """Whether the call is a stream request or not."""
+        return self._blocking_response_channel is not None and self._stream_credit is not None
+
+    @property
+    def trace(self) -> typing.Union[tracing.TraceContext, None]:
+        """The trace context if the call is part of a trace."""
+        return self._trace
+
     def dumps(self) -> bytes:
         """Serialize the calldata into bytes through pickle.
 
+        Pickle protocol 5 is used, buffers supporting it (e.g. contiguous NumPy arrays) are written out-of-band as
+        separate frames after the pickle stream instead of being copied into it, see :meth:`loads`.
+
         :return: The serialized calldata as bytes.
         """
-        return pickle.dumps(
+        buffers: typing.List[pickle.PickleBuffer] = []
+        data = pickle.dumps(
             {
                 "channel": self._channel,
                 "sender": self._sender,
@@ -129,19 +186,57 @@ class CallData:
                 "payload": self._payload,
                 "concurrent": self._concurrent,
                 "blocking_response_channel": self._blocking_response_channel,
-            }
+                "stream_credit": self._stream_credit,
+                "trace": self._trace.dumps() if self._trace is not None else None,
+            },
+            protocol=PICKLE_PROTOCOL,
+            buffer_callback=buffers.append,
         )
 
+        if not buffers:
+            return data
+
+        frames = [memoryview(data)] + [b.raw() for b in buffers]
+        header = _OOB_HEADER.pack(_OOB_MAGIC, len(frames)) + b"".join(_OOB_LENGTH.pack(f.nbytes) for f in frames)
+        return b"".join([header, *frames])
+
+    @staticmethod
+    def _split_frames(data: bytes) -> typing.List[memoryview]:
+        """Split calldata serialized with out-of-band buffers into frames, without copying them.
+
+        :param data: The serialized calldata as bytes.
+
+        :return: The pickle stream frame followed by the out-of-band buffers frames.
+        """
+        view = memoryview(data)
+        _, count = _OOB_HEADER.unpack_from(view)
+
+        offset = _OOB_HEADER.size + count * _OOB_LENGTH.size
+        frames = []
+        for i in range(count):
+            (length,) = _OOB_LENGTH.unpack_from(view, _OOB_HEADER.size + i * _OOB_LENGTH.size)
+            end = offset + length
+            frames.append(view[offset:end])
+            offset = end
+
+        return frames
+
     @staticmethod
     def loads(data: bytes) -> "CallData":
         """Deserialize the calldata from bytes through pickle.
 
+        Out-of-band buffers are rebuilt as views on the received bytes, NumPy arrays are therefore read-only.
+
         :param data: The serialized calldata as bytes.
 
         :return: The deserialized calldata as a :class:`CallData` instance.
         """
 
-        data = pickle.loads(data)
+        if data[: len(_OOB_MAGIC)] == _OOB_MAGIC:
+            frames = CallData._split_frames(data)
+            data = pickle.loads(frames[0], buffers=frames[1:])
+        else:
+            data = pickle.loads(data)
 
         return CallData(
             channel=data["channel"],
@@ -150,15 +245,142 @@ class CallData:
             payload=data["payload"],
             concurrent=data["concurrent"],
             blocking_response_channel=data["blocking_response_channel"],
+            stream_credit=data.get("stream_credit"),
+            trace=tracing.TraceContext.loads(data.get("trace")),
         )
 
     def __str__(self):
         return (
             f"CallData(channel={self._channel}, sender={self._sender}, loopback={self._loopback}, "
             f"payload={self._payload}, concurrent={self._concurrent}, "
-            f"blocking_response_channel={self._blocking_response_channel})"
+            f"blocking_response_channel={self._blocking_response_channel}, stream_credit={self._stream_credit}, "
+            f"trace={self._trace})"
+        )
+
+
+class IpcStream:
+    """Iterator over the chunks of a streamed response, see :meth:`IpcNode.send_stream`.
+
+    Flow control is credit based, the responder never sends more chunks than the credits granted by the requester, so
+    at most `credit` chunks are buffered. Credits are granted back as chunks are consumed.
+
+    :meth:`cancel` Cancel the stream, the responder stops producing chunks.
+    """
+
+    def __init__(self, ipc_node: "IpcNode", call_data: CallData, timeout: float):
+        """Create a new stream.
+
+        :param ipc_node: The requester :class:`IpcNode` instance.
+        :param call_data: The stream request call data.
+        :param timeout: The time in seconds to wait for each chunk.
+        """
+        self._ipc_node = ipc_node
+        self._call_data = call_data
+        self._timeout = timeout
+
+        #: Received messages, bounded by the granted credits.
+        self._messages = queue.Queue()
+
+        #: Consumed chunks not granted back yet, credits are granted back by batches of half the initial credit.
+        self._consumed = 0
+        self._grant_batch = max(1, call_data.stream_credit // 2)
+
+        self._done = False
+
+    @property
+    def credit_channel(self) -> str:
+        """The channel credits and cancellation are sent on."""
+        return f"{self._call_data.blocking_response_channel}:credit"
+
+    def push(self, payload: dict) -> None:
+        """Push a received message, called by the listener thread.
+
+        :param payload: The message payload.
+        """
+        self._messages.put(payload)
+
+    def _close(self) -> None:
+        """Close the stream and unregister it from the node."""
+        self._done = True
+        self._ipc_node.close_stream(self._call_data)
+
+    def _grant(self, credit: int) -> None:
+        """Grant credits to the responder.
+
+        :param credit: The number of chunks the responder is allowed to send.
+        """
+        self._ipc_node.send(
+            self.credit_channel, {"credit": credit}, loopback=self._call_data.loopback, _nolog=True, _force=True
+        )
+
+    def cancel(self) -> None:
+        """Cancel the stream, the responder stops producing chunks."""
+        if self._done:
+            return
+
+        self._close()
+        self._ipc_node.send(
+            self.credit_channel, {"cancel": True}, loopback=self._call_data.loopback, _nolog=True, _force=True
         )
 
+    def __iter__(self) -> "IpcStream":
+        return self
+
+    def __next__(self) -> typing.Any:
+        if self._done:
+            raise StopIteration
+
+        try:
+            message = self._messages.get(timeout=self._timeout)
+        except queue.Empty:
+            self.cancel()
+            raise TimeoutError(f"Timeout when waiting for stream chunk, call data: {self._call_data}")
+
+        if "error" in message:
+            self._close()
+            raise message["error"]
+
+        if "end" in message:
+            self._close()
+            raise StopIteration
+
+        self._consumed += 1
+        if self._consumed >= self._grant_batch:
+            self._grant(self._consumed)
+            self._consumed = 0
+
+        return message["chunk"]
+
+    def __enter__(self) -> "IpcStream":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.cancel()
+
+
+def by_channel(call_data: CallData) -> str:
+    """Ordering key of route calls by channel, see :class:`Route`.
+
+    :param call_data: The call data.
+
+    :return: The channel.
+    """
+    return call_data.channel
+
+
+def by_payload(field: str) -> typing.Callable[[CallData], typing.Hashable]:
+    """Ordering key of route calls by payload field, see :class:`Route`.
+
+    :param field: The payload field, calls without it share the None key.
+
+    :return: The ordering key function.
+    """
+
+    def key(call_data: CallData) -> typing.Hashable:
+        return call_data.payload.get(field)
+
+    return key
+
 
 class Route:
     """IPC route used to route IPC function calls.
@@ -169,9 +391,17 @@ class Route:
     :meth:`match` Check if the route matches the given channel.
     :meth:`bind` Bind the route to an IpcNode instance and an object.
     :meth:`call` Call the wrapped function.
+    :meth:`shutdown` Shutdown the route executor.
     """
 
-    def __init__(self, regexes: typing.List[str], concurrent: bool):
+    def __init__(
+        self,
+        regexes: typing.List[str],
+        concurrent: bool,
+        ordering_key: typing.Union[typing.Callable[[CallData], typing.Hashable], None] = None,
+        max_workers: int = 4,
+        executor: str = "thread",
+    ):
         """Create a new IPC route.
 
         :param regexes: A list of regular expressions to match against. e.g. ["a:b:c", "a:b:d:*", "a:*:c"]
@@ -187,7 +417,26 @@ class Route:
         .. warning::
             If the route is not concurrent, the function must not send loopback blocking calls to itself as this will
             cause a deadlock.
+
+        :param ordering_key: A function returning the ordering key of a call, e.g. :func:`by_channel` or
+            :func:`by_payload`. If set, the calls run in a pool of workers instead of one thread per call, the calls
+            with the same key run one after the other in the order they were received while the calls with different
+            keys run in parallel. Stream requests are not ordered. With the process executor, the calls with the same
+            key run in the same worker process, in order, so a per process cache of the handler is reused.
+        :param max_workers: The maximum number of keys running in parallel with an ordering key, or the number of
+            worker processes with the process executor.
+        :param executor: Where the calls run, "thread" (default) in the node process as described above, or "process"
+            in a pool of worker processes started when the route is bound, for CPU heavy handlers that would slow the
+            listener and the other threads of the node down. The results and the blocking responses are sent back by
+            the node. Process handlers are called with `self` set to None and must be declared as static methods,
+            the route decorator applied under `@staticmethod`. See
+            :class:`ProcessExecutor <utilities.executors.ProcessExecutor>` for the other handler constraints. Stream
+            requests still run in a thread.
+
+        :raises ValueError: If the executor is invalid.
         """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Invalid executor '{executor}', must be 'thread' or 'process'")
 
         # A list of regular expressions to match against. e.g. ["a:b:c", "a:b:d:*", "a:*:c"]
         self._regexes = self._parse_regexes(regexes)
@@ -201,6 +450,15 @@ class Route:
         # The Object associated with the self argument of the function.
         self._object = None
 
+        # The ordering key function and the keyed executor running the ordered calls, created when bound.
+        self._ordering_key = ordering_key
+        self._max_workers = max_workers
+        self._executor = None
+
+        # The process executor running the calls, created when bound.
+        self._executor_type = executor
+        self._process_executor = None
+
         # Accessible through property to ensure immutability.
         self._concurrent = concurrent
         self._decorator = self._wrap
@@ -215,6 +473,26 @@ class Route:
         """Get the regexes."""
         return self._regexes
 
+    @property
+    def concurrent(self) -> bool:
+        """Whether the route is concurrent or not."""
+        return self._concurrent
+
+    def threaded(self, call_data: CallData) -> bool:
+        """Check whether a call runs in a separate thread or in the calling thread.
+
+        :param call_data: The call data.
+
+        :return: True if the call runs in a separate thread, False otherwise.
+        """
+        return bool(
+            call_data.stream
+            or self._concurrent
+            or call_data.concurrent
+            or self._ordering_key is not None
+            or self._executor_type == "process"
+        )
+
     def match(self, channel: str) -> bool:
         """Check if the route matches the channel.
 
@@ -229,10 +507,49 @@ class Route:
 
         :param ipc_node: The :class:`IpcNode` instance.
         :param route_object: The object associated with the self argument of the function.
+
+        :raises ValueError: If the handler of a process route is a method of the object not declared static.
         """
+        if self._executor_type == "process" and not self._static(route_object):
+            raise ValueError(
+                f"The process route handler {self._wrapped_function.__qualname__} must be a static method, it is "
+                f"called in a worker process with self set to None"
+            )
+
         self._ipc_node = ipc_node
         self._object = route_object
 
+        if self._executor_type == "process":
+            if self._process_executor is None:
+                self._process_executor = executors.ProcessExecutor(
+                    self._wrapped_function, self._max_workers, self._ordering_key is not None
+                )
+        elif self._ordering_key is not None and self._executor is None:
+            self._executor = executors.KeyedExecutor(self._max_workers, f"route:{self._regexes[0]}")
+
+    def _static(self, route_object: object) -> bool:
+        """Check whether the handler is not an instance method of the route object.
+
+        :param route_object: The object associated with the self argument of the function.
+
+        :return: True if the handler is a static method of the object class or is not one of its methods.
+        """
+        for cls in inspect.getmro(type(route_object)):
+            attr = cls.__dict__.get(self._wrapped_function.__name__)
+            if attr is not None:
+                return isinstance(attr, staticmethod)
+        return True
+
+    def shutdown(self) -> None:
+        """Shutdown the route executors, the ordered calls already received still run, the process calls not
+        started yet are cancelled."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._process_executor is not None:
+            self._process_executor.shutdown(wait=False)
+            self._process_executor = None
+
     @staticmethod
     def _check_function_signature(function: typing.Callable) -> typing.Union[None, str]:
         """Check the function signature. The function signature must have 3 named parameters: `self`, `calldata`,
@@ -299,10 +616,9 @@ class Route:
             self._wrapped_function(self._object, call_data, call_data.payload)
         except Exception as e:
             self._ipc_node.logger.error(
-                f"IPC Node, an error occurred when calling a function.\n"
-                f"Call Data: {call_data}\n"
-                f"Exception: {''.join(traceback.format_exception(type(e), e, e.__traceback__))}",
+                "IPC Node, an error occurred when calling a function.\nCall Data: {}\nException: {}",
                 label=self._ipc_node.ipc_id,
+                args=(call_data, lg.lazy_traceback(e)),
             )
 
     def _call_blocking(self, call_data: CallData) -> None:
@@ -312,36 +628,130 @@ class Route:
         """
         try:
             r = self._wrapped_function(self._object, call_data, call_data.payload)
+            if inspect.isgenerator(r):
+                # Streaming route called through a blocking request, the whole stream is sent as a single response.
+                r = list(r)
         except Exception as e:
             r = e
 
+        self._respond(call_data, r)
+
+    def _respond(self, call_data: CallData, r: typing.Any) -> None:
+        """Send the response of a blocking request.
+
+        :param call_data: The call data.
+        :param r: The response, the return value or the exception raised by the wrapped function.
+        """
         try:
-            self._ipc_node.send(call_data.blocking_response_channel, {"response": r}, loopback=True, _nolog=True)
+            self._ipc_node.send(
+                call_data.blocking_response_channel, {"response": r}, loopback=True, _nolog=True, _force=True
+            )
         except pickle.PicklingError as e:
             self._ipc_node.logger.error(
-                f"IPC Node failed to pickle blocking request return value.\nReturn value: {r}\nException: {e}\n"
-                f"Initial Call Data: {call_data}",
+                "IPC Node failed to pickle blocking request return value.\nReturn value: {}\nException: {}\n"
+                "Initial Call Data: {}",
                 label=self._ipc_node.ipc_id,
+                args=(r, e, call_data),
             )
             r = None
-            self._ipc_node.send(call_data.blocking_response_channel, {"response": r}, loopback=True, _nolog=True)
+            self._ipc_node.send(
+                call_data.blocking_response_channel, {"response": r}, loopback=True, _nolog=True, _force=True
+            )
+
+    def _call_stream(self, call_data: CallData) -> None:
+        """Call the wrapped function and stream the chunks it yields to the requester.
+
+        Generators and iterators are streamed chunk by chunk, any other return value is sent as a single chunk.
+
+        :param call_data: The call data.
+        """
+        try:
+            r = self._wrapped_function(self._object, call_data, call_data.payload)
+        except Exception as e:
+            self._ipc_node.send(
+                call_data.blocking_response_channel, {"error": e}, loopback=True, _nolog=True, _force=True
+            )
+            return
+
+        if not isinstance(r, collections.abc.Iterator):
+            r = iter([r])
+
+        self._ipc_node.send_stream_chunks(call_data, r)
 
     def call(self, call_data: CallData) -> None:
         """Call the wrapped function.
 
+        Stream requests are always handled in a separate thread as the responder waits for the requester credits.
+
         :param call_data: The call data.
         """
         # Not bound yet.
         assert self._ipc_node is not None
         assert self._object is not None
 
-        if self._concurrent or call_data.concurrent:
-            thread = threading.Thread(
-                target=self._call_blocking if call_data.blocking else self._call, args=(call_data,)
-            )
+        if call_data.stream:
+            function = self._call_stream
+        elif call_data.blocking:
+            function = self._call_blocking
+        else:
+            function = self._call
+
+        if self._process_executor is not None and not call_data.stream:
+            self._call_process(call_data)
+        elif self._executor is not None and not call_data.stream:
+            self._executor.submit(self._ordering_key(call_data), self._run, function, call_data)
+        elif self.threaded(call_data):
+            thread = threading.Thread(target=self._run, args=(function, call_data))
             thread.start()
         else:
-            self._call(call_data) if not call_data.blocking else self._call_blocking(call_data)
+            self._run(function, call_data)
+
+    def _call_process(self, call_data: CallData) -> None:
+        """Call the wrapped function in the process executor, the result is handled once done by the executor thread.
+
+        :param call_data: The call data.
+        """
+        start = time.monotonic()
+        key = self._ordering_key(call_data) if self._ordering_key is not None else None
+        future = self._process_executor.submit(call_data, key)
+        future.add_done_callback(lambda f: self._process_done(call_data, start, f))
+
+    def _process_done(self, call_data: CallData, start: float, future: futures.Future) -> None:
+        """Handle the result of a call run in the process executor, send the response of blocking requests.
+
+        :param call_data: The call data.
+        :param start: The monotonic timestamp the call was submitted at.
+        :param future: The call future.
+        """
+        if future.cancelled():
+            return
+
+        if call_data.trace is not None:
+            tracing.record(self._ipc_node, self._wrapped_function.__qualname__, call_data.trace, start)
+
+        e = future.exception()
+        if call_data.blocking:
+            self._respond(call_data, e if e is not None else future.result())
+        elif e is not None:
+            self._ipc_node.logger.error(
+                "IPC Node, an error occurred when calling a function in a worker process."
+                "\nCall Data: {}\nException: {}",
+                label=self._ipc_node.ipc_id,
+                args=(call_data, lg.lazy_traceback(e)),
+            )
+
+    def _run(self, function: typing.Callable[[CallData], None], call_data: CallData) -> None:
+        """Run a call function, inside the handler span if the call is part of a trace.
+
+        :param function: The call function, one of :meth:`_call`, :meth:`_call_blocking` or :meth:`_call_stream`.
+        :param call_data: The call data.
+        """
+        if call_data.trace is None:
+            function(call_data)
+            return
+
+        with tracing.span(self._ipc_node, self._wrapped_function.__qualname__, call_data.trace):
+            function(call_data)
 
 
 class IpcNode(abstracts.IIpcNode):
@@ -350,12 +760,16 @@ class IpcNode(abstracts.IIpcNode):
     :attr:`logger` The :class:`Logger` instance.
     :attr:`ipc_id` The IPC node unique id.
     :attr:`redis` The redis client.
+    :attr:`stats` The IPC counters.
 
     :meth:`set_logger` Set the logger instance.
     :meth:`start` Start the IPC node.
     :meth:`stop` Stop the IPC node.
     :meth:`send` Send a message to the IPC.
+    :meth:`publish_state` Set a redis key and send a message to the IPC in a single round trip.
     :meth:`send_blocking` Send a blocking message to the IPC, wait for the response and return it.
+    :meth:`gather` Send a blocking message to the IPC and gather the responses of every node answering it.
+    :meth:`send_stream` Send a stream request to the IPC and iterate over the response chunks.
     """
 
     def __init__(
@@ -380,11 +794,44 @@ class IpcNode(abstracts.IIpcNode):
         #: blocking responses dict.
         self._blocking_responses = {}
 
+        #: requested streams by response channel.
+        self._streams = {}
+
+        #: responded streams credits by credit channel.
+        self._stream_credits = {}
+
+        #: routes regexes advertised by every node, by node id. None until loaded, nothing is suppressed meanwhile.
+        self._routes_registry = None
+        #: cached listened answers by (channel, loopback), reset on every registry change.
+        self._listened_channels = {}
+
+        #: IPC counters, incremented by the listener, executor and flusher threads.
+        self._stats = {"sent": 0, "suppressed": 0, "received": 0, "local": 0}
+        #: lock guarding the IPC counters.
+        self._stats_lock = threading.Lock()
+
+        #: serializes the calls of non-concurrent routes, run by the listener or by the loopback dispatcher.
+        self._dispatch_lock = threading.RLock()
+        #: loopback messages waiting for the loopback dispatcher, as (call data, routes), None stops the dispatcher.
+        self._loopback_queue = queue.SimpleQueue()
+        #: loopback dispatcher thread, started on the first loopback message dispatched in-process.
+        self._loopback_thread = None
+        #: lock guarding the start of the loopback dispatcher thread.
+        self._loopback_lock = threading.Lock()
+
         # Accessible through property to ensure immutability.
         self._ipc_id = ipc_id
         self._logger = None
         self._redis = strict_redis
 
+        #: logger thresholds route, for every node or for this node only.
+        self._configure_logger = Route(["log:config", f"log:config:{ipc_id}"], False).decorator(
+            IpcNode._configure_logger
+        )
+
+        #: recent log records route of this node.
+        self._recent_logs = Route([f"log:recent:{ipc_id}"], True).decorator(IpcNode._recent_logs)
+
         #: routes.
         self._routes = []
         self.bind_routes(self)
@@ -405,6 +852,9 @@ class IpcNode(abstracts.IIpcNode):
 
         self._routes += routes
 
+        if self._alive:
+            self._advertise_routes()
+
     @property
     def logger(self) -> lg.Logger:
         """Get the logger."""
@@ -420,6 +870,116 @@ class IpcNode(abstracts.IIpcNode):
         """Get the redis client."""
         return self._redis
 
+    @property
+    def stats(self) -> typing.Dict[str, int]:
+        """Get the IPC counters: messages sent, sends suppressed because no node listens, messages received, and
+        loopback messages dispatched in-process."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, counter: str) -> None:
+        """Increment an IPC counter.
+
+        :param counter: The counter name.
+        """
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+    def _advertise_routes(self) -> None:
+        """Advertise the routes regexes of the node in the registry and notify the other nodes."""
+        regexes = [r for route in self._routes for r in route.regexes]
+        self._redis.hset(ROUTES_REGISTRY, self._ipc_id, json.dumps(regexes))
+        self._notify_routes(regexes)
+
+    def _notify_routes(self, regexes: typing.Union[typing.List[str], None]) -> None:
+        """Notify the other nodes the routes of the node changed, the notification is never suppressed.
+
+        :param regexes: The routes regexes of the node, None if the node stopped.
+        """
+        call_data = CallData(channel=ROUTES_REGISTRY, sender=self._ipc_id, loopback=True, payload={"regexes": regexes})
+        self._redis.publish("ipc", call_data.dumps())
+
+    def _load_routes_registry(self) -> None:
+        """Load the routes regexes advertised by every node."""
+        self._routes_registry = {
+            (node.decode() if isinstance(node, bytes) else node): [re.compile(r) for r in json.loads(regexes)]
+            for node, regexes in self._redis.hgetall(ROUTES_REGISTRY).items()
+        }
+        self._listened_channels = {}
+
+    def _handle_routes_update(self, call_data: CallData) -> bool:
+        """Handle a routes change notification.
+
+        :param call_data: The call data.
+        """
+        if call_data.channel != ROUTES_REGISTRY:
+            return False
+
+        if self._routes_registry is not None:
+            regexes = call_data.payload["regexes"]
+            if regexes is None:
+                self._routes_registry.pop(call_data.sender, None)
+            else:
+                self._routes_registry[call_data.sender] = [re.compile(r) for r in regexes]
+            self._listened_channels = {}
+        return True
+
+    def listened(self, channel: str, loopback: bool = False) -> bool:
+        """Check whether a node listens to a channel according to the registry, the answer is cached until the next
+        registry change.
+
+        :param channel: The channel.
+        :param loopback: Whether the message is a loopback or not, the node itself only listens to loopbacks.
+
+        :return: True if a node listens to the channel or if the registry is not loaded yet, False otherwise.
+        """
+        registry = self._routes_registry
+        if registry is None:
+            return True
+
+        listened = self._listened_channels.get((channel, loopback))
+        if listened is None:
+            listened = any(
+                any(r.match(channel) for r in regexes)
+                for node, regexes in list(registry.items())
+                if loopback or node != self._ipc_id
+            )
+            self._listened_channels[(channel, loopback)] = listened
+        return listened
+
+    def _publish(self, call_data: CallData, force: bool = False) -> bool:
+        """Publish a message to the IPC, unless no node listens to its channel.
+
+        :param call_data: The call data.
+        :param force: Whether to publish even if no node listens, for responses to blocking requests and streams.
+
+        :return: True if the message was published, False if suppressed.
+        """
+        if not force and not self.listened(call_data.channel, call_data.loopback):
+            self._count("suppressed")
+            return False
+
+        self._redis.publish("ipc", call_data.dumps())
+        self._count("sent")
+        return True
+
+    @staticmethod
+    def _trace_context() -> typing.Union[tracing.TraceContext, None]:
+        """Get the trace context to propagate in a message sent now.
+
+        :return: The trace context or None if no trace is active on the current thread.
+        """
+        context = tracing.current()
+        return context.for_send() if context is not None else None
+
+    def report_span(self, span: tracing.Span) -> None:
+        """Report a span to the tracer, the report itself is not traced.
+
+        :param span: The span.
+        """
+        call_data = CallData(channel=tracing.SPAN_CHANNEL, sender=self._ipc_id, loopback=True, payload=span.dumps())
+        self._publish(call_data)
+
     def set_logger(self, logger: lg.Logger) -> None:
         """Set the logger instance.
 
@@ -427,6 +987,31 @@ class IpcNode(abstracts.IIpcNode):
         """
         self._logger = logger
 
+    def _configure_logger(self, call_data: CallData, payload: dict) -> dict:
+        """Change the logger thresholds, see :meth:`src.nemesis_utilities.utilities.logger.Logger.configure`.
+
+        :param call_data: The call data.
+        :param payload: The new thresholds, as optional "level", "labels" and "reset" fields.
+
+        :return: The logger thresholds.
+        """
+        self._logger.configure(payload.get("level"), payload.get("labels"), payload.get("reset", False))
+        self._logger.info("Log thresholds changed to {}.", label=self._ipc_id, args=(self._logger.thresholds,))
+        return self._logger.thresholds
+
+    def _recent_logs(self, call_data: CallData, payload: dict) -> typing.List[dict]:
+        """Get the recent log records of the node, see :meth:`src.nemesis_utilities.utilities.logger.Logger.recent`.
+
+        :param call_data: The call data.
+        :param payload: The optional "levels", "labels", "start", "end" and "limit" filters.
+
+        :return: The records as dicts, oldest first.
+        """
+        logs = self._logger.recent(
+            payload.get("levels"), payload.get("labels"), payload.get("start"), payload.get("end"), payload.get("limit")
+        )
+        return [log.to_dict() for log in logs]
+
     def _fetch_ipc(self) -> typing.Union[None, dict]:
         """Fetch a message from redis pubsub.
 
@@ -436,9 +1021,9 @@ class IpcNode(abstracts.IIpcNode):
             msg = self._pubsub.get_message(True, timeout=0.1)
         except redis.exceptions.ConnectionError as e:
             self._logger.warning(
-                f"IPC Node failed to fetch message from redis pubsub: '{e}'. "
-                f"Ignore this warning if it doesn't persist.",
+                "IPC Node failed to fetch message from redis pubsub: '{}'. Ignore this warning if it doesn't persist.",
                 label=self._ipc_id,
+                args=(e,),
             )
             return None
 
@@ -478,39 +1063,155 @@ class IpcNode(abstracts.IIpcNode):
             call_data = self._parse_ipc(message)
         except Exception as e:
             self._logger.error(
-                f"IPC Node error when parsing a message.\nMessage: {message}\nException: {e}", label=self._ipc_id
+                "IPC Node error when parsing a message.\nMessage: {}\nException: {}",
+                label=self._ipc_id,
+                args=(message, e),
             )
 
         return call_data
 
     def _handle_blocking_response(self, call_data: CallData) -> bool:
-        """Handle a blocking response.
+        """Handle a blocking response, gathered responses are stored by sender.
 
         :param call_data: The call data.
         """
-        if call_data.channel in self._blocking_responses:
+        stream = self._streams.get(call_data.channel)
+        if stream is not None:
+            stream.push(call_data.payload)
+            return True
+
+        placeholder = self._blocking_responses.get(call_data.channel)
+        if placeholder is not None:
+            if call_data.trace is not None:
+                self._record_transport_span(call_data, time.monotonic())
             self._log_received_message(call_data)
-            self._blocking_responses[call_data.channel]["response"] = call_data
-            self._blocking_responses[call_data.channel]["lock"].release()
+            if "responses" in placeholder:
+                placeholder["responses"][call_data.sender] = call_data
+            else:
+                placeholder["response"] = call_data
+            placeholder["lock"].release()
             return True
         return False
 
-    def _handle_message(self, call_data: CallData) -> None:
+    def _handle_stream_credit(self, call_data: CallData) -> bool:
+        """Handle a credit grant or a cancellation sent by a stream requester.
+
+        :param call_data: The call data.
+        """
+        credits = self._stream_credits.get(call_data.channel)
+        if credits is None:
+            return False
+
+        if call_data.payload.get("cancel"):
+            credits["cancelled"] = True
+            credits["lock"].release()
+        else:
+            credits["lock"].release(call_data.payload["credit"])
+        return True
+
+    def _handle_message(self, call_data: CallData, routes: typing.Union[typing.List[Route], None] = None) -> None:
         """Handle a message by matching it against the routes and calling the route if it matches.
 
+        Calls running in the calling thread hold the dispatch lock, so non-concurrent routes never run at the same
+        time whether the message was received by the listener or dispatched in-process by the loopback dispatcher.
+
         :param call_data: The call data.
+        :param routes: The routes already matched against the channel, defaults to matching every route.
         """
-        for route in self._routes:
-            if route.match(call_data.channel):
+        received = time.monotonic()
+        if routes is None:
+            routes = [route for route in self._routes if route.match(call_data.channel)]
+        if not routes:
+            return
+
+        if call_data.trace is not None:
+            self._record_transport_span(call_data, received)
+
+        inline = not all(route.threaded(call_data) for route in routes)
+        with self._dispatch_lock if inline else contextlib.nullcontext():
+            for route in routes:
                 self._log_received_message(call_data)
                 route.call(call_data)
 
+    @staticmethod
+    def _remote_copy(call_data: CallData) -> CallData:
+        """Copy a loopback message for the other nodes, without loopback so the node does not receive it back.
+
+        :param call_data: The loopback call data.
+
+        :return: The call data to publish.
+        """
+        return CallData(
+            channel=call_data.channel,
+            sender=call_data.sender,
+            loopback=False,
+            payload=call_data.payload,
+            concurrent=call_data.concurrent,
+            trace=call_data.trace,
+        )
+
+    def _queue_loopback(self, call_data: CallData, routes: typing.List[Route]) -> None:
+        """Queue a loopback message for the loopback dispatcher thread, started if needed.
+
+        :param call_data: The call data.
+        :param routes: The local routes matching the channel.
+        """
+        self._count("local")
+        self._loopback_queue.put((call_data, routes))
+        with self._loopback_lock:
+            if self._loopback_thread is None:
+                self._loopback_thread = threading.Thread(target=self._loopback_dispatcher, daemon=True)
+                self._loopback_thread.start()
+
+    def _loopback_dispatcher(self) -> None:
+        """Handle the loopback messages dispatched in-process, in the order they were sent, until the node stops."""
+        while True:
+            item = self._loopback_queue.get()
+            if item is None:
+                break
+            self._handle_message(*item)
+
+    def _dispatch_loopback(self, call_data: CallData, force: bool = False) -> bool:
+        """Dispatch a loopback message in-process to the local blocking requests, streams and routes, a copy is
+        published to the IPC only if another node listens to the channel.
+
+        Blocking responses and stream credits are handled right away. Messages to the local routes are queued and
+        handled by the loopback dispatcher thread in the order they were sent, like the listener does for the
+        messages received from redis, so sending never waits for a route and a route sending again does not recurse.
+
+        .. warning::
+            The payload is not copied for the local routes, it must not be modified once sent.
+
+        :param call_data: The call data.
+        :param force: Whether to publish the copy even if no node listens, for responses to remote requests.
+
+        :return: True if the message was dispatched or published, False if suppressed.
+        """
+        if self._handle_blocking_response(call_data) or self._handle_stream_credit(call_data):
+            self._count("local")
+            return True
+
+        routes = [route for route in self._routes if route.match(call_data.channel)]
+        published = self._publish(self._remote_copy(call_data), force)
+        if routes:
+            self._queue_loopback(call_data, routes)
+
+        return published or bool(routes)
+
+    def _record_transport_span(self, call_data: CallData, received: float) -> None:
+        """Report the transport span of a traced message, from its emission to its reception.
+
+        :param call_data: The call data.
+        :param received: The monotonic timestamp the message was received at.
+        """
+        tracing.record(self, call_data.channel, call_data.trace, call_data.trace.sent, received, category="ipc")
+
     def _log_received_message(self, call_data: CallData) -> None:
         """Log a received message.
 
         :param call_data: The call data.
         """
-        self._logger.debug(f"IPC Node received message.\n\tCall data: {call_data}", label=self._ipc_id)
+        self._logger.debug("IPC Node received message.\n\tCall data: {}", label=self._ipc_id, args=(call_data,))
 
     def _listener(self) -> None:
         """Listen for incoming messages and handle them."""
@@ -527,8 +1228,13 @@ class IpcNode(abstracts.IIpcNode):
 
             if call_data is None:
                 continue
+            self._count("received")
 
-            if self._handle_blocking_response(call_data):
+            if (
+                self._handle_blocking_response(call_data)
+                or self._handle_stream_credit(call_data)
+                or self._handle_routes_update(call_data)
+            ):
                 continue
 
             self._handle_message(call_data)
@@ -538,39 +1244,135 @@ class IpcNode(abstracts.IIpcNode):
         self._logger.debug("Starting IPC node.", label=self._ipc_id)
         self._pubsub.subscribe("ipc")
         self._alive = True
+        self._advertise_routes()
+        self._load_routes_registry()
         threading.Thread(target=self._listener).start()
 
     def stop(self) -> None:
-        """Stop the IPC node."""
+        """Stop the IPC node, the queued log records are flushed first and the routes executors are shut down."""
         self._logger.debug("Stopping IPC node.", label=self._ipc_id)
+        self._logger.stop()
         self._alive = False
+        self._loopback_queue.put(None)
+        if self._routes_registry is not None:
+            self._redis.hdel(ROUTES_REGISTRY, self._ipc_id)
+            self._notify_routes(None)
+        for route in self._routes:
+            route.shutdown()
         self._pubsub.unsubscribe("ipc")
         self._pubsub.close()
         self._redis.close()
 
     def send(
-        self, channel: str, payload: dict, concurrent: bool = None, loopback: bool = False, _nolog: bool = False
+        self,
+        channel: str,
+        payload: dict,
+        concurrent: bool = None,
+        loopback: bool = False,
+        _nolog: bool = False,
+        _force: bool = False,
     ) -> None:
-        """Send a message to the IPC.
+        """Send a message to the IPC, the message is not even serialized if no node listens to the channel.
 
         :param channel: The channel to send the message on.
         :param payload: The payload to send as a dict.
         :param concurrent: Whether the message is concurrent or not. If set, will override the route concurrent
             parameter. If set to True, will run the function in a separate thread. If set to False, will run the
             function in the listener thread, the listener will be blocked until the function returns.
-        :param loopback: Whether the message is a loopback or not.
+        :param loopback: Whether the message is a loopback or not. Once the node is started, loopback messages are
+            dispatched in-process to the node own routes, by the loopback dispatcher thread, see
+            :meth:`_dispatch_loopback`.
         :param _nolog: Whether to log the message or not.
+        :param _force: Whether to send the message even if no node listens to the channel, used for responses.
         """
 
         call_data = CallData(
-            channel=channel, sender=self._ipc_id, loopback=loopback, payload=payload, concurrent=concurrent
+            channel=channel,
+            sender=self._ipc_id,
+            loopback=loopback,
+            payload=payload,
+            concurrent=concurrent,
+            trace=self._trace_context(),
         )
 
-        self._redis.publish("ipc", call_data.dumps())
+        # Loopback messages are dispatched in-process once the node is started, instead of a round trip to redis
+        if loopback and self._alive:
+            sent = self._dispatch_loopback(call_data, _force)
+        else:
+            sent = self._publish(call_data, _force)
+        if not sent:
+            return
+
+        if not _nolog:
+            self._logger.debug("Sent message, call data: {}", label=self._ipc_id, args=(call_data,))
+
+    def publish_state(
+        self,
+        key: str,
+        channel: str,
+        payload: dict,
+        value: typing.Any = None,
+        loopback: bool = False,
+        history: typing.Union["hs.SensorHistory", None] = None,
+        _nolog: bool = False,
+    ) -> None:
+        """Set a redis key and send a message to the IPC in a single round trip, as a MULTI/EXEC pipeline readers can
+        not see one write without the other.
+
+        With a history, the payload is appended to it and the history is written in the same pipeline.
+
+        :param key: The redis key to set.
+        :param channel: The channel to send the message on.
+        :param payload: The payload to send as a dict.
+        :param value: The value to set, defaults to the payload dumped as JSON.
+        :param loopback: Whether the message is a loopback or not. Once the node is started, loopback messages are
+            dispatched in-process to the node own routes after the pipeline is executed, like :meth:`send` does.
+        :param history: The :class:`SensorHistory <utilities.history.SensorHistory>` of the key, defaults to None.
+        :param _nolog: Whether to log the message or not.
+        """
+        call_data = CallData(
+            channel=channel, sender=self._ipc_id, loopback=loopback, payload=payload, trace=self._trace_context()
+        )
+        value = json.dumps(payload) if value is None else value
+        if history is not None:
+            history.append(payload)
+
+        self._write_states([(key, value, call_data, history)])
 
         if not _nolog:
-            pass
-            self._logger.debug(f"Sent message, call data: {call_data}", label=self._ipc_id)
+            self._logger.debug("Published state of {}, call data: {}", label=self._ipc_id, args=(key, call_data))
+
+    def _write_states(
+        self, states: typing.List[typing.Tuple[str, typing.Any, CallData, typing.Union["hs.SensorHistory", None]]]
+    ) -> None:
+        """Set the redis keys, write the histories and send the messages of state updates in a single MULTI/EXEC
+        pipeline.
+
+        :param states: The state updates as (key, value, call data, history).
+        """
+        pipeline = self._redis.pipeline(transaction=True)
+        local = []
+        for key, value, call_data, history in states:
+            pipeline.set(key, value)
+            if history is not None:
+                history.write(pipeline)
+
+            # Loopback messages are dispatched in-process once the node is started, see _dispatch_loopback
+            if call_data.loopback and self._alive:
+                routes = [route for route in self._routes if route.match(call_data.channel)]
+                if routes:
+                    local.append((call_data, routes))
+                call_data = self._remote_copy(call_data)
+
+            if self.listened(call_data.channel, call_data.loopback):
+                pipeline.publish("ipc", call_data.dumps())
+                self._count("sent")
+            else:
+                self._count("suppressed")
+        pipeline.execute()
+
+        for call_data, routes in local:
+            self._queue_loopback(call_data, routes)
 
     def _create_blocking_request_response_placeholder(self, call_data: CallData) -> None:
         """Create a blocking request response placeholder.
@@ -638,14 +1440,202 @@ class IpcNode(abstracts.IIpcNode):
             payload=payload,
             concurrent=concurrent,
             blocking_response_channel=f"{channel}:{self._ipc_id}:{str(uuid.uuid4())}",
+            trace=self._trace_context(),
         )
 
         self._create_blocking_request_response_placeholder(call_data)
 
-        self._redis.publish("ipc", call_data.dumps())
+        self._publish(call_data, force=True)
 
         if not _nolog:
-            pass
-            self._logger.debug(f"Sent blocking message, call data: {call_data}", label=self._ipc_id)
+            self._logger.debug("Sent blocking message, call data: {}", label=self._ipc_id, args=(call_data,))
 
         return self._wait_for_blocking_response(call_data, timeout=timeout)
+
+    def _create_gather_placeholder(self, call_data: CallData) -> None:
+        """Create a gathered responses placeholder, responses are stored by sender.
+
+        :param call_data: The call data.
+        """
+        self._blocking_responses[call_data.blocking_response_channel] = {
+            "responses": {},
+            "lock": threading.Semaphore(0),
+        }
+
+    def _wait_for_gathered_responses(
+        self, call_data: CallData, timeout: float = 1.0, expected: typing.Union[int, None] = None
+    ) -> typing.Dict[str, typing.Any]:
+        """Wait for gathered responses until the timeout is reached or the expected responses count is received.
+
+        :param call_data: The call data.
+        :param timeout: The timeout in seconds.
+        :param expected: The expected responses count, if None, wait until the timeout is reached.
+
+        :return: The responses by sender.
+        """
+        placeholder = self._blocking_responses[call_data.blocking_response_channel]
+        deadline = time.monotonic() + timeout
+
+        while expected is None or len(placeholder["responses"]) < expected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not placeholder["lock"].acquire(timeout=remaining):
+                break
+
+        del self._blocking_responses[call_data.blocking_response_channel]
+
+        # The listener may still be adding a late response, iterate over a copy taken in a single step.
+        responses = dict(placeholder["responses"])
+        return {sender: response.payload["response"] for sender, response in responses.items()}
+
+    def gather(
+        self,
+        channel: str,
+        payload: dict,
+        concurrent: bool = None,
+        loopback: bool = False,
+        timeout: float = 1.0,
+        expected: typing.Union[int, None] = None,
+        _nolog: bool = False,
+    ) -> typing.Dict[str, typing.Any]:
+        """Send a blocking message to the IPC and gather the responses of every node answering it within the timeout,
+        or until the expected responses count is received.
+
+        :param channel: The channel to send the message on.
+        :param payload: The payload to send as a dict.
+        :param concurrent: Whether the message is concurrent or not. If set, will override the route concurrent
+            parameter. If set to True, will run the function in a separate thread. If set to False, will run the
+            function in the listener thread, the listener will be blocked until the function returns.
+        :param loopback: Whether the message is a loopback or not.
+        :param timeout: The timeout in seconds, reaching it is not an error.
+        :param expected: The expected responses count, if None, wait until the timeout is reached.
+        :param _nolog: Whether to log the message or not.
+
+        :return: The responses by sender (ipc node id).
+
+        .. note::
+            Exceptions raised by a responder are returned as its response instead of being raised.
+        """
+        call_data = CallData(
+            channel=channel,
+            sender=self._ipc_id,
+            loopback=loopback,
+            payload=payload,
+            concurrent=concurrent,
+            blocking_response_channel=f"{channel}:{self._ipc_id}:{str(uuid.uuid4())}",
+            trace=self._trace_context(),
+        )
+
+        self._create_gather_placeholder(call_data)
+
+        self._publish(call_data, force=True)
+
+        if not _nolog:
+            self._logger.debug("Sent gather message, call data: {}", label=self._ipc_id, args=(call_data,))
+
+        return self._wait_for_gathered_responses(call_data, timeout=timeout, expected=expected)
+
+    def send_stream(
+        self,
+        channel: str,
+        payload: dict,
+        loopback: bool = False,
+        credit: int = 16,
+        timeout: float = 5.0,
+        _nolog: bool = False,
+    ) -> IpcStream:
+        """Send a stream request to the IPC, the route handler yields chunks delivered in order to the returned stream.
+
+        :param channel: The channel to send the message on.
+        :param payload: The payload to send as a dict.
+        :param loopback: Whether the message is a loopback or not.
+        :param credit: The maximum number of chunks in flight, bounds the memory used on both sides.
+        :param timeout: The time in seconds to wait for each chunk.
+        :param _nolog: Whether to log the message or not.
+
+        :return: The :class:`IpcStream`, iterating over it raises the exception raised by the handler if any, or
+            TimeoutError if a chunk is not received in time.
+        """
+        assert credit > 0
+
+        call_data = CallData(
+            channel=channel,
+            sender=self._ipc_id,
+            loopback=loopback,
+            payload=payload,
+            blocking_response_channel=f"{channel}:{self._ipc_id}:{str(uuid.uuid4())}",
+            stream_credit=credit,
+            trace=self._trace_context(),
+        )
+
+        stream = IpcStream(self, call_data, timeout)
+        self._streams[call_data.blocking_response_channel] = stream
+
+        self._publish(call_data, force=True)
+
+        if not _nolog:
+            self._logger.debug("Sent stream message, call data: {}", label=self._ipc_id, args=(call_data,))
+
+        return stream
+
+    def close_stream(self, call_data: CallData) -> None:
+        """Unregister a requested stream, late chunks are ignored.
+
+        :param call_data: The stream request call data.
+        """
+        self._streams.pop(call_data.blocking_response_channel, None)
+
+    def send_stream_chunks(self, call_data: CallData, chunks: typing.Iterator) -> None:
+        """Send chunks to a stream requester, used by routes to answer stream requests.
+
+        A chunk is only produced once the requester granted a credit for it, the stream stops when the requester
+        cancels it or stops granting credits for :data:`STREAM_CREDIT_TIMEOUT` seconds.
+
+        :param call_data: The stream request call data.
+        :param chunks: The chunks iterator.
+        """
+        credit_channel = f"{call_data.blocking_response_channel}:credit"
+        credits = {"lock": threading.Semaphore(call_data.stream_credit), "cancelled": False}
+        self._stream_credits[credit_channel] = credits
+
+        try:
+            while True:
+                if not credits["lock"].acquire(timeout=STREAM_CREDIT_TIMEOUT):
+                    raise IpcTimeoutError(f"Stream requester stopped granting credits, call data: {call_data}")
+                if credits["cancelled"]:
+                    break
+
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    self.send(
+                        call_data.blocking_response_channel, {"end": True}, loopback=True, _nolog=True, _force=True
+                    )
+                    break
+
+                self.send(
+                    call_data.blocking_response_channel, {"chunk": chunk}, loopback=True, _nolog=True, _force=True
+                )
+
+        except Exception as e:
+            self._logger.error(
+                "IPC Node, an error occurred when streaming a response.\nCall Data: {}\nException: {}",
+                label=self._ipc_id,
+                args=(call_data, e),
+            )
+            try:
+                self.send(call_data.blocking_response_channel, {"error": e}, loopback=True, _nolog=True, _force=True)
+            except Exception:
+                # The exception itself may not be picklable.
+                self.send(
+                    call_data.blocking_response_channel,
+                    {"error": RuntimeError(str(e))},
+                    loopback=True,
+                    _nolog=True,
+                    _force=True,
+                )
+
+        finally:
+            del self._stream_credits[credit_channel]
+            if hasattr(chunks, "close"):
+                # Let generators release their resources.
+                chunks.close()
@@ -2,14 +2,27 @@
 
 :class:`Colors` terminal colors enum.
 
+:class:`Lazy` log argument computed only when the log message is formatted.
+
+:meth:`lazy_traceback` lazy formatted traceback of an exception.
+
 :class:`Log` log object allowing serialization and deserialization, allowing formatting.
 
+:class:`StdoutSink` stdout sink writing log records from a background thread, in the human or the JSON format.
+
 :class:`Logger` logger class, allowing to log messages to ipc and to pretty print them to stdout.
 """
 
+import collections
+import functools
+import json
 import os
-import pickle
+import struct
+import sys
+import threading
 import time
+import traceback
+import typing
 from datetime import datetime
 
 import utilities.abstracts as abstracts  # TODO: fix import
@@ -45,37 +58,182 @@ class Colors:
     WHITE = "\033[37m"
 
 
+# The standard log levels, encoded as their index in the low 6 bits of the level code byte, the 2 high bits are the
+# _FIELDS and _REPEATED flags. Other levels are encoded as _LEVEL_CUSTOM (0x3F) followed by the level.
+_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+_LEVEL_CODES = {level: code for code, level in enumerate(_LEVELS)}
+# Rank of the custom levels against the thresholds, they are always logged.
+_CUSTOM_RANK = len(_LEVELS)
+_LEVEL_CUSTOM = 0x3F
+# Level code flag of repeated logs, their header is followed by the repeat count and the first timestamp.
+_REPEATED = 0x80
+_REPEAT = struct.Struct("!Id")
+# Level code flag of logs with fields, the fields are encoded in JSON after the message, preceded by their length.
+_FIELDS = 0x40
+_FIELDS_LENGTH = struct.Struct("!I")
+
+# Encoded log header: timestamp, level code, custom level length, label length, message length.
+_HEADER = struct.Struct("!dBBHI")
+# Label length of logs without label.
+_NO_LABEL = 0xFFFF
+
+
+class Lazy:
+    """Log argument computed only when the log message is formatted, for arguments costly to build.
+
+    .. code-block:: python
+
+        logger.debug("State: {}", label, args=(Lazy(expensive_dump, state),))
+    """
+
+    __slots__ = ("_function", "_args")
+
+    def __init__(self, function: typing.Callable, *args):
+        """Create a lazy log argument.
+
+        :param function: The function computing the argument.
+        :param args: The function arguments.
+        """
+        self._function = function
+        self._args = args
+
+    def __format__(self, format_spec: str) -> str:
+        return format(self._function(*self._args), format_spec)
+
+    def __str__(self) -> str:
+        return str(self._function(*self._args))
+
+
+def _format_exception(exception: BaseException) -> str:
+    """Format an exception and its traceback.
+
+    :param exception: The exception.
+
+    :return: The formatted traceback.
+    """
+    return "".join(traceback.format_exception(type(exception), exception, exception.__traceback__))
+
+
+def lazy_traceback(exception: BaseException) -> Lazy:
+    """Get the traceback of an exception as a lazy log argument, formatted only if the log message is.
+
+    :param exception: The exception.
+
+    :return: The lazy formatted traceback.
+    """
+    return Lazy(_format_exception, exception)
+
+
+def _json_field(value: typing.Any) -> typing.Any:
+    """Get a log field as a JSON value, values other than JSON scalars are converted to strings.
+
+    :param value: The field value.
+
+    :return: The JSON value.
+    """
+    return value if value is None or isinstance(value, (str, int, float, bool)) else str(value)
+
+
+#: Whether the DEBUG environment variable is set, read once. It sets the default threshold of the loggers.
+DEBUG_ENABLED = os.environ.get("DEBUG") == "1"
+
+#: The stdout format of the loggers, from the LOG_FORMAT environment variable read once, "human" or "json".
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "human")
+
+
+@functools.lru_cache(maxsize=8)
+def _format_second(second: int, format_string: str) -> str:
+    """Format a timestamp to the second, cached as consecutive logs mostly share the same second.
+
+    :param second: The timestamp, in whole seconds.
+    :param format_string: The strftime format.
+
+    :return: The formatted timestamp.
+    """
+    return datetime.fromtimestamp(second).strftime(format_string)
+
+
 class Log:
     """Log object allowing serialization and deserialization, allowing formatting.
 
-    :attr message: The message to log.
+    Logs are slotted records, the level and the label are interned. They are serialized in a compact binary form, also
+    used when pickled so a log is encoded only once when sent in the payload of an ipc message.
+
+    The message may be a template formatted with :meth:`str.format` from positional arguments and the log fields, it is
+    only formatted when first needed, when the log is printed or serialized.
+
+    :attr message: The message to log, formatted.
+    :attr fields: The structured fields of the log.
     :attr level: The log level, one of Logger.DEBUG, Logger.INFO, Logger.WARNING, Logger.ERROR, Logger.CRITICAL.
     :attr label: A label, generally the name of the service or the component that is logging the message.
-    :attr timestamp: The timestamp of the log.
-    :attr printable: Whether the log is printable or not, depending on the log level and the DEBUG environment variable.
+    :attr timestamp: The timestamp of the log, the last occurrence of a repeated log.
+    :attr repeat: The number of occurrences the log stands for, more than one for a repeated log.
+    :attr first_timestamp: The timestamp of the first occurrence of a repeated log.
+    :attr printable: Whether the log is printable or not by default, depending on the log level and the DEBUG
+        environment variable.
 
     :meth dumps: Serialize the log object.
     :meth loads: Deserialize the log object.
+    :meth to_dict: Get the log as a dict.
     """
 
-    def __init__(self, message: str, level: str, label: str):
+    __slots__ = (
+        "_message",
+        "_args",
+        "_fields",
+        "_text",
+        "_level",
+        "_label",
+        "_timestamp",
+        "_repeat",
+        "_first_timestamp",
+    )
+
+    def __init__(self, message: str, level: str, label: str, args: tuple = (), fields: dict = None):
         """Initialize a log object.
 
-        :param message: The message to log.
+        :param message: The message to log, a template if there are arguments or fields.
         :param level: The log level, one of Logger.DEBUG, Logger.INFO, Logger.WARNING, Logger.ERROR, Logger.CRITICAL.
         :param label: A label, generally the name of the service or the component that is logging the message.
+        :param args: The positional arguments of the message template.
+        :param fields: The structured fields of the log, also available to the message template.
         """
 
         # Accessible through properties
         self._message = message
-        self._level = level
-        self._label = label
+        self._args = args
+        self._fields = fields or None
+        #: The formatted message, once formatted.
+        self._text = message if not args and not fields else None
+        self._level = sys.intern(level)
+        self._label = sys.intern(label) if label is not None else None
         self._timestamp = time.time()
+        self._repeat = 1
+        self._first_timestamp = self._timestamp
 
     @property
     def message(self) -> str:
-        """The message to log."""
-        return self._message
+        """The message to log, formatted on first access.
+
+        The arguments are then released and the fields replaced by their JSON values, the log may stay buffered for a
+        while and they can reference costly objects, e.g. an exception with its traceback frames.
+        """
+        # Taken before checking the text, another thread formatting the message sets it before releasing them.
+        args, fields = self._args, self._fields
+        if self._text is None:
+            try:
+                self._text = str(self._message).format(*args, **(fields or {}))
+            except (IndexError, KeyError, ValueError, AttributeError) as e:
+                self._text = f"{self._message} {args} {fields or {}} (format error: {e!r})"
+            self._args = ()
+            if fields:
+                self._fields = {k: _json_field(v) for k, v in fields.items()}
+        return self._text
+
+    @property
+    def fields(self) -> dict:
+        """The structured fields of the log."""
+        return self._fields or {}
 
     @property
     def level(self) -> str:
@@ -92,38 +250,122 @@ class Log:
         """The timestamp of the log."""
         return self._timestamp
 
+    @property
+    def repeat(self) -> int:
+        """The number of occurrences the log stands for, more than one for a repeated log."""
+        return self._repeat
+
+    @property
+    def first_timestamp(self) -> float:
+        """The timestamp of the first occurrence of a repeated log."""
+        return self._first_timestamp
+
     @property
     def printable(self) -> bool:
-        """Whether the log is printable or not, depending on the log level and the DEBUG environment variable."""
-        return self.level != Logger.DEBUG or os.environ.get("DEBUG") == "1"
+        """Whether the log is printable or not by default, depending on the log level and the DEBUG environment
+        variable."""
+        return self._level != Logger.DEBUG or DEBUG_ENABLED
 
     def dumps(self) -> bytes:
         """Serialize the log object.
 
-        Serialization is achieved using pickle.
+        The log is encoded as a fixed size header (timestamp, level code and lengths) followed by the custom level, the
+        label and the message encoded in UTF-8. Repeated logs flag their level code, the header is then followed by the
+        repeat count and the first timestamp. Logs with fields flag their level code too, their fields are encoded in
+        JSON after the message, preceded by their length.
 
         :return: The serialized log object.
         """
-        return pickle.dumps(
-            {"message": self.message, "level": self.level, "label": self.label, "timestamp": self.timestamp}
+        code = _LEVEL_CODES.get(self._level, _LEVEL_CUSTOM)
+        level = self._level.encode() if code == _LEVEL_CUSTOM else b""
+        label = self._label.encode() if self._label is not None else b""
+        message = self.message.encode()
+        repeated = self._repeat > 1
+        fields = b""
+        if self._fields:
+            fields = json.dumps({k: _json_field(v) for k, v in self._fields.items()}).encode()
+
+        if repeated:
+            code |= _REPEATED
+        if fields:
+            code |= _FIELDS
+
+        return b"".join(
+            (
+                _HEADER.pack(
+                    self._timestamp,
+                    code,
+                    len(level),
+                    len(label) if self._label is not None else _NO_LABEL,
+                    len(message),
+                ),
+                _REPEAT.pack(self._repeat, self._first_timestamp) if repeated else b"",
+                level,
+                label,
+                message,
+                _FIELDS_LENGTH.pack(len(fields)) + fields if fields else b"",
+            )
         )
 
     @staticmethod
     def loads(data: bytes) -> "Log":
         """Deserialize the log object.
 
-        Deserialization is achieved using pickle.
-
         :param data: The serialized log object.
 
         :return: The deserialized log object.
         """
+        timestamp, code, level_length, label_length, message_length = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        data = memoryview(data)[offset:]
+
+        repeat, first_timestamp = 1, timestamp
+        if code & _REPEATED:
+            code &= ~_REPEATED
+            repeat, first_timestamp = _REPEAT.unpack_from(data)
+            offset = _REPEAT.size
+            data = data[offset:]
 
-        data = pickle.loads(data)
-        log = Log(message=data["message"], level=data["level"], label=data["label"])
-        log._timestamp = data["timestamp"]
+        has_fields = code & _FIELDS
+        code &= ~_FIELDS
+
+        level = _LEVELS[code] if code != _LEVEL_CUSTOM else str(data[:level_length], "utf-8")
+        data = data[level_length:]
+        label = None
+        if label_length != _NO_LABEL:
+            label = str(data[:label_length], "utf-8")
+            data = data[label_length:]
+
+        log = Log(message=str(data[:message_length], "utf-8"), level=level, label=label)
+        if has_fields:
+            data = data[message_length:]
+            (fields_length,) = _FIELDS_LENGTH.unpack_from(data)
+            offset = _FIELDS_LENGTH.size
+            end = offset + fields_length
+            log._fields = json.loads(bytes(data[offset:end]))
+        log._timestamp = timestamp
+        log._repeat = repeat
+        log._first_timestamp = first_timestamp
         return log
 
+    def __reduce__(self):
+        return Log.loads, (self.dumps(),)
+
+    def to_dict(self) -> dict:
+        """Get the log as a dict.
+
+        :return: The message, fields, level, label, timestamp, repeat count and first timestamp of the log.
+        """
+        return {
+            "message": self.message,
+            "fields": {k: _json_field(v) for k, v in self._fields.items()} if self._fields else {},
+            "level": self._level,
+            "label": self._label,
+            "timestamp": self._timestamp,
+            "repeat": self._repeat,
+            "first_timestamp": self._first_timestamp,
+        }
+
     def __str__(self):
         color = ""
         match self.level:
@@ -138,13 +380,173 @@ class Log:
             case Logger.CRITICAL:
                 color = Colors.RED + Colors.BOLD
 
+        repeat = ""
+        if self.repeat > 1:
+            repeat = f" (x{self.repeat} since {_format_second(int(self.first_timestamp), '%H:%M:%S')})"
+
         return (
-            f"{Colors.RESET}{datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')} "
+            f"{Colors.RESET}{_format_second(int(self.timestamp), '%Y-%m-%d %H:%M:%S')} "
             f"{Colors.PURPLE + Colors.BOLD + Colors.UNDERLINE}{self.label}{Colors.RESET + color + Colors.BOLD}"
-            f" {self.level}{Colors.RESET}{color}: {self.message}{Colors.RESET}\n"
+            f" {self.level}{Colors.RESET}{color}: {self.message}{repeat}{Colors.RESET}\n"
         )
 
 
+class StdoutSink:
+    """Stdout sink writing log records from a background thread, so logging never waits for the terminal or the
+    container log driver.
+
+    Records are queued in a bounded buffer, the oldest ones are dropped when it is full, and written in batches with a
+    single write and flush per batch. They are formatted on the writer thread, in the colored human format or as
+    newline delimited JSON.
+
+    :cvar HUMAN: Colored human format.
+    :cvar JSON: Newline delimited JSON format.
+
+    :attr dropped: The number of records dropped.
+
+    :meth write: Queue a record.
+    :meth flush: Write every queued record now.
+    :meth stop: Write the queued records and stop the writer thread.
+    """
+
+    HUMAN: str = "human"
+    JSON: str = "json"
+
+    def __init__(self, output_format: str = None, max_buffer_size: int = 10000):
+        """Create a stdout sink, its writer thread is started on the first record.
+
+        :param output_format: The format, StdoutSink.HUMAN or StdoutSink.JSON, defaults to the LOG_FORMAT environment
+            variable.
+        :param max_buffer_size: The maximum number of queued records.
+
+        :raises ValueError: If the format is unknown.
+        """
+        output_format = output_format if output_format is not None else LOG_FORMAT
+        if output_format not in (StdoutSink.HUMAN, StdoutSink.JSON):
+            raise ValueError(
+                f"Invalid log format: {output_format}, expected one of {StdoutSink.HUMAN, StdoutSink.JSON}."
+            )
+
+        self._format = self._human if output_format == StdoutSink.HUMAN else self._json
+
+        #: The queued records.
+        self._buffer = collections.deque(maxlen=max_buffer_size)
+        #: Condition guarding the buffer, notified when records are queued.
+        self._condition = threading.Condition()
+        #: Lock serializing the writes, so batches are written in order.
+        self._write_lock = threading.Lock()
+        #: The writer thread, started on the first record.
+        self._writer_thread = None
+        #: Whether the sink is stopped, records are then written on the calling thread.
+        self._stopped = False
+
+        # Accessible through property
+        self._dropped = 0
+
+    @property
+    def dropped(self) -> int:
+        """The number of records dropped because the buffer was full."""
+        return self._dropped
+
+    @staticmethod
+    def _human(log: Log) -> str:
+        """Format a record in the colored human format.
+
+        :param log: The record.
+
+        :return: The formatted record.
+        """
+        return str(log)
+
+    @staticmethod
+    def _json(log: Log) -> str:
+        """Format a record as a JSON line, with an ISO 8601 local time.
+
+        :param log: The record.
+
+        :return: The formatted record.
+        """
+        record = log.to_dict()
+        timestamp = log.timestamp
+        record["time"] = f"{_format_second(int(timestamp), '%Y-%m-%dT%H:%M:%S')}.{int(timestamp % 1 * 1000):03d}"
+        return json.dumps(record) + "\n"
+
+    def write(self, log: Log) -> None:
+        """Queue a record to be written by the writer thread, or write it right away if the sink is stopped.
+
+        :param log: The record.
+        """
+        with self._condition:
+            if not self._stopped:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._dropped += 1
+                self._buffer.append(log)
+
+                if self._writer_thread is None:
+                    self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+                    self._writer_thread.start()
+                if len(self._buffer) == 1:
+                    self._condition.notify()
+                return
+
+        self._write([log])
+
+    def _write(self, logs: typing.List[Log]) -> None:
+        """Write records to stdout with a single write and flush.
+
+        :param logs: The records.
+        """
+        try:
+            text = "".join([self._format(log) for log in logs])
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        except Exception:
+            # Nowhere left to report it, the records are lost
+            self._dropped += len(logs)
+
+    def _write_batch(self) -> bool:
+        """Write the queued records.
+
+        :return: True if records were written, False if the buffer was empty.
+        """
+        with self._write_lock:
+            with self._condition:
+                logs = list(self._buffer)
+                self._buffer.clear()
+
+            if not logs:
+                return False
+            self._write(logs)
+            return True
+
+    def _writer(self) -> None:
+        """Write the queued records in batches until the sink is stopped."""
+        while True:
+            with self._condition:
+                if not self._buffer and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+            self._write_batch()
+
+    def flush(self) -> None:
+        """Write every queued record now, on the calling thread."""
+        while self._write_batch():
+            pass
+
+    def stop(self) -> None:
+        """Write the queued records and stop the writer thread, the records written afterward are written on the calling
+        thread."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        if self._writer_thread is not None and self._writer_thread is not threading.current_thread():
+            self._writer_thread.join()
+        self.flush()
+
+
 class Logger:
     """Logger class, allowing to log messages to ipc and to pretty print them to stdout.
 
@@ -154,7 +556,20 @@ class Logger:
     :cvar ERROR: Error log level.
     :cvar CRITICAL: Critical log level.
 
+    :cvar DROP_OLDEST: Overflow policy dropping the oldest queued log records.
+    :cvar DROP_NEWEST: Overflow policy dropping the new log records.
+    :cvar BLOCK: Overflow policy blocking the logging thread until there is room in the queue.
+
+    :attr dropped: The number of log records dropped.
+    :attr deduplicated: The number of log records collapsed into repeated log records.
+    :attr thresholds: The default and per label thresholds.
+
+    :meth enabled: Check whether the records of a level and a label are logged.
+    :meth configure: Change the thresholds.
+    :meth recent: Get the recent log records.
     :meth log: Log a message to stdout and to ipc system as "log.{level}.{label}" route.
+    :meth flush: Publish every queued log record now.
+    :meth stop: Flush the queued log records and stop the flusher thread.
     :meth debug: Log a message to stdout and to ipc system as "log.DEBUG.{label}" route.
     :meth info: Log a message to stdout and to ipc system as "log.INFO.{label}" route.
     :meth warning: Log a message to stdout and to ipc system as "log.WARNING.{label}" route.
@@ -168,33 +583,377 @@ class Logger:
     ERROR: str = "ERROR"
     CRITICAL: str = "CRITICAL"
 
-    def __init__(self, ipc_node: abstracts.IIpcNode):
+    DROP_OLDEST: str = "drop_oldest"
+    DROP_NEWEST: str = "drop_newest"
+    BLOCK: str = "block"
+
+    def __init__(
+        self,
+        ipc_node: abstracts.IIpcNode,
+        max_queue_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.02,
+        overflow: str = DROP_OLDEST,
+        dedup_window: float = 10.0,
+        level: str = None,
+        recent_size: int = 2000,
+        sink: StdoutSink = None,
+    ):
         """Initialize a logger object.
 
+        Log records are not sent on the logging thread, they are queued and published by a background flusher thread
+        in batches, one message per channel holding the :class:`Log` records of the batch sent to it.
+
+        Identical records, same channel and same message, are deduplicated: the first one is logged, the following ones
+        logged within the dedup window are collapsed into a single repeated record, logged when the window ends, holding
+        their count and their first and last timestamps. An error loop logs at most two records per window.
+
+        Records below the threshold of their label are neither built, printed nor published. Thresholds are held in
+        memory and can be changed at runtime with :meth:`configure`, through the "log:config" route of the ipc node.
+
+        The recent records are kept in a fixed size ring buffer, a preallocated list of slots holding the records
+        themselves, so they can be retrieved with :meth:`recent` after an incident, through the "log:recent" route.
+
         :param ipc_node: The ipc node to use to send messages to ipc system.
+        :param max_queue_size: The maximum number of queued log records.
+        :param batch_size: The maximum number of log records published at once, a full batch is published right away.
+        :param flush_interval: The time in seconds queued log records wait for a batch to fill up.
+        :param overflow: The overflow policy when the queue is full, one of Logger.DROP_OLDEST, Logger.DROP_NEWEST,
+            Logger.BLOCK.
+        :param dedup_window: The time in seconds identical records are collapsed for, 0 to disable the deduplication.
+        :param level: The default threshold, defaults to Logger.DEBUG if the DEBUG environment variable is set and to
+            Logger.INFO otherwise.
+        :param recent_size: The number of recent records kept, 0 to disable the ring buffer.
+        :param sink: The stdout sink the records are printed with, defaults to a sink in the LOG_FORMAT format.
         """
 
         self._ipc_node = ipc_node
 
-    def log(self, message: str, label: str = None, level: str = INFO, extra_channel: str = None) -> None:
+        self._max_queue_size = max_queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._overflow = overflow
+        self._dedup_window = dedup_window
+        self._sink = sink if sink is not None else StdoutSink()
+
+        #: The default threshold, as a level rank.
+        self._threshold = _LEVEL_CODES[level if level is not None else Logger.DEBUG if DEBUG_ENABLED else Logger.INFO]
+        #: The thresholds by label, as level ranks. Replaced on change, never mutated, so it is read without lock.
+        self._label_thresholds = {}
+
+        #: The recent records ring buffer slots, guarded by the condition.
+        self._recent = [None] * recent_size
+        #: The number of records written to the ring buffer, the next slot is at this index modulo its size.
+        self._recent_count = 0
+
+        #: The queued log records, as (channel, log).
+        self._queue = collections.deque()
+        #: Condition guarding the queue, notified when records are queued or dequeued.
+        self._condition = threading.Condition()
+        #: Lock serializing the batches publication, so they are published in order.
+        self._flush_lock = threading.Lock()
+        #: The flusher thread, started on the first log.
+        self._flusher_thread = None
+        #: Whether the logger is stopped, records are no longer published once stopped.
+        self._stopped = False
+        #: The deduplication windows by (channel, message), as [window end, channel, repeated log or None], guarded by
+        #: the condition.
+        self._repeats = {}
+
+        # Accessible through properties
+        self._dropped = 0
+        self._deduplicated = 0
+
+    @property
+    def dropped(self) -> int:
+        """The number of log records dropped, because the queue was full or the logger stopped."""
+        return self._dropped
+
+    @property
+    def deduplicated(self) -> int:
+        """The number of log records collapsed into repeated log records."""
+        return self._deduplicated
+
+    @property
+    def thresholds(self) -> dict:
+        """The default and per label thresholds, as {"level": level, "labels": {label: level}}."""
+        return {
+            "level": _LEVELS[self._threshold],
+            "labels": {label: _LEVELS[rank] for label, rank in self._label_thresholds.items()},
+        }
+
+    def enabled(self, level: str, label: str = None) -> bool:
+        """Check whether the records of a level and a label are logged, custom levels always are.
+
+        :param level: The log level.
+        :param label: The log label.
+
+        :return: True if the records are logged, False if they are below the threshold.
+        """
+        return _LEVEL_CODES.get(level, _CUSTOM_RANK) >= self._label_thresholds.get(label, self._threshold)
+
+    def configure(self, level: str = None, labels: typing.Dict[str, typing.Optional[str]] = None, reset: bool = False):
+        """Change the thresholds.
+
+        :param level: The new default threshold, unchanged if None.
+        :param labels: The new thresholds by label, a None threshold resets the label to the default threshold.
+        :param reset: Whether to reset every label to the default threshold first.
+
+        :raises ValueError: If a threshold is not a standard log level.
+        """
+        for threshold in ([level] if level is not None else []) + [t for t in (labels or {}).values() if t is not None]:
+            if threshold not in _LEVEL_CODES:
+                raise ValueError(f"Invalid log threshold: {threshold}, expected one of {_LEVELS}.")
+
+        label_thresholds = {} if reset else dict(self._label_thresholds)
+        for label, threshold in (labels or {}).items():
+            if threshold is None:
+                label_thresholds.pop(label, None)
+            else:
+                label_thresholds[label] = _LEVEL_CODES[threshold]
+
+        if level is not None:
+            self._threshold = _LEVEL_CODES[level]
+        self._label_thresholds = label_thresholds
+
+    def recent(
+        self,
+        levels: typing.Iterable[str] = None,
+        labels: typing.Iterable[str] = None,
+        start: float = None,
+        end: float = None,
+        limit: int = None,
+    ) -> typing.List[Log]:
+        """Get the recent log records from the ring buffer.
+
+        :param levels: Only the records of these levels.
+        :param labels: Only the records of these labels.
+        :param start: Only the records from this timestamp.
+        :param end: Only the records until this timestamp.
+        :param limit: Only the latest records up to this number.
+
+        :return: The records, oldest first.
+        """
+        with self._condition:
+            size = len(self._recent)
+            if self._recent_count <= size:
+                logs = self._recent[: self._recent_count]
+            else:
+                index = self._recent_count % size
+                logs = self._recent[index:] + self._recent[:index]
+
+        levels = set(levels) if levels is not None else None
+        labels = set(labels) if labels is not None else None
+        logs = [
+            log
+            for log in logs
+            if (levels is None or log.level in levels)
+            and (labels is None or log.label in labels)
+            and (start is None or log.timestamp >= start)
+            and (end is None or log.first_timestamp <= end)
+        ]
+        return logs[-limit:] if limit else logs
+
+    def log(
+        self,
+        message: str,
+        label: str = None,
+        level: str = INFO,
+        extra_channel: str = None,
+        args: tuple = (),
+        fields: dict = None,
+    ) -> None:
         """Log a message to stdout and to ipc system as "log.{level}.{label}" route.
 
-        :param str message: The message to log.
+        The message is formatted with :meth:`str.format` from the arguments and the fields only when the record is
+        printed or serialized, pass a template rather than an f-string so records nobody consumes are never formatted.
+        Records below the threshold of their label are dropped before being built.
+
+        :param str message: The message to log, a template if there are arguments or fields.
         :param str label: A label, generally the name of the service or the component that is logging the message.
         :param str level: The log level, e.g Logger.DEBUG, Logger.INFO, Logger.WARNING, Logger.ERROR, Logger.CRITICAL.
         :param str extra_channel: An additional extra channel that will be appended to the channel, for example, if I
         give `a:b:c` as extra channel, the message will be sent to `log:{level}:{label}:a:b:c` channel, defaults to ""
         (resulting in `log:{level}:{label}` route).
+        :param tuple args: The positional arguments of the message template, see :class:`Lazy` for costly ones.
+        :param dict fields: The structured fields of the record, also available to the message template.
         """
+        if not self.enabled(level, label):
+            return
+
         channel = f"log:{level}:{label}:{extra_channel}" if extra_channel else f"log:{level}:{label}"
 
-        log = Log(message, level, label)
-        self._ipc_node.send(channel, log.dumps(), loopback=True, _nolog=True)
+        log = Log(message, level, label, args, fields)
+        if self._dedup_window > 0 and self._deduplicate(channel, message, log):
+            return
+        self._emit(channel, log)
+
+    def _emit(self, channel: str, log: Log) -> None:
+        """Queue a log record and print it through the stdout sink.
+
+        :param channel: The channel to publish the log record on.
+        :param log: The log record.
+        """
+        self._enqueue(channel, log)
+        self._sink.write(log)
+
+    def _deduplicate(self, channel: str, message: str, log: Log) -> bool:
+        """Collapse a log record into the repeated record of its deduplication window, if it is open.
+
+        :param channel: The channel of the log record.
+        :param message: The message template of the log record.
+        :param log: The log record.
+
+        :return: True if the record was collapsed, False if it opened a new window and must be logged.
+        """
+        key = (channel, message)
+        with self._condition:
+            window = self._repeats.get(key)
+            if window is not None and log.timestamp < window[0]:
+                repeated = window[2]
+                if repeated is None:
+                    window[2] = log
+                    # Wake the flusher up so it logs the repeated record when the window ends
+                    self._condition.notify_all()
+                else:
+                    repeated._repeat += 1
+                    repeated._timestamp = log.timestamp
+                self._deduplicated += 1
+                return True
+
+            self._repeats[key] = [log.timestamp + self._dedup_window, channel, None]
+
+        if window is not None and window[2] is not None:
+            self._emit(channel, window[2])
+        return False
+
+    def _close_windows(self, now: float) -> typing.Optional[float]:
+        """Log the repeated records of the deduplication windows ended at the given time and forget these windows.
+
+        :param now: The current timestamp.
+
+        :return: The time in seconds until the next window with a repeated record ends, None if there is none.
+        """
+        ended = []
+        timeout = None
+        with self._condition:
+            for key, (end, channel, repeated) in list(self._repeats.items()):
+                if end <= now:
+                    del self._repeats[key]
+                    if repeated is not None:
+                        ended.append((channel, repeated))
+                elif repeated is not None:
+                    timeout = end - now if timeout is None else min(timeout, end - now)
+
+        for channel, repeated in ended:
+            self._emit(channel, repeated)
+        return timeout
+
+    def _enqueue(self, channel: str, log: Log) -> None:
+        """Queue a log record for the flusher thread, applying the overflow policy if the queue is full.
+
+        :param channel: The channel to publish the log record on.
+        :param log: The log record.
+        """
+        with self._condition:
+            # Kept even if the record is dropped afterward
+            if self._recent:
+                self._recent[self._recent_count % len(self._recent)] = log
+                self._recent_count += 1
+
+            if self._stopped:
+                self._dropped += 1
+                return
+
+            while len(self._queue) >= self._max_queue_size:
+                # The flusher thread logs the repeated records, it can not wait for itself to make room
+                if self._overflow == Logger.BLOCK and threading.current_thread() is not self._flusher_thread:
+                    self._condition.wait()
+                elif self._overflow == Logger.DROP_OLDEST:
+                    self._queue.popleft()
+                    self._dropped += 1
+                else:
+                    self._dropped += 1
+                    return
+
+            self._queue.append((channel, log))
+
+            if self._flusher_thread is None:
+                self._flusher_thread = threading.Thread(target=self._flusher, daemon=True)
+                self._flusher_thread.start()
+            if len(self._queue) == 1 or len(self._queue) >= self._batch_size:
+                self._condition.notify_all()
+
+    def _publish_batch(self) -> bool:
+        """Publish a batch of queued log records, one message per channel.
+
+        :return: True if a batch was published, False if the queue was empty.
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self._batch_size))]
+                self._condition.notify_all()
+
+            if not batch:
+                return False
+
+            channels = {}
+            for channel, log in batch:
+                channels.setdefault(channel, []).append(log)
+
+            for channel, logs in channels.items():
+                try:
+                    self._ipc_node.send(channel, {"logs": logs}, loopback=True, _nolog=True)
+                except Exception as e:
+                    # The logger can not log its own failures through ipc, they are only printed
+                    self._dropped += len(logs)
+                    self._sink.write(
+                        Log(
+                            "Failed to publish {} log records on {}: {}",
+                            Logger.ERROR,
+                            "logger",
+                            (len(logs), channel, e),
+                        )
+                    )
+            return True
+
+    def _flusher(self) -> None:
+        """Publish the queued log records in batches, once a batch is full or after the flush interval, and log the
+        repeated records when their deduplication window ends."""
+        while True:
+            timeout = self._close_windows(time.time())
+            with self._condition:
+                if not self._queue and not self._stopped:
+                    self._condition.wait(timeout)
+                if 0 < len(self._queue) < self._batch_size and not self._stopped:
+                    self._condition.wait(self._flush_interval)
+                if self._stopped:
+                    return
+
+            self._publish_batch()
+
+    def flush(self) -> None:
+        """Publish and print every queued log record now, on the calling thread."""
+        while self._publish_batch():
+            pass
+        self._sink.flush()
+
+    def stop(self) -> None:
+        """Log the pending repeated records, flush the queued log records and stop the flusher thread, the records
+        logged afterward are only printed."""
+        self._close_windows(float("inf"))
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
 
-        if log.printable:
-            print(log, flush=True, end="")
+        if self._flusher_thread is not None and self._flusher_thread is not threading.current_thread():
+            self._flusher_thread.join()
+        self.flush()
+        self._sink.stop()
 
-    def debug(self, message: str, label: str = None, extra_channel: str = None) -> None:
+    def debug(
+        self, message: str, label: str = None, extra_channel: str = None, args: tuple = (), fields: dict = None
+    ) -> None:
         """Log a message to stdout and to ipc system as "log.DEBUG.{label}" route.
 
         :param str message: The message to log.
@@ -202,10 +961,14 @@ class Logger:
         :param str extra_channel: An additional extra channel that will be appended to the channel, for example, if I
         give `a:b:c` as extra channel, the message will be sent to `log.DEBUG:{label}:a:b:c` channel, defaults to ""
         (resulting in `log.DEBUG:{label}` route).
+        :param tuple args: The positional arguments of the message template.
+        :param dict fields: The structured fields of the record, also available to the message template.
         """
-        self.log(message, label, Logger.DEBUG, extra_channel)
+        self.log(message, label, Logger.DEBUG, extra_channel, args, fields)
 
-    def info(self, message: str, label: str = None, extra_channel: str = None) -> None:
+    def info(
+        self, message: str, label: str = None, extra_channel: str = None, args: tuple = (), fields: dict = None
+    ) -> None:
         """Log a message to stdout and to ipc system as "log.INFO.{label}" route.
 
         :param str message: The message to log.
@@ -213,10 +976,14 @@ class Logger:
         :param str extra_channel: An additional extra channel that will be appended to the channel, for example, if I
         give `a:b:c` as extra channel, the message will be sent to `log.INFO:{label}:a:b:c` channel, defaults to ""
         (resulting in `log.INFO:{label}` route).
+        :param tuple args: The positional arguments of the message template.
+        :param dict fields: The structured fields of the record, also available to the message template.
         """
-        self.log(message, label, Logger.INFO, extra_channel)
+        self.log(message, label, Logger.INFO, extra_channel, args, fields)
 
-    def warning(self, message: str, label: str = None, extra_channel: str = None) -> None:
+    def warning(
+        self, message: str, label: str = None, extra_channel: str = None, args: tuple = (), fields: dict = None
+    ) -> None:
         """Log a message to stdout and to ipc system as "log.WARNING.{label}" route.
 
         :param str message: The message to log.
@@ -224,10 +991,14 @@ class Logger:
         :param str extra_channel: An additional extra channel that will be appended to the channel, for example, if I
         give `a:b:c` as extra channel, the message will be sent to `log.WARNING:{label}:a:b:c` channel, defaults to ""
         (resulting in `log.WARNING:{label}` route).
+        :param tuple args: The positional arguments of the message template.
+        :param dict fields: The structured fields of the record, also available to the message template.
         """
-        self.log(message, label, Logger.WARNING, extra_channel)
+        self.log(message, label, Logger.WARNING, extra_channel, args, fields)
 
-    def error(self, message: str, label: str = None, extra_channel: str = None) -> None:
+    def error(
+        self, message: str, label: str = None, extra_channel: str = None, args: tuple = (), fields: dict = None
+    ) -> None:
         """Log a message to stdout and to ipc system as "log.ERROR.{label}" route.
 
         :param str message: The message to log.
@@ -235,10 +1006,14 @@ class Logger:
         :param str extra_channel: An additional extra channel that will be appended to the channel, for example, if I
         give `a:b:c` as extra channel, the message will be sent to `log.ERROR:{label}:a:b:c` channel, defaults to ""
         (resulting in `log.ERROR:{label}` route).
+        :param tuple args: The positional arguments of the message template.
+        :param dict fields: The structured fields of the record, also available to the message template.
         """
-        self.log(message, label, Logger.ERROR, extra_channel)
+        self.log(message, label, Logger.ERROR, extra_channel, args, fields)
 
-    def critical(self, message: str, label: str = None, extra_channel: str = None) -> None:
+    def critical(
+        self, message: str, label: str = None, extra_channel: str = None, args: tuple = (), fields: dict = None
+    ) -> None:
         """Log a message to stdout and to ipc system as "log.CRITICAL.{label}" route.
 
         :param str message: The message to log.
@@ -246,5 +1021,7 @@ class Logger:
         :param str extra_channel: An additional extra channel that will be appended to the channel, for example, if I
         give `a:b:c` as extra channel, the message will be sent to `log.CRITICAL:{label}:a:b:c` channel, defaults to ""
         (resulting in `log.CRITICAL:{label}` route).
+        :param tuple args: The positional arguments of the message template.
+        :param dict fields: The structured fields of the record, also available to the message template.
         """
-        self.log(message, label, Logger.CRITICAL, extra_channel)
+        self.log(message, label, Logger.CRITICAL, extra_channel, args, fields)
@@ -0,0 +1,298 @@
+"""Optional distributed latency tracing across IPC hops.
+
+A trace is started with :meth:`trace`, the trace context is then propagated automatically in the :class:`CallData
+<utilities.ipc.CallData>` of every message sent while it is active, including the follow-up messages sent by the route
+handlers receiving them. Timed operations are reported as :class:`Span` on the `trace:span` channel to be collected by
+the tracer component.
+
+Timestamps are taken from :func:`time.monotonic`, shared by every process of the host.
+
+:class:`TraceContext` trace context propagated in the call data.
+
+:class:`Span` timed operation of a trace.
+
+:meth:`current` get the trace context active on the current thread.
+:meth:`activate` activate a trace context on the current thread.
+:meth:`span` time an operation as a span of the active trace.
+:meth:`trace` start a new trace.
+:meth:`record` report an already timed operation as a span.
+"""
+import contextlib
+import os
+import threading
+import time
+import typing
+import uuid
+
+
+#: Whether tracing is enabled, traces are only started if set.
+ENABLED = os.environ.get("NEMESIS_TRACING") == "1"
+
+#: The channel spans are reported on.
+SPAN_CHANNEL = "trace:span"
+
+# Trace context active on the current thread.
+_local = threading.local()
+
+
+def _new_id() -> str:
+    """Generate a new trace or span id."""
+    return uuid.uuid4().hex[:16]
+
+
+class TraceContext:
+    """Trace context propagated in the call data.
+
+    :attr:`trace_id` The trace id.
+    :attr:`span_id` The id of the span active when the message was sent, parent of the spans of the receivers.
+    :attr:`sent` The monotonic timestamp the message was sent at, None for a local context.
+
+    :meth:`for_send` Get the context to propagate in a message sent now.
+    :meth:`dumps` Serialize the context into a tuple.
+    :meth:`loads` Deserialize the context from a tuple.
+    """
+
+    def __init__(self, trace_id: str, span_id: str, sent: typing.Union[float, None] = None):
+        """Create a new trace context.
+
+        :param trace_id: The trace id.
+        :param span_id: The id of the active span.
+        :param sent: The monotonic timestamp the message was sent at, defaults to None.
+        """
+        # Accessible through properties to ensure immutability.
+        self._trace_id = trace_id
+        self._span_id = span_id
+        self._sent = sent
+
+    @property
+    def trace_id(self) -> str:
+        """The trace id."""
+        return self._trace_id
+
+    @property
+    def span_id(self) -> str:
+        """The id of the span active when the message was sent."""
+        return self._span_id
+
+    @property
+    def sent(self) -> typing.Union[float, None]:
+        """The monotonic timestamp the message was sent at."""
+        return self._sent
+
+    def for_send(self) -> "TraceContext":
+        """Get the context to propagate in a message sent now.
+
+        :return: The context stamped with the current monotonic timestamp.
+        """
+        return TraceContext(self._trace_id, self._span_id, time.monotonic())
+
+    def dumps(self) -> tuple:
+        """Serialize the context into a tuple."""
+        return self._trace_id, self._span_id, self._sent
+
+    @staticmethod
+    def loads(data: typing.Union[tuple, None]) -> typing.Union["TraceContext", None]:
+        """Deserialize the context from a tuple.
+
+        :param data: The serialized context or None.
+
+        :return: The context or None.
+        """
+        return TraceContext(*data) if data is not None else None
+
+    def __str__(self):
+        return f"TraceContext(trace_id={self._trace_id}, span_id={self._span_id}, sent={self._sent})"
+
+
+class Span:
+    """Timed operation of a trace.
+
+    :attr:`name` The span name, e.g. the channel or the handler name.
+    :attr:`category` The span category, e.g. "ipc" for transport or "handler" for a route handler.
+    :attr:`node` The ipc node id the operation ran on.
+    :attr:`trace_id` The trace id.
+    :attr:`span_id` The span id.
+    :attr:`parent_id` The parent span id, None for the root span.
+    :attr:`start` The start monotonic timestamp.
+    :attr:`end` The end monotonic timestamp.
+    :attr:`thread` The thread id the operation ran on.
+
+    :meth:`dumps` Serialize the span into a dict.
+    :meth:`loads` Deserialize the span from a dict.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        category: str,
+        node: str,
+        trace_id: str,
+        span_id: str,
+        parent_id: typing.Union[str, None],
+        start: float,
+        end: float,
+        thread: int = 0,
+    ):
+        """Create a new span.
+
+        :param name: The span name.
+        :param category: The span category.
+        :param node: The ipc node id the operation ran on.
+        :param trace_id: The trace id.
+        :param span_id: The span id.
+        :param parent_id: The parent span id.
+        :param start: The start monotonic timestamp.
+        :param end: The end monotonic timestamp.
+        :param thread: The thread id the operation ran on, defaults to 0.
+        """
+        self.name = name
+        self.category = category
+        self.node = node
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = start
+        self.end = end
+        self.thread = thread
+
+    def dumps(self) -> dict:
+        """Serialize the span into a dict."""
+        return {
+            "name": self.name,
+            "category": self.category,
+            "node": self.node,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "thread": self.thread,
+        }
+
+    @staticmethod
+    def loads(data: dict) -> "Span":
+        """Deserialize the span from a dict.
+
+        :param data: The serialized span.
+
+        :return: The span.
+        """
+        return Span(**data)
+
+
+def current() -> typing.Union[TraceContext, None]:
+    """Get the trace context active on the current thread.
+
+    :return: The active context or None if no trace is active.
+    """
+    return getattr(_local, "context", None)
+
+
+@contextlib.contextmanager
+def activate(context: typing.Union[TraceContext, None]) -> typing.Iterator[None]:
+    """Activate a trace context on the current thread, the previous context is restored on exit.
+
+    :param context: The context to activate.
+    """
+    previous = current()
+    _local.context = context
+    try:
+        yield
+    finally:
+        _local.context = previous
+
+
+def record(
+    ipc_node,
+    name: str,
+    parent: typing.Union[TraceContext, None],
+    start: float,
+    end: typing.Union[float, None] = None,
+    category: str = "handler",
+    span_id: typing.Union[str, None] = None,
+) -> None:
+    """Report an already timed operation as a span of the parent trace, does nothing without parent.
+
+    :param ipc_node: The ipc node reporting the span.
+    :param name: The span name.
+    :param parent: The parent context.
+    :param start: The start monotonic timestamp.
+    :param end: The end monotonic timestamp, defaults to now.
+    :param category: The span category, defaults to "handler".
+    :param span_id: The span id, defaults to a new id.
+    """
+    if parent is None:
+        return
+
+    ipc_node.report_span(
+        Span(
+            name=name,
+            category=category,
+            node=ipc_node.ipc_id,
+            trace_id=parent.trace_id,
+            span_id=span_id or _new_id(),
+            parent_id=parent.span_id,
+            start=start,
+            end=end if end is not None else time.monotonic(),
+            thread=threading.get_ident(),
+        )
+    )
+
+
+@contextlib.contextmanager
+def span(
+    ipc_node, name: str, parent: typing.Union[TraceContext, None] = None, category: str = "handler"
+) -> typing.Iterator[None]:
+    """Time an operation as a span of the parent trace, the span is active while the operation runs so messages sent
+    meanwhile are part of the trace. Does nothing if there is no parent and no active trace.
+
+    :param ipc_node: The ipc node reporting the span.
+    :param name: The span name.
+    :param parent: The parent context, defaults to the active context.
+    :param category: The span category, defaults to "handler".
+    """
+    parent = parent or current()
+    if parent is None:
+        yield
+        return
+
+    span_id = _new_id()
+    start = time.monotonic()
+    with activate(TraceContext(parent.trace_id, span_id)):
+        try:
+            yield
+        finally:
+            record(ipc_node, name, parent, start, category=category, span_id=span_id)
+
+
+@contextlib.contextmanager
+def trace(ipc_node, name: str) -> typing.Iterator[None]:
+    """Start a new trace with a root span, does nothing if tracing is not :data:`ENABLED`.
+
+    :param ipc_node: The ipc node reporting the root span.
+    :param name: The root span name.
+    """
+    if not ENABLED:
+        yield
+        return
+
+    trace_id = _new_id()
+    span_id = _new_id()
+    start = time.monotonic()
+    with activate(TraceContext(trace_id, span_id)):
+        try:
+            yield
+        finally:
+            ipc_node.report_span(
+                Span(
+                    name,
+                    "trace",
+                    ipc_node.ipc_id,
+                    trace_id,
+                    span_id,
+                    None,
+                    start,
+                    time.monotonic(),
+                    threading.get_ident(),
+                )
+            )
@@ -4,7 +4,7 @@ import time
 import traceback
 
 import math
-from utilities import component, ipc, custom_sense_hat as csh
+from utilities import component, ipc, history, custom_sense_hat as csh
 
 
 class SenseHatComponent(component.Component):
@@ -30,6 +30,12 @@ class SenseHatComponent(component.Component):
         self._sens_worker_thread = threading.Thread(target=self._sense_worker, daemon=True)
         #: Is the sense worker data valid or is it emulated data
         self._sense_emulation = False
+        #: The history of the sense hat data, if enabled
+        self._history = history.SensorHistory(
+            "sensors:sense_hat:data",
+            ["roll", "pitch", "yaw", "gyroRoll", "gyroPitch", "gyroYaw", "accelX", "accelY", "accelZ",
+             "compassX", "compassY", "compassZ", "pressure", "temperature", "humidity"]
+        ) if history.ENABLED else None
 
         try:
             self._hat = self._hat_setup()
@@ -43,12 +49,8 @@ class SenseHatComponent(component.Component):
         """
         Update the custom status to sensors:sense_hat:status
         """
-        self.redis.set(
+        self.ipc_node.publish_state(
             "sensors:sense_hat:status",
-            json.dumps(
-                {"sense_hat_worker_alive": self._sense_worker_alive, "sense_hat_emulation": self._sense_emulation}),
-        )
-        self.ipc_node.send(
             "sensors:sense_hat:status",
             {"sense_hat_worker_alive": self._sense_worker_alive, "sense_hat_emulation": self._sense_emulation}
         )
@@ -76,10 +78,15 @@ class SenseHatComponent(component.Component):
             "humidity": raw["humidity"],  # Percentage
         }
 
-        self.ipc_node.send("sensors:sense_hat:data", data)
-        self.redis.set("sensors:sense_hat:data", json.dumps(data))
+        self.ipc_node.publish_state(
+            "sensors:sense_hat:data", "sensors:sense_hat:data", data, history=self._history
+        )
 
     def _update_emulated_sense_data(self):
+        """
+        Update emulated sense hat data when the hat is unavailable, the "replay" profile replays recorded data
+        instead for tests and benchmarks
+        """
         data = self.redis.get("sensors:sense_hat:data")
         if data == b'' or b'inc_pitch' not in data:
             data = {
@@ -91,8 +98,9 @@ class SenseHatComponent(component.Component):
                 'pressure': 1013, 'temperature': 20, 'humidity': 50,
                 # 2 additional fields for emulating purpose
                 'inc_pitch': True, 'inc_roll': True}
-            self.redis.set("sensors:sense_hat:data", json.dumps(data))
-            self.ipc_node.send("sensors:sense_hat:data", data)
+            self.ipc_node.publish_state(
+                "sensors:sense_hat:data", "sensors:sense_hat:data", data, history=self._history
+            )
         else:
             data = json.loads(data)
             data['timestamp'] = time.time()
@@ -112,8 +120,9 @@ class SenseHatComponent(component.Component):
                 data['inc_pitch'] = True
                 data['pitch'] = 0
 
-            self.redis.set("sensors:sense_hat:data", json.dumps(data))
-            self.ipc_node.send("sensors:sense_hat:data", data)
+            self.ipc_node.publish_state(
+                "sensors:sense_hat:data", "sensors:sense_hat:data", data, history=self._history
+            )
 
             time.sleep(0.05)
 
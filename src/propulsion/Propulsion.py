@@ -1,7 +1,7 @@
 import json
 import threading
 
-from utilities import component, ipc
+from utilities import component, ipc, tracing
 import time
 import pigpio
 import os
@@ -36,6 +36,9 @@ class PropulsionComponent(component.Component):
         self.is_armed = False
         self.redis.set("propulsion:armed", int(self.is_armed))
 
+        #: The trace context and monotonic timestamp of the last traced speed update not applied yet
+        self._speed_trace = None
+
     def calibrate(self):
         """
         This method is used to calibrate the ESC.
@@ -104,13 +107,19 @@ class PropulsionComponent(component.Component):
         self.is_armed = False
         self.redis.set("propulsion:armed", int(self.is_armed))
 
-    @ipc.Route(["propulsion:speed"], True).decorator
+    # Speed updates are applied in the order they were received, never concurrently
+    @ipc.Route(["propulsion:speed"], True, ordering_key=ipc.by_channel, max_workers=1).decorator
     def set_speed(self, call_data: ipc.CallData, payload: dict):
         """
         This method is used to set the speed of the ESC
         """
         self.logger.info(f"[ESC] Setting speed to {payload}", self.NAME)
-        self.redis.set("propulsion:speed", json.dumps(payload))
+        with tracing.span(self.ipc_node, "redis:set propulsion:speed"):
+            self.redis.set("propulsion:speed", json.dumps(payload))
+
+        context = tracing.current()
+        if context is not None:
+            self._speed_trace = (context, time.monotonic())
 
     def propulsion_work(self):
         """
@@ -127,6 +136,13 @@ class PropulsionComponent(component.Component):
                     desired_speed = 0
 
                 self.pi.set_servo_pulsewidth(self.ESC_PIN, desired_speed)
+
+                if self._speed_trace is not None:
+                    # Time between the traced speed update and its application by this poll
+                    context, since = self._speed_trace
+                    self._speed_trace = None
+                    tracing.record(self.ipc_node, "propulsion:apply", context, since)
+
                 time.sleep(0.05)
             else:
                 self.pi.set_servo_pulsewidth(self.ESC_PIN, 0)
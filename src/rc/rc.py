@@ -1,4 +1,3 @@
-import json
 import threading
 from typing import Tuple
 
@@ -29,11 +28,7 @@ class RcComponent(component.Component):
         """
         Update the custom status to rc:status
         """
-        self.redis.set(
-            "rc:status",
-            json.dumps({"rc_worker_alive": self._worker_alive}),
-        )
-        self.ipc_node.send("rc:status", {"rc_worker_alive": self._worker_alive})
+        self.ipc_node.publish_state("rc:status", "rc:status", {"rc_worker_alive": self._worker_alive})
 
     @staticmethod
     def _normalize_rc_channel(value: int) -> float:
@@ -44,7 +39,7 @@ class RcComponent(component.Component):
 
     def _update_channels(self, data: Tuple[int]) -> None:
         """
-        Update the rc channels to rc:channels redis key
+        Update the rc channels to rc:channels redis key and publish them on rc:channels
         """
         channels = {
             "ch1": self._normalize_rc_channel(data[2]),
@@ -58,7 +53,7 @@ class RcComponent(component.Component):
             "ch9": self._normalize_rc_channel(data[10]),
             "ch10": self._normalize_rc_channel(data[11]),
         }
-        self.redis.set("rc:channels", json.dumps(channels))
+        self.ipc_node.publish_state("rc:channels", "rc:channels", channels)
 
     def _rc_worker(self) -> None:
         """
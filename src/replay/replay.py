@@ -0,0 +1,192 @@
+import fnmatch
+import os
+import threading
+import time
+import typing
+
+import numpy as np
+
+import flight_recorder.flight_recorder as flight_recorder
+from utilities import component, ipc
+
+
+class ReplayComponent(component.Component):
+    """
+    This component replays the streams recorded by the flight recorder, republishing the samples on their original
+    channels with their original payload shapes (numeric fields only), to benchmark and test the consumers without
+    hardware. Replace the sensor components by this one, see the "replay" profile.
+    Samples of every stream are merged in a fixed order, by reception timestamp then by stream name and sample index, so
+    two replays of a flight publish the same messages in the same order.
+    The speed is a factor of the original rate, 1 replays in real time, N is N times faster, 0 is as fast as possible.
+    A replay is started when the component starts, with the NEMESIS_REPLAY_FLIGHT, NEMESIS_REPLAY_SPEED and
+    NEMESIS_REPLAY_CHANNELS environment variables, and can be restarted with the replay:start route.
+    """
+    NAME = "replay"
+
+    #: The flight replayed when the component starts, a directory of the flight recorder, defaults to the latest flight
+    FLIGHT = os.environ.get("NEMESIS_REPLAY_FLIGHT")
+    #: The replay speed when the component starts
+    SPEED = float(os.environ.get("NEMESIS_REPLAY_SPEED", "1"))
+    #: The patterns of the channels replayed when the component starts, comma separated, setpoints are not replayed by
+    #: default
+    CHANNELS = os.environ.get("NEMESIS_REPLAY_CHANNELS", "sensors:*").split(",")
+
+    #: The channels published as states, their redis key is set too as the sensor components do
+    STATE_CHANNELS = ("sensors:*", "rc:channels")
+
+    def __init__(self, ipc_node: ipc.IpcNode):
+        #: The replay thread and the event stopping it, set before the routes are bound
+        self._replay_thread = None
+        self._replay_stop = threading.Event()
+        #: Lock guarding the replay thread
+        self._replay_lock = threading.Lock()
+
+        super().__init__(ipc_node)
+
+    @ipc.Route(["replay:start"], True).decorator
+    def start_replay(self, call_data: ipc.CallData, payload: dict):
+        """
+        Start a replay, the current one is stopped first
+        Payload:
+         - flight (optional): The flight directory, defaults to the latest flight
+         - speed (optional): The replay speed, defaults to 1
+         - channels (optional): The patterns of the replayed channels, defaults to ["sensors:*"]
+        :return: The number of samples to replay
+        """
+        return self._start(payload.get("flight"), payload.get("speed", 1.0), payload.get("channels", ["sensors:*"]))
+
+    @ipc.Route(["replay:stop"], True).decorator
+    def stop_replay(self, call_data: ipc.CallData, payload: dict):
+        """
+        Stop the current replay
+        """
+        self._stop()
+
+    @staticmethod
+    def load(flight: str, channels: typing.List[str]) -> typing.List[typing.Tuple[str, np.ndarray, dict]]:
+        """
+        Load the streams of a flight
+        :param flight: The flight directory
+        :param channels: The patterns of the channels to load
+        :return: The streams as (channel, samples, index), sorted by stream name
+        """
+        streams = []
+        for name in sorted(os.listdir(flight)):
+            directory = os.path.join(flight, name)
+            if not os.path.isfile(os.path.join(directory, flight_recorder.INDEX_FILE)):
+                continue
+
+            index = flight_recorder.read_index(directory)
+            if any(fnmatch.fnmatchcase(index["channel"], pattern) for pattern in channels):
+                streams.append((index["channel"], flight_recorder.load_stream(directory), index))
+        return streams
+
+    @staticmethod
+    def schedule(streams: typing.List[typing.Tuple[str, np.ndarray, dict]]) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Merge the samples of the streams in the replay order, by reception timestamp then stream and sample index
+        :param streams: The streams, as returned by load
+        :return: The stream indices and the sample indices in the replay order
+        """
+        if not streams:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        timestamps = np.concatenate([samples["t"] for _, samples, _ in streams])
+        stream_indices = np.concatenate([np.full(len(samples), i) for i, (_, samples, _) in enumerate(streams)])
+        sample_indices = np.concatenate([np.arange(len(samples)) for _, samples, _ in streams])
+
+        # lexsort sorts by the last key first, it is stable so the order is fully determined
+        order = np.lexsort((sample_indices, stream_indices, timestamps))
+        return stream_indices[order], sample_indices[order]
+
+    def _start(self, flight: typing.Optional[str], speed: float, channels: typing.List[str]) -> int:
+        """
+        Start a replay, the current one is stopped first
+        :param flight: The flight directory, the latest flight if None
+        :param speed: The replay speed
+        :param channels: The patterns of the replayed channels
+        :return: The number of samples to replay
+        """
+        self._stop()
+
+        if flight is None:
+            flight = flight_recorder.latest_flight(flight_recorder.FlightRecorderComponent.DIRECTORY)
+        if flight is None or not os.path.isdir(flight):
+            self.logger.warning("No flight to replay: {flight}", self.NAME, fields={"flight": flight})
+            return 0
+
+        streams = self.load(flight, channels)
+        stream_indices, sample_indices = self.schedule(streams)
+
+        with self._replay_lock:
+            self._replay_stop = threading.Event()
+            self._replay_thread = threading.Thread(
+                target=self._replay,
+                args=(streams, stream_indices, sample_indices, speed, self._replay_stop),
+                daemon=True,
+            )
+            self._replay_thread.start()
+
+        self.logger.info(
+            "Replaying {samples} samples of {streams} streams from {flight} at speed {speed}",
+            self.NAME,
+            fields={"samples": len(sample_indices), "streams": len(streams), "flight": flight, "speed": speed},
+        )
+        return len(sample_indices)
+
+    def _stop(self) -> None:
+        """
+        Stop the current replay and wait for it
+        """
+        with self._replay_lock:
+            thread = self._replay_thread
+            self._replay_stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _replay(
+        self,
+        streams: typing.List[typing.Tuple[str, np.ndarray, dict]],
+        stream_indices: np.ndarray,
+        sample_indices: np.ndarray,
+        speed: float,
+        stop: threading.Event,
+    ) -> None:
+        """
+        Publish the samples in the replay order, at the replay speed
+        """
+        states = [any(fnmatch.fnmatchcase(channel, p) for p in self.STATE_CHANNELS) for channel, _, _ in streams]
+        self.ipc_node.publish_state("replay:status", "replay:status", {"replaying": True})
+
+        start = time.monotonic()
+        first = None
+        published = 0
+        for stream_index, sample_index in zip(stream_indices.tolist(), sample_indices.tolist()):
+            if stop.is_set():
+                break
+
+            channel, samples, index = streams[stream_index]
+            sample = samples[sample_index]
+
+            if speed > 0:
+                t = sample["t"].item()
+                first = t if first is None else first
+                delay = start + (t - first) / speed - time.monotonic()
+                if delay > 0 and stop.wait(delay):
+                    break
+
+            payload = flight_recorder.unflatten(sample, index["shape"], index["scalar"])
+            if states[stream_index]:
+                self.ipc_node.publish_state(channel, channel, payload)
+            else:
+                self.ipc_node.send(channel, payload)
+            published += 1
+
+        self.ipc_node.publish_state("replay:status", "replay:status", {"replaying": False, "published": published})
+        self.logger.info("Replay ended, {published} samples published", self.NAME, fields={"published": published})
+
+    def start(self):
+        self._start(self.FLIGHT, self.SPEED, self.CHANNELS)
+
+    def stop(self):
+        self._stop()
@@ -1,11 +1,10 @@
 import datetime
-import json
 import random
 import threading
 import typing
 
 import serial
-from utilities import component as component, ipc
+from utilities import component as component, ipc, history
 import time
 
 GNSS_POLL_SLEEP_TIME = 0.05
@@ -131,6 +130,10 @@ class Sim7600Component(component.Component):
         self._gnss_worker_thread = threading.Thread(target=self._gnss_worker, daemon=True)
         #: Is the gnss worker data valid or is it emulated data
         self._gnss_emulation = False
+        #: The history of the gnss data, if enabled
+        self._history = history.SensorHistory(
+            "sensors:sim7600:gnss", ["alt", "speed", "pdop", "hdop", "vdop", "gpsSat", "gloSat", "beiSat"]
+        ) if history.ENABLED else None
 
         try:
             self._sim = Sim7600()
@@ -145,11 +148,8 @@ class Sim7600Component(component.Component):
         """
         Update the custom status to sensors:sim7600:status
         """
-        self.redis.set(
+        self.ipc_node.publish_state(
             "sensors:sim7600:status",
-            json.dumps({"gnss_worker_alive": self._gnss_worker_alive, "gnss_emulation": self._gnss_emulation}),
-        )
-        self.ipc_node.send(
             "sensors:sim7600:status",
             {"gnss_worker_alive": self._gnss_worker_alive, "gnss_emulation": self._gnss_emulation}
         )
@@ -163,10 +163,13 @@ class Sim7600Component(component.Component):
         assert not self._gnss_emulation
         data = self._sim.get_gnss_info()
         if isinstance(data, dict):
-            self.ipc_node.send("sensors:sim7600:gnss", data)
-            self.redis.set("sensors:sim7600:gnss", json.dumps(data))
+            self.ipc_node.publish_state("sensors:sim7600:gnss", "sensors:sim7600:gnss", data, history=self._history)
 
     def _update_emulated_gnss_data(self):
+        """
+        Update emulated GNSS data to sensors:sim7600:gnss when the SIM7600 is unavailable, recorded flights are
+        replayed with the "replay" profile for tests and benchmarks
+        """
         data = {
             "fixMode": 2,
             "gpsSat": 5,
@@ -186,8 +189,7 @@ class Sim7600Component(component.Component):
             "vdop": .7,
         }
 
-        self.redis.set("sensors:sim7600:gnss", json.dumps(data))
-        self.ipc_node.send("sensors:sim7600:gnss", data)
+        self.ipc_node.publish_state("sensors:sim7600:gnss", "sensors:sim7600:gnss", data, history=self._history)
 
     def _gnss_worker(self):
         # Clear eventual previous data
@@ -0,0 +1,107 @@
+import collections
+import json
+import os
+import typing
+
+from utilities import component, ipc, tracing
+
+
+def to_trace_events(spans: typing.List[tracing.Span]) -> dict:
+    """
+    Convert spans to the Chrome trace-event format, each ipc node is displayed as a process and each thread as a track
+    :param spans: The spans to convert
+    :return: The trace-event dict, to be dumped as JSON and loaded in chrome://tracing or https://ui.perfetto.dev
+    """
+    pids: typing.Dict[str, int] = {}
+    events = []
+
+    for span in sorted(spans, key=lambda s: s.start):
+        if span.node not in pids:
+            pids[span.node] = len(pids) + 1
+            events.append({"name": "process_name", "ph": "M", "pid": pids[span.node], "args": {"name": span.node}})
+
+        events.append({
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": span.start * 1e6,
+            "dur": max(span.end - span.start, 0) * 1e6,
+            "pid": pids[span.node],
+            "tid": span.thread,
+            "args": {"trace_id": span.trace_id, "span_id": span.span_id, "parent_id": span.parent_id},
+        })
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class TracerComponent(component.Component):
+    """
+    This component collects the spans reported on trace:span by every ipc node and exports them as Chrome trace-event
+    JSON, showing the end-to-end latency of traced commands broken down per hop.
+    Traces are only started when the NEMESIS_TRACING environment variable is set to 1.
+    """
+    NAME = "tracer"
+
+    #: The maximum number of spans kept, the oldest ones are dropped first
+    MAX_SPANS = 100000
+
+    #: The directory exports are written to, the export route does not write anywhere else
+    DIRECTORY = os.environ.get("NEMESIS_TRACE_DIR", "/app/traces")
+
+    def __init__(self, ipc_node: ipc.IpcNode):
+        #: The collected spans, set before the routes are bound
+        self._spans: typing.Deque[tracing.Span] = collections.deque(maxlen=self.MAX_SPANS)
+
+        super().__init__(ipc_node)
+
+    @ipc.Route([tracing.SPAN_CHANNEL], False).decorator
+    def collect_span(self, call_data: ipc.CallData, payload: dict):
+        """
+        Collect a span reported by an ipc node
+        """
+        self._spans.append(tracing.Span.loads(payload))
+
+    @ipc.Route(["trace:export"], True).decorator
+    def export(self, call_data: ipc.CallData, payload: dict):
+        """
+        Export the collected spans as Chrome trace-event JSON
+        Payload:
+         - trace_id (optional): Only export the spans of this trace
+         - path (optional): Also write the export to this file, relative to DIRECTORY
+        :return: The trace-event dict
+        :raises ValueError: If the path is outside of DIRECTORY
+        """
+        path = None
+        if payload.get("path"):
+            directory = os.path.realpath(self.DIRECTORY)
+            path = os.path.realpath(os.path.join(directory, payload["path"]))
+            if os.path.commonpath([directory, path]) != directory or path == directory:
+                raise ValueError(f"Invalid export path {payload['path']}, must be a file in {self.DIRECTORY}")
+
+        trace_id = payload.get("trace_id")
+        events = to_trace_events([s for s in list(self._spans) if trace_id is None or s.trace_id == trace_id])
+
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(events, f)
+            self.logger.info(
+                "Exported {count} trace events to {path}",
+                self.NAME,
+                fields={"count": len(events["traceEvents"]), "path": path},
+            )
+
+        return events
+
+    @ipc.Route(["trace:clear"], False).decorator
+    def clear(self, call_data: ipc.CallData, payload: dict):
+        """
+        Drop the collected spans
+        """
+        self._spans.clear()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
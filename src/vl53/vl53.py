@@ -1,5 +1,4 @@
 from contextlib import ExitStack
-import json
 import threading
 import time
 import typing
@@ -8,7 +7,7 @@ import adafruit_vl53l0x
 import board
 from digitalio import DigitalInOut
 
-from utilities import component, ipc
+from utilities import component, ipc, history
 
 
 class Vl53Component(component.Component):
@@ -39,6 +38,10 @@ class Vl53Component(component.Component):
         self._first_sensor_emulation = False
         #: Is the second sensor (0x30) data is emulated or not
         self._second_sensor_emulation = False
+        #: The history of the ranges, if enabled
+        self._history = history.SensorHistory(
+            "sensors:vl53:ranges", ["first_range", "second_range"]
+        ) if history.ENABLED else None
 
         #: First sensor
         self._first_vl53 = None
@@ -142,13 +145,8 @@ class Vl53Component(component.Component):
         """
         Update the custom status to sensors:vl53:status
         """
-        self.redis.set(
+        self.ipc_node.publish_state(
             "sensors:vl53:status",
-            json.dumps({"sensing_worker_alive": self._sensing_worker_alive,
-                        "first_sensor_emulation": self._first_sensor_emulation,
-                        "second_sensor_emulation": self._second_sensor_emulation})
-        )
-        self.ipc_node.send(
             "sensors:vl53:status",
             {"sensing_worker_alive": self._sensing_worker_alive,
              "first_sensor_emulation": self._first_sensor_emulation,
@@ -158,7 +156,8 @@ class Vl53Component(component.Component):
     @staticmethod
     def _get_emulated_range(offset: int = 50) -> int:
         """
-        Get emulated range
+        Get emulated range, only meant to keep the component running without hardware, replay recorded ranges with
+        the "replay" profile to test or benchmark the consumers
         :param offset: The offset to add to the range
         """
         return 100 + int((time.time() + 50) % 500)
@@ -203,8 +202,9 @@ class Vl53Component(component.Component):
                         r = self._parse_range(r)
                         data = {"first_range": r, "second_range": r}
 
-                    self.redis.set("sensors:vl53:ranges", json.dumps(data))
-                    self.ipc_node.send("sensors:vl53:ranges", data)
+                    self.ipc_node.publish_state(
+                        "sensors:vl53:ranges", "sensors:vl53:ranges", data, history=self._history
+                    )
 
             except Exception as e:
                 self.logger.error(f"vl53 sensing worker stopped unexpectedly: {e}", self.NAME)
@@ -0,0 +1,286 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from communication.messages import frames
+
+
+# --- Encoding --- #
+@pytest.mark.parametrize("type_name, data", [
+    ("heartbeat", None),
+    ("hello", {"versions": [1, 2]}),
+    ("command", {"route": "state:start:basic", "data": {"component": "basic"}}),
+    ("log", {"message": "message", "level": "INFO", "label": "label"}),
+    ("sensors:vl53:ranges", {"first_range": 100, "second_range": 200}),
+])
+def test_binary_round_trip(type_name, data):
+    frame = frames.decode(frames.encode_binary(type_name, data, 42))
+    assert frame == frames.Frame(type_name, data, frames.SUPPORTED_VERSIONS[-1], 42)
+
+
+def test_binary_sense_hat():
+    data = {"roll": 1.5, "pitch": -2.25, "yaw": 3.0, "compassX": 0.5, "compassY": 0.25, "compassZ": -1.0}
+    encoded = frames.encode_binary("sensors:sense_hat:data", data, 0)
+    # Packed as float32 after the header, not JSON
+    assert len(encoded) == frames.HEADER.size + 6 * 4
+    assert frames.decode(encoded).data == data
+
+    # Missing fields fall back to JSON
+    encoded = frames.encode_binary("sensors:sense_hat:data", {"roll": 1.5}, 0)
+    assert frames.HEADER.unpack_from(encoded)[2] & frames.FLAG_JSON
+    assert frames.decode(encoded).data == {"roll": 1.5}
+
+
+def test_binary_sequence_wraps():
+    assert frames.decode(frames.encode_binary("heartbeat", None, 2 ** 32 + 5)).sequence == 5
+
+
+# --- Legacy fallback --- #
+def test_legacy_round_trip():
+    assert frames.encode_legacy("heartbeat", None) == frames.LEGACY_HEARTBEAT
+    assert frames.decode(frames.LEGACY_HEARTBEAT) == frames.Frame("heartbeat")
+
+    encoded = frames.encode_legacy("sensors:vl53:ranges", {"first_range": 100})
+    assert json.loads(encoded) == {"type": "sensors:vl53:ranges", "data": {"first_range": 100}}
+    assert frames.decode(encoded) == frames.Frame("sensors:vl53:ranges", {"first_range": 100})
+
+
+def test_legacy_command():
+    # Commands of the base station are encoded twice
+    encoded = json.dumps(json.dumps({"route": "state:start:basic", "data": {"component": "basic"}})).encode()
+    frame = frames.decode(encoded)
+    assert frame == frames.Frame("command", {"route": "state:start:basic", "data": {"component": "basic"}})
+    assert frame.version is None and frame.sequence is None
+
+
+# --- Negotiation --- #
+def test_encoder_negotiation():
+    encoder = frames.FrameEncoder()
+    hello = frames.decode(encoder.hello())
+    assert hello == frames.Frame("hello", {"versions": list(frames.SUPPORTED_VERSIONS)})
+
+    # Legacy until the peer answers
+    assert encoder.encode("heartbeat") == frames.LEGACY_HEARTBEAT
+
+    # Unsupported versions keep the legacy format
+    assert not encoder.negotiate(frames.Frame("hello", {"versions": [200]}))
+    assert encoder.version is None
+
+    assert encoder.negotiate(frames.decode(frames.encode_binary("hello", {"versions": [200, 1]}, 0)))
+    assert encoder.version == 1
+    assert [frames.decode(encoder.encode("heartbeat")).sequence for _ in range(3)] == [0, 1, 2]
+
+
+# --- Invalid frames --- #
+def test_decode_unsupported():
+    with pytest.raises(ValueError):
+        frames.decode(b"")
+    with pytest.raises(ValueError):
+        frames.decode(bytes([200]) + bytes(7))
+    with pytest.raises(ValueError):
+        frames.decode(frames.HEADER.pack(1, 999, 0, 0))
+
+
+@pytest.mark.parametrize("frame", [
+    frames.HEADER.pack(1, frames.FrameType.HEARTBEAT, 0, 0)[:5],
+    frames.HEADER.pack(1, frames.FrameType.HELLO, 0, 0),
+    frames.HEADER.pack(1, frames.FrameType.HELLO, 0, 0) + bytes([3, 1]),
+    frames.HEADER.pack(1, frames.FrameType.COMMAND, 0, 0) + b"\x00",
+    frames.HEADER.pack(1, frames.FrameType.COMMAND, 0, 0) + b"\x00\x10route{}",
+    frames.HEADER.pack(1, frames.FrameType.MESSAGE, 0, 0) + b"\x00\x10channel",
+    frames.HEADER.pack(1, frames.FrameType.MESSAGE, 0, 0) + b"\x00\x07channel{",
+    frames.HEADER.pack(1, frames.FrameType.SENSE_HAT, 0, 0) + bytes(10),
+    b'{"data": 1}',
+    b"[1, 2]",
+])
+def test_decode_truncated(frame):
+    with pytest.raises(ValueError):
+        frames.decode(frame)
+
+
+# --- Frame Reader --- #
+class ChunkedSocket:
+    """A socket reading at most chunk bytes per call, to split frames across reads."""
+
+    def __init__(self, sock, chunk):
+        self.sock = sock
+        self.chunk = chunk
+        self.calls = 0
+
+    def recv_into(self, buffer):
+        self.calls += 1
+        return self.sock.recv_into(buffer, min(self.chunk, len(buffer)))
+
+
+@pytest.fixture
+def socket_pair():
+    a, b = socket.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+
+def framed(*payloads):
+    return b"".join(frames.LENGTH.pack(len(p)) + p for p in payloads)
+
+
+def read(reader, count):
+    it = iter(reader)
+    return [bytes(next(it)) for _ in range(count)]
+
+
+def test_frame_reader_burst(socket_pair):
+    payloads = [bytes([i]) * (i + 1) for i in range(100)]
+    socket_pair[0].sendall(framed(*payloads))
+
+    sock = ChunkedSocket(socket_pair[1], 65536)
+    assert read(frames.FrameReader(sock), 100) == payloads
+    # A burst costs a single read
+    assert sock.calls == 1
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 5, 7])
+def test_frame_reader_split(socket_pair, chunk):
+    # Lengths and payloads split across reads, in a buffer too small to hold every frame so partial frames are moved
+    # back to its start
+    payloads = [bytes([i]) * 10 for i in range(50)]
+    socket_pair[0].sendall(framed(*payloads))
+
+    reader = frames.FrameReader(ChunkedSocket(socket_pair[1], chunk), buffer_size=16)
+    assert read(reader, 50) == payloads
+    assert len(reader._buffer) == 16
+
+
+def test_frame_reader_large_frame(socket_pair):
+    payloads = [b"a" * 10, b"b" * 1000, b"c" * 10]
+    socket_pair[0].sendall(framed(*payloads))
+
+    reader = frames.FrameReader(ChunkedSocket(socket_pair[1], 100), buffer_size=16)
+    assert read(reader, 3) == payloads
+    assert len(reader._buffer) >= 1004
+
+
+def test_frame_reader_empty_frames_skipped(socket_pair):
+    socket_pair[0].sendall(framed(b"", b"a", b"", b"b"))
+    assert read(frames.FrameReader(socket_pair[1]), 2) == [b"a", b"b"]
+
+
+def test_frame_reader_errors(socket_pair):
+    socket_pair[0].sendall(frames.LENGTH.pack(frames.MAX_FRAME_SIZE + 1))
+    with pytest.raises(ValueError):
+        read(frames.FrameReader(socket_pair[1]), 1)
+
+    a, b = socket.socketpair()
+    a.sendall(framed(b"a") + b"\x00\x00")
+    a.close()
+    reader = iter(frames.FrameReader(b))
+    assert bytes(next(reader)) == b"a"
+    with pytest.raises(ConnectionError):
+        next(reader)
+    b.close()
+
+
+# --- Frame Writer --- #
+class PartialSocket:
+    """A socket sending at most chunk bytes per sendmsg call, blocked until released."""
+
+    def __init__(self, sock, chunk):
+        self.sock = sock
+        self.chunk = chunk
+        self.calls = 0
+        self.released = threading.Event()
+        self.released.set()
+
+    def sendmsg(self, buffers):
+        self.released.wait(1)
+        self.calls += 1
+        return self.sock.send(b"".join(bytes(b) for b in buffers)[:self.chunk])
+
+
+def test_frame_writer_partial_sends(socket_pair):
+    sock = PartialSocket(socket_pair[0], 7)
+    writer = frames.FrameWriter(sock)
+    payloads = [bytes([i]) * (i % 20 + 1) for i in range(200)]
+    for payload in payloads:
+        assert writer.put(payload)
+
+    # Every frame is received whole and in order
+    socket_pair[1].settimeout(5)
+    assert read(frames.FrameReader(socket_pair[1]), 200) == payloads
+    writer.stop(1)
+
+    metrics = writer.metrics()
+    assert metrics["sent_frames"] == 200
+    assert metrics["sent_bytes"] == len(framed(*payloads))
+    assert metrics["dropped"] == 0 and metrics["queue_depth"] == 0
+
+
+def test_frame_writer_queue_full(socket_pair):
+    sock = PartialSocket(socket_pair[0], 65536)
+    sock.released.clear()
+    writer = frames.FrameWriter(sock, max_queue=4)
+
+    # The first frame is taken by the writer, blocked in sendmsg
+    assert writer.put(b"0")
+    timeout = time.time() + 1
+    while writer.metrics()["queue_depth"] and time.time() < timeout:
+        time.sleep(0.001)
+
+    assert all(writer.put(str(i).encode()) for i in range(1, 5))
+    assert not writer.put(b"5")
+    metrics = writer.metrics()
+    assert (metrics["queue_depth"], metrics["sent_frames"], metrics["dropped"]) == (4, 0, 1)
+
+    sock.released.set()
+    socket_pair[1].settimeout(5)
+    assert read(frames.FrameReader(socket_pair[1]), 5) == [b"0", b"1", b"2", b"3", b"4"]
+    writer.stop(1)
+
+
+def test_frame_writer_stop(socket_pair):
+    sock = PartialSocket(socket_pair[0], 65536)
+    sock.released.clear()
+    writer = frames.FrameWriter(sock)
+    for i in range(10):
+        writer.put(bytes([i]))
+
+    # The queued frames are sent before the writer stops
+    sock.released.set()
+    writer.stop(1)
+    assert not writer._thread.is_alive()
+    assert writer.metrics()["sent_frames"] == 10
+
+    assert not writer.put(b"late")
+    assert writer.metrics()["dropped"] == 1
+
+
+def test_frame_writer_error(socket_pair):
+    errors = []
+    writer = frames.FrameWriter(socket_pair[0], on_error=errors.append)
+    socket_pair[1].close()
+    socket_pair[0].shutdown(socket.SHUT_WR)
+
+    writer.put(b"frame")
+    writer._thread.join(1)
+    assert len(errors) == 1 and isinstance(errors[0], OSError)
+    assert not writer.put(b"frame")
+    assert writer.metrics()["dropped"] == 2
+
+
+def test_frame_writer_rate_samples_bounded(socket_pair):
+    writer = frames.FrameWriter(socket_pair[0])
+    writer.RATE_WINDOW = 0.01
+    socket_pair[1].settimeout(5)
+    reader = iter(frames.FrameReader(socket_pair[1]))
+
+    for _ in range(50):
+        writer.put(b"frame")
+        next(reader)
+        time.sleep(0.001)
+    writer.stop(1)
+
+    # Pruned by the writer, without the metrics being read
+    assert len(writer._rate_samples) < 20
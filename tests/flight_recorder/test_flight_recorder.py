@@ -0,0 +1,135 @@
+import math
+import os
+import time
+import unittest.mock
+from unittest.mock import Mock
+
+import numpy as np
+import pytest
+
+from flight_recorder import flight_recorder
+from utilities import ipc
+
+
+# --- Payloads --- #
+def test_flatten_unflatten():
+    payload = {"roll": 1.5, "armed": True, "ranges": [100, 200], "name": "ignored"}
+    fields = flight_recorder.flatten(payload)
+    assert fields == {"roll": 1.5, "armed": 1.0, "ranges_0": 100.0, "ranges_1": 200.0}
+
+    payload_shape = flight_recorder.shape(payload)
+    sample = np.array([tuple(fields.values())], dtype=[(name, "<f8") for name in fields])[0]
+    assert flight_recorder.unflatten(sample, payload_shape) == {"roll": 1.5, "armed": True, "ranges": (100, 200)}
+
+    # Scalar payloads are recorded as a "value" field
+    assert flight_recorder.flatten(3) == {"value": 3.0}
+    sample = np.array([(3.0,)], dtype=[("value", "<f8")])[0]
+    assert flight_recorder.unflatten(sample, flight_recorder.shape(3), scalar=True) == 3
+
+
+# --- Streams --- #
+def test_stream_chunk_rollover(tmp_path):
+    directory = str(tmp_path / "stream")
+    stream = flight_recorder._Stream(directory, "sensors:test", ["a", "b"], {}, False, chunk_samples=4)
+
+    stream.append([(100.0 + i, {"a": i, "b": 2 * i}) for i in range(3)])
+    # Fills the first chunk, a full one and starts a third one
+    stream.append([(103.0 + i, {"a": 3 + i} if i == 1 else {"a": 3 + i, "b": 6 + 2 * i}) for i in range(7)])
+
+    index = flight_recorder.read_index(directory)
+    assert index == stream.index
+    assert [(c["file"], c["count"], c["start"], c["end"]) for c in index["chunks"]] == [
+        ("00000.npy", 4, 100.0, 103.0),
+        ("00001.npy", 4, 104.0, 107.0),
+        ("00002.npy", 2, 108.0, 109.0),
+    ]
+    assert all(os.path.isfile(os.path.join(directory, c["file"])) for c in index["chunks"])
+
+    samples = flight_recorder.load_stream(directory)
+    assert list(samples["t"]) == [100.0 + i for i in range(10)]
+    assert list(samples["a"]) == list(range(10))
+    # Missing fields are recorded as NaN
+    assert math.isnan(samples["b"][4]) and samples["b"][5] == 10
+
+    stream.close()
+    assert stream.chunk is None
+
+
+def test_load_stream_empty(tmp_path):
+    directory = str(tmp_path / "stream")
+    stream = flight_recorder._Stream(directory, "sensors:test", ["a"], {}, False, chunk_samples=4)
+    stream._write_index()
+
+    samples = flight_recorder.load_stream(directory)
+    assert len(samples) == 0 and samples.dtype.names == ("t", "a")
+
+
+# --- Flight Recorder Component --- #
+@pytest.fixture
+def recorder(tmp_path):
+    with unittest.mock.patch.object(flight_recorder.FlightRecorderComponent, "DIRECTORY", str(tmp_path)):
+        recorder = flight_recorder.FlightRecorderComponent(Mock())
+    yield recorder
+    recorder._writer_alive = False
+    recorder._writer_event.set()
+
+
+def record(recorder, channel, payload):
+    call_data = ipc.CallData(channel, "sender", False, payload)
+    recorder.record.route._wrapped_function(recorder, call_data, payload)
+
+
+def test_recorder_write_pending(recorder):
+    record(recorder, "sensors:vl53:ranges", {"first_range": 100, "second_range": 200})
+    record(recorder, "sensors:vl53:status", "started")
+    record(recorder, "propulsion:speed", 0.5)
+    recorder._write_pending()
+
+    flight = recorder._flight_directory
+    assert sorted(os.listdir(flight)) == ["propulsion.speed", "sensors.vl53.ranges"]
+    index = flight_recorder.read_index(os.path.join(flight, "propulsion.speed"))
+    assert index["scalar"] and index["fields"] == ["value"]
+    assert list(flight_recorder.load_stream(os.path.join(flight, "propulsion.speed"))["value"]) == [0.5]
+
+
+def test_recorder_write_failure(recorder):
+    record(recorder, "sensors:vl53:ranges", {"first_range": 100})
+    record(recorder, "propulsion:speed", 0.5)
+
+    append = flight_recorder._Stream.append
+
+    def failing_append(stream, samples):
+        if stream.channel != "propulsion:speed":
+            raise ValueError("unexpected shape")
+        append(stream, samples)
+
+    # A batch failing does not prevent the other streams from being written
+    with unittest.mock.patch.object(flight_recorder._Stream, "append", autospec=True, side_effect=failing_append):
+        recorder._write_pending()
+
+    recorder.logger.error.assert_called_once()
+    flight = recorder._flight_directory
+    assert len(flight_recorder.load_stream(os.path.join(flight, "propulsion.speed"))) == 1
+
+
+def test_recorder_writer_survives_errors(recorder):
+    recorder.FLUSH_INTERVAL = 0.01
+
+    def write_pending():
+        if mock.call_count == 1:
+            raise TypeError("unexpected shape")
+
+    with unittest.mock.patch.object(recorder, "_write_pending", side_effect=write_pending) as mock:
+        recorder.start()
+        timeout = time.time() + 1
+        while mock.call_count < 3 and time.time() < timeout:
+            time.sleep(0.005)
+
+        # Still running after the error
+        assert mock.call_count >= 3
+        assert recorder._writer_thread.is_alive()
+        recorder.logger.error.assert_called_once()
+
+        recorder._writer_alive = False
+        recorder._writer_event.set()
+        recorder._writer_thread.join(1)
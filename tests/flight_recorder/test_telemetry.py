@@ -0,0 +1,161 @@
+import math
+import unittest.mock
+
+import numpy as np
+import pytest
+
+from flight_recorder import flight_recorder, telemetry
+
+
+@pytest.fixture
+def stream(tmp_path):
+    """A stream of 10 samples at t = 100..109 in chunks of 4, a = i and b = 2i, b missing at t = 105"""
+    directory = str(tmp_path / "stream")
+    payload = {"a": 0.0, "b": 0.0}
+    stream = flight_recorder._Stream(
+        directory, "sensors:test", ["a", "b"], flight_recorder.shape(payload), False, chunk_samples=4
+    )
+    stream.append([(100.0 + i, {"a": float(i)} if i == 5 else {"a": float(i), "b": 2.0 * i}) for i in range(10)])
+    yield stream
+    stream.close()
+
+
+def reference_lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets, one bucket at a time as originally described"""
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        first, last = int(i * every) + 1, int((i + 1) * every) + 1
+        next_first, next_last = last, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = np.mean(x[next_first:next_last]), np.mean(y[next_first:next_last])
+
+        best, best_area = first, -1.0
+        for b in range(first, last):
+            area = abs((x[a] - avg_x) * (y[b] - y[a]) - (x[a] - x[b]) * (avg_y - y[a])) / 2
+            if area > best_area:
+                best, best_area = b, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+# --- Load Range --- #
+def test_load_range(stream):
+    columns = telemetry.load_range(stream.directory, ["a"], 102.0, 105.0)
+    assert list(columns) == ["t", "a"]
+    # The range bounds are included
+    assert list(columns["t"]) == [102.0, 103.0, 104.0, 105.0]
+    assert list(columns["a"]) == [2.0, 3.0, 4.0, 5.0]
+
+    # Only the chunks overlapping the range are read
+    with unittest.mock.patch("numpy.load", wraps=np.load) as mock_load:
+        assert list(telemetry.load_range(stream.directory, ["b"], 104.0, 106.5)["t"]) == [104.0, 105.0, 106.0]
+    assert mock_load.call_count == 1
+
+    columns = telemetry.load_range(stream.directory, ["a"], 200.0, 300.0)
+    assert len(columns["t"]) == 0 and len(columns["a"]) == 0
+
+
+# --- Min Max --- #
+def test_minmax():
+    t = np.array([0.0, 0.5, 1.0, 3.2, 3.9])
+    a = np.array([1.0, 3.0, np.nan, 4.0, np.nan])
+    result = telemetry.minmax(t, {"a": a}, 0.0, 1.0)
+
+    # Empty steps are skipped
+    assert list(result["t"]) == [0.0, 1.0, 3.0]
+    assert list(result["count"]) == [2, 1, 2]
+    fields = result["fields"]["a"]
+    assert list(fields["min"][[0, 2]]) == [1.0, 4.0]
+    assert list(fields["max"][[0, 2]]) == [3.0, 4.0]
+    assert list(fields["mean"][[0, 2]]) == [2.0, 4.0]
+    # A step of NaN values only is NaN
+    assert all(math.isnan(fields[name][1]) for name in ("min", "max", "mean"))
+
+
+def test_minmax_empty():
+    result = telemetry.minmax(np.empty(0), {"a": np.empty(0)}, 0.0, 1.0)
+    assert len(result["t"]) == 0 and len(result["count"]) == 0
+    assert all(len(v) == 0 for v in result["fields"]["a"].values())
+
+
+# --- LTTB --- #
+@pytest.mark.parametrize("n, threshold", [(10, 3), (100, 7), (1000, 50), (1001, 999)])
+def test_lttb_reference(n, threshold):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.uniform(0, 100, n))
+    y = rng.normal(size=(3, n))
+
+    selected = telemetry._lttb(x, y, threshold)
+    assert selected.shape == (3, threshold)
+    for row, series in zip(selected, y):
+        assert list(row) == reference_lttb(x, series, threshold)
+
+
+def test_lttb():
+    rng = np.random.default_rng(0)
+    t = np.arange(100.0)
+    a, b = rng.normal(size=100), rng.normal(size=100)
+    b[10:20] = np.nan
+
+    kept = telemetry.lttb(t, {"a": a, "b": b}, 10)
+    assert list(kept["a"]) == reference_lttb(t, a, 10)
+    # NaN values are dropped first
+    valid = np.flatnonzero(~np.isnan(b))
+    assert list(kept["b"]) == list(valid[reference_lttb(t[valid], b[valid], 10)])
+
+    # Nothing to decimate
+    kept = telemetry.lttb(t[:5], {"a": a[:5], "b": b[:5]}, 10)
+    assert list(kept["a"]) == list(kept["b"]) == list(range(5))
+
+
+# --- Query --- #
+def test_query(stream):
+    result = telemetry.query(stream.directory, ["a"], None, None, 2.0)
+    assert list(result["t"]) == [100.0, 102.0, 104.0, 106.0, 108.0]
+    assert list(result["fields"]["a"]["max"]) == [1.0, 3.0, 5.0, 7.0, 9.0]
+
+    result = telemetry.query(stream.directory, None, 100.0, 109.0, 3.0, method="lttb")
+    assert list(result["fields"]) == ["a", "b"]
+    # One point per step, the first and last samples are kept
+    t = result["fields"]["a"]["t"]
+    assert len(t) == 3 and t[0] == 100.0 and t[-1] == 109.0
+    assert 105.0 not in result["fields"]["b"]["t"]
+
+
+def test_query_errors(stream):
+    with pytest.raises(ValueError):
+        telemetry.query(stream.directory, None, None, None, 1.0, method="invalid")
+    with pytest.raises(ValueError):
+        telemetry.query(stream.directory, None, None, None, 0.0)
+    with pytest.raises(ValueError):
+        telemetry.query(stream.directory, None, None, None, -1.0)
+    with pytest.raises(ValueError):
+        telemetry.query(stream.directory, ["a", "c"], None, None, 1.0)
+
+
+def test_query_empty_stream(tmp_path):
+    directory = str(tmp_path / "stream")
+    stream = flight_recorder._Stream(directory, "sensors:test", ["a"], {"a": ["float", None]}, False, chunk_samples=4)
+    stream._write_index()
+
+    result = telemetry.query(directory, None, None, None, 1.0)
+    assert len(result["t"]) == 0 and len(result["fields"]["a"]["mean"]) == 0
+    result = telemetry.query(directory, None, None, None, 1.0, method="lttb")
+    assert len(result["fields"]["a"]["t"]) == 0
+
+
+def test_query_cache(stream):
+    telemetry._query.cache_clear()
+    telemetry.query(stream.directory, ["a"], None, None, 2.0)
+    telemetry.query(stream.directory, ["a"], None, None, 2.0)
+    assert telemetry._query.cache_info().hits == 1
+
+    # New samples are not served from the cache
+    stream.append([(110.0, {"a": 10.0, "b": 20.0})])
+    result = telemetry.query(stream.directory, ["a"], None, None, 2.0)
+    assert telemetry._query.cache_info().hits == 1
+    assert list(result["t"])[-1] == 110.0
@@ -0,0 +1,157 @@
+import gzip
+import json
+import os
+import time
+import unittest.mock
+from unittest.mock import Mock
+
+import pytest
+
+from log_recorder import log_recorder
+from utilities import ipc, logger
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    recorder = log_recorder.LogRecorderComponent(Mock())
+    recorder.DIRECTORY = str(tmp_path)
+    yield recorder
+    recorder._writer_alive = False
+    with recorder._write_lock:
+        recorder._close_segment()
+
+
+def make_log(message, level=logger.Logger.INFO, label="label", timestamp=100.0):
+    log = logger.Log(message, level, label)
+    log._timestamp = log._first_timestamp = timestamp
+    return log
+
+
+def record(recorder, *logs):
+    call_data = ipc.CallData("log:INFO:label", "sender", False, {"logs": list(logs)})
+    recorder.record.route._wrapped_function(recorder, call_data, call_data.payload)
+
+
+def query(recorder, **payload):
+    call_data = ipc.CallData("log_recorder:query", "sender", False, payload)
+    return [log["message"] for log in recorder.query.route._wrapped_function(recorder, call_data, payload)]
+
+
+# --- Segments --- #
+def test_recorder_segment(recorder):
+    record(recorder, make_log("a"), make_log("b", timestamp=101.0))
+    recorder._write_pending()
+    record(recorder, make_log("c", timestamp=102.0))
+    recorder._write_pending()
+
+    (segment,) = recorder._segments()
+    # A valid gzip file of JSON lines
+    with gzip.open(segment, "rt") as f:
+        assert [json.loads(line)["message"] for line in f] == ["a", "b", "c"]
+
+    index = recorder._read_index(segment)
+    assert [(e["count"], e["start"], e["end"], e["labels"], e["levels"]) for e in index] == [
+        (2, 100.0, 101.0, ["label"], ["INFO"]),
+        (1, 102.0, 102.0, ["label"], ["INFO"]),
+    ]
+
+
+def test_recorder_rotation(recorder):
+    recorder.SEGMENT_MAX_BYTES = 1
+    recorder.MAX_SEGMENTS = 2
+
+    for i in range(4):
+        record(recorder, make_log(str(i), timestamp=100.0 + i))
+        recorder._write_pending()
+        time.sleep(0.001)
+
+    # Rotated after every batch, the oldest segments and their index are deleted
+    segments = recorder._segments()
+    assert len(segments) == 2
+    assert sorted(os.listdir(recorder.DIRECTORY)) == sorted(
+        name for path in segments for name in (os.path.basename(path), os.path.basename(path) + ".idx")
+    )
+    assert query(recorder) == ["2", "3"]
+
+
+def test_recorder_rotation_age(recorder):
+    recorder.SEGMENT_MAX_AGE = 0
+
+    for i in range(3):
+        record(recorder, make_log(str(i)))
+        recorder._write_pending()
+        time.sleep(0.001)
+
+    assert len(recorder._segments()) == 3
+
+
+# --- Queries --- #
+def test_recorder_query(recorder):
+    record(recorder, make_log("a", label="x", timestamp=100.0), make_log("b", label="y", timestamp=101.0))
+    recorder._write_pending()
+    record(recorder, make_log("c", level=logger.Logger.ERROR, label="x", timestamp=200.0))
+    recorder._write_pending()
+
+    assert query(recorder) == ["a", "b", "c"]
+    assert query(recorder, labels=["x"]) == ["a", "c"]
+    assert query(recorder, levels=[logger.Logger.ERROR]) == ["c"]
+    assert query(recorder, start=100.5, end=150.0) == ["b"]
+    assert query(recorder, limit=2) == ["a", "b"]
+
+    # Batches are skipped by their index entry, without being decompressed
+    with unittest.mock.patch.object(recorder, "_read_batch", wraps=recorder._read_batch) as mock_read_batch:
+        assert query(recorder, start=150.0) == ["c"]
+        assert query(recorder, labels=["y"]) == ["b"]
+        assert query(recorder, levels=[logger.Logger.ERROR]) == ["c"]
+    assert mock_read_batch.call_count == 3
+
+
+def test_recorder_query_partial_index(recorder):
+    record(recorder, make_log("a"))
+    recorder._write_pending()
+    recorder._close_segment()
+
+    # Killed while writing the index line of the next batch
+    (segment,) = recorder._segments()
+    with open(f"{segment}.idx", "a") as f:
+        f.write('{"offset": 40, "len')
+
+    assert len(recorder._read_index(segment)) == 1
+    assert query(recorder) == ["a"]
+
+
+# --- Writer --- #
+def test_recorder_malformed_logs(recorder):
+    malformed = make_log("malformed")
+    malformed._first_timestamp = None
+
+    with unittest.mock.patch("builtins.print") as mock_print:
+        record(recorder, make_log("a"), "not a log", malformed, make_log("b"))
+        recorder._write_pending()
+
+    # Skipped, the rest of the batch is written
+    assert mock_print.call_count == 2
+    assert query(recorder) == ["a", "b"]
+
+
+def test_recorder_writer_survives_errors(recorder):
+    recorder.FLUSH_INTERVAL = 0.01
+
+    def write_pending():
+        if mock.call_count == 1:
+            raise KeyError("first_timestamp")
+
+    with unittest.mock.patch.object(recorder, "_write_pending", side_effect=write_pending) as mock, \
+            unittest.mock.patch("builtins.print") as mock_print:
+        recorder.start()
+        timeout = time.time() + 1
+        while mock.call_count < 3 and time.time() < timeout:
+            time.sleep(0.005)
+
+        # Still running after the error
+        assert mock.call_count >= 3
+        assert recorder._writer_thread.is_alive()
+        mock_print.assert_called_once()
+
+        recorder._writer_alive = False
+        recorder._writer_thread.join(1)
@@ -83,12 +83,12 @@ def test_component_update_state(named_component):
         component._update_state(state["to"], state["from"])
 
         assert component._state == state["to"]
-        mock_ipc_node.send.assert_called_once_with(f"state:component:{state['to']}", {"component": "component"})
-        mock_ipc_node.redis.set.assert_called_once_with("state:component", state['to'])
+        mock_ipc_node.publish_state.assert_called_once_with(
+            "state:component", f"state:component:{state['to']}", {"component": "component"}, value=state["to"]
+        )
         mock_ipc_node.logger.info.assert_called_once_with(f"component is {state['to']}", "component", "state")
         mock_ipc_node.logger.reset_mock()
-        mock_ipc_node.redis.reset_mock()
-        mock_ipc_node.send.reset_mock()
+        mock_ipc_node.publish_state.reset_mock()
 
 
 def test_component_update_state_wrong_state(named_component):
@@ -171,6 +171,16 @@ def test_component_set_stopped(named_component):
         mock_ipc_node.stop.assert_called_once()
 
 
+def test_component_status(named_component):
+    mock_ipc_node = Mock()
+    component = named_component(mock_ipc_node)
+
+    assert component._status_component.route.match("component:status")
+    component._state = component_module.ComponentState.STARTED
+    assert component._status_component.route._wrapped_function(component, None, None) == \
+        component_module.ComponentState.STARTED
+
+
 def test_component_has_stop_and_start(named_component):
     mock_ipc_node = Mock()
     component = named_component(mock_ipc_node)
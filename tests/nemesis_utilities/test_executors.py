@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+from utilities import executors
+
+
+# --- Keyed Executor --- #
+def test_keyed_executor_ordering():
+    executor = executors.KeyedExecutor(4)
+    results = {"a": [], "b": []}
+
+    def task(key: str, i: int):
+        # Later tasks are faster, they would overtake the earlier ones without ordering
+        time.sleep(0.002 * (10 - i))
+        results[key].append(i)
+
+    for i in range(10):
+        executor.submit("a", task, "a", i)
+        executor.submit("b", task, "b", i)
+    executor.shutdown()
+
+    assert results == {"a": list(range(10)), "b": list(range(10))}
+    assert not executor._queues
+
+
+def test_keyed_executor_parallel_keys():
+    executor = executors.KeyedExecutor(2)
+    barrier = threading.Barrier(2, timeout=1)
+
+    # Both tasks wait for each other, only possible if different keys run in parallel
+    executor.submit("a", barrier.wait)
+    executor.submit("b", barrier.wait)
+    executor.shutdown()
+
+    assert not barrier.broken
+
+
+def test_keyed_executor_task_error():
+    executor = executors.KeyedExecutor(1)
+    results = []
+
+    def fail():
+        raise ValueError()
+
+    executor.submit("a", fail)
+    executor.submit("a", results.append, 1)
+    executor.shutdown()
+
+    assert results == [1]
+
+
+if __name__ == "__main__":
+    pytest.main()
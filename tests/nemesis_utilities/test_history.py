@@ -0,0 +1,94 @@
+import math
+import os
+import time
+from unittest.mock import Mock
+
+import pytest
+import redis
+
+from utilities import history, ipc
+
+
+@pytest.fixture
+def _redis():
+    r = redis.StrictRedis(host=os.environ.get("REDIS_HOST"), port=os.environ.get("REDIS_PORT"), db=0)
+    r.delete("test", "history:test", "history:test:samples", "history:test:windows")
+    yield r
+    r.delete("test", "history:test", "history:test:samples", "history:test:windows")
+
+
+# --- Sensor History --- #
+def test_sensor_history_aggregates():
+    h = history.SensorHistory("test", ["a", "b"], size=10, window=1.0)
+
+    h.append({"a": 1, "b": 10}, timestamp=100.1)
+    h.append({"a": 3, "b": "not numeric"}, timestamp=100.5)
+    # Closes the first window
+    h.append({"a": 5}, timestamp=101.2)
+
+    pipeline = Mock()
+    h.write(pipeline)
+
+    (key, window), _ = pipeline.lpush.call_args_list[1]
+    assert key == "history:test:windows"
+    assert window == (
+        '{"start": 100.0, "end": 101.0, "count": 2, "min": {"a": 1.0, "b": 10.0}, "max": {"a": 3.0, "b": 10.0}, '
+        '"mean": {"a": 2.0, "b": 10.0}}'
+    )
+    pipeline.ltrim.assert_any_call("history:test:samples", 0, 9)
+
+
+def test_sensor_history_buffer_bounded():
+    h = history.SensorHistory("test", ["a"], size=3)
+    for i in range(5):
+        h.append({"a": i}, timestamp=100 + i * 0.1)
+
+    pipeline = Mock()
+    h.write(pipeline)
+    assert len(pipeline.lpush.call_args.args) == 4
+
+    # Nothing buffered anymore, only the metadata is written
+    pipeline.reset_mock()
+    h.write(pipeline)
+    pipeline.lpush.assert_not_called()
+    pipeline.set.assert_called_once()
+
+
+def test_read(_redis):
+    assert history.read(_redis, "test") is None
+
+    h = history.SensorHistory("test", ["a", "b"], size=3, window=0.5)
+    now = time.time()
+    for i in range(5):
+        h.append({"a": i, "b": i / 2 if i != 4 else None}, timestamp=now - 5 + i)
+
+    pipeline = _redis.pipeline(transaction=True)
+    h.write(pipeline)
+    pipeline.execute()
+
+    read = history.read(_redis, "test")
+    assert read["fields"] == ["a", "b"]
+    assert read["window"] == 0.5
+    # Capped to the last 3 samples, oldest first, NaN fields are not set
+    assert [s["a"] for s in read["samples"]] == [2, 3, 4]
+    assert read["samples"][0]["timestamp"] == now - 3
+    assert read["samples"][0]["b"] == 1
+    assert "b" not in read["samples"][2]
+    assert [w["count"] for w in read["windows"]] == [1, 1, 1, 1]
+
+    read = history.read(_redis, "test", seconds=2.5)
+    assert [s["a"] for s in read["samples"]] == [3, 4]
+    assert all(w["end"] > now - 2.5 for w in read["windows"])
+
+
+def test_publish_state_history(_redis):
+    node = ipc.IpcNode("node", _redis, _redis.pubsub())
+    node.set_logger(Mock())
+    h = history.SensorHistory("test", ["a"], size=100)
+
+    for i in range(3):
+        node.publish_state("test", "test", {"a": i}, history=h)
+
+    assert _redis.get("test") == b'{"a": 2}'
+    assert [s["a"] for s in history.read(_redis, "test")["samples"]] == [0, 1, 2]
+    assert not math.isnan(history.read(_redis, "test", seconds=60)["samples"][0]["timestamp"])
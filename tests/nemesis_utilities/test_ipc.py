@@ -1,3 +1,6 @@
+import pickle
+import re
+import threading
 import time
 import unittest.mock
 import os
@@ -53,6 +56,24 @@ def test_calldata_dumps_and_loads(calldata_kwargs, calldata):
     assert loads.concurrent == calldata_kwargs["concurrent"]
     assert loads.blocking_response_channel == calldata_kwargs["blocking_response_channel"]
     assert loads.blocking
+    # Nothing out-of-band, plain pickle stream
+    assert not dumps.startswith(ipc._OOB_MAGIC)
+
+
+def test_calldata_dumps_and_loads_out_of_band():
+    np = pytest.importorskip("numpy")
+
+    array = np.arange(1000, dtype=np.float32).reshape(10, 100)
+    calldata = ipc.CallData("channel", "sender", False, {"array": array, "raw": pickle.PickleBuffer(b"abc")})
+    dumps = calldata.dumps()
+    assert dumps.startswith(ipc._OOB_MAGIC)
+
+    loads = ipc.CallData.loads(dumps)
+    assert np.array_equal(loads.payload["array"], array)
+    assert loads.payload["array"].dtype == array.dtype
+    # Rebuilt as a read-only view on the received bytes, not copied
+    assert not loads.payload["array"].flags.writeable
+    assert bytes(loads.payload["raw"]) == b"abc"
 
 
 # --- Route --- #
@@ -180,6 +201,116 @@ def test_route_call(route):
     )
 
 
+def test_route_ordering_key():
+    route = ipc.Route(["a:*"], False, ordering_key=ipc.by_payload("id"))
+    results = []
+
+    def function(self, call_data: ipc.CallData, payload: dict):
+        time.sleep(0.001 * (5 - payload["i"]))
+        results.append((payload["id"], payload["i"]))
+
+    route.decorator(function)
+    route.bind(Mock(), Mock())
+
+    for i in range(5):
+        for id_ in ["x", "y"]:
+            call_data = ipc.CallData("a:b", "sender", False, {"id": id_, "i": i})
+            assert route.threaded(call_data)
+            route.call(call_data)
+    route._executor.shutdown()
+
+    # Ordered per key
+    assert [i for id_, i in results if id_ == "x"] == list(range(5))
+    assert [i for id_, i in results if id_ == "y"] == list(range(5))
+
+    route.shutdown()
+    assert route._executor is None
+    assert ipc.by_channel(call_data) == "a:b"
+
+
+class ProcessRoutes:
+    """Routes run in worker processes, resolved by module and qualified name."""
+
+    @staticmethod
+    @ipc.Route(["square"], False, max_workers=1, executor="process").decorator
+    def square(self, call_data: ipc.CallData, payload: dict):
+        assert self is None
+        if payload["x"] is None:
+            raise ValueError("x is None")
+        return os.getpid(), payload["x"] ** 2
+
+    @staticmethod
+    @ipc.Route(["pid"], False, ordering_key=ipc.by_payload("key"), max_workers=2, executor="process").decorator
+    def pid(self, call_data: ipc.CallData, payload: dict):
+        return os.getpid()
+
+    @ipc.Route(["cube"], False, max_workers=1, executor="process").decorator
+    def cube(self, call_data: ipc.CallData, payload: dict):
+        return payload["x"] ** 3
+
+
+def test_route_process_executor():
+    with pytest.raises(ValueError):
+        ipc.Route(["a"], False, executor="invalid")
+
+    # Instance methods would silently get None as self in the workers
+    with pytest.raises(ValueError):
+        ProcessRoutes.cube.route.bind(Mock(), ProcessRoutes())
+    assert ProcessRoutes.cube.route._process_executor is None
+
+    route = ProcessRoutes.square.route
+    mock_ipc_node = Mock()
+    route.bind(mock_ipc_node, ProcessRoutes())
+    # Spawned, not forked from the threads of the node process
+    assert route._process_executor._pools[0]._mp_context.get_start_method() == "spawn"
+
+    def wait_response():
+        timeout = time.time() + 5
+        while not mock_ipc_node.send.called and time.time() < timeout:
+            time.sleep(0.01)
+        response = mock_ipc_node.send.call_args.args[1]["response"]
+        mock_ipc_node.send.reset_mock()
+        return response
+
+    try:
+        call_data = ipc.CallData("square", "sender", False, {"x": 3}, blocking_response_channel="response")
+        assert route.threaded(call_data)
+        route.call(call_data)
+        pid, result = wait_response()
+        assert pid != os.getpid()
+        assert result == 9
+
+        # Exceptions are sent back as the response
+        route.call(ipc.CallData("square", "sender", False, {"x": None}, blocking_response_channel="response"))
+        assert isinstance(wait_response(), ValueError)
+    finally:
+        route.shutdown()
+    assert route._process_executor is None
+
+
+def test_route_process_executor_keyed():
+    route = ProcessRoutes.pid.route
+    mock_ipc_node = Mock()
+    route.bind(mock_ipc_node, ProcessRoutes())
+    assert len(route._process_executor._pools) == 2
+    assert route._executor is None
+
+    pids = {}
+    try:
+        for key in ["a", "b", "c", "d"] * 3:
+            mock_ipc_node.send.reset_mock()
+            route.call(ipc.CallData("pid", "sender", False, {"key": key}, blocking_response_channel="response"))
+            timeout = time.time() + 5
+            while not mock_ipc_node.send.called and time.time() < timeout:
+                time.sleep(0.01)
+            pids.setdefault(key, set()).add(mock_ipc_node.send.call_args.args[1]["response"])
+    finally:
+        route.shutdown()
+
+    # The calls of a key always run in the same worker
+    assert all(len(key_pids) == 1 for key_pids in pids.values())
+
+
 # --- IpcNode --- #
 @pytest.fixture
 def ipc_node_kwargs():
@@ -314,6 +445,7 @@ def test_ipc_node_handle_blocking_response(ipc_node_kwargs):
 
     mock_call_data = Mock()
     mock_call_data.channel = "response_channel"
+    mock_call_data.trace = None
 
     # Test response channel not in blocking responses
     assert not ipc_node._handle_blocking_response(mock_call_data)
@@ -327,6 +459,24 @@ def test_ipc_node_handle_blocking_response(ipc_node_kwargs):
     ipc_node._blocking_responses["response_channel"]["lock"].release.assert_called_once()
 
 
+def test_ipc_node_handle_gathered_response(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+
+    ipc_node._blocking_responses["response_channel"] = {"responses": {}, "lock": Mock()}
+
+    for sender in ["a", "b"]:
+        mock_call_data = Mock()
+        mock_call_data.channel = "response_channel"
+        mock_call_data.sender = sender
+        mock_call_data.trace = None
+
+        assert ipc_node._handle_blocking_response(mock_call_data)
+        assert ipc_node._blocking_responses["response_channel"]["responses"][sender] == mock_call_data
+
+    assert ipc_node._blocking_responses["response_channel"]["lock"].release.call_count == 2
+
+
 def test_ipc_node_handle_message(ipc_node_kwargs):
     ipc_node = ipc.IpcNode(**ipc_node_kwargs)
     ipc_node.set_logger(Mock())
@@ -340,6 +490,7 @@ def test_ipc_node_handle_message(ipc_node_kwargs):
 
     mock_call_data = Mock()
     mock_call_data.channel = "channel"
+    mock_call_data.trace = None
 
     ipc_node._handle_message(mock_call_data)
     mock_routes[0].match.assert_called_once_with("channel")
@@ -434,6 +585,8 @@ def test_ipc_node_start(ipc_node_kwargs):
     ipc_node = ipc.IpcNode(**ipc_node_kwargs)
     ipc_node.set_logger(Mock())
 
+    ipc_node._redis.hgetall.return_value = {b"other": b'["^a:.*$"]'}
+
     with unittest.mock.patch("threading.Thread") as mock_thread:
         mock_thread.return_value = Mock()
 
@@ -442,6 +595,10 @@ def test_ipc_node_start(ipc_node_kwargs):
         ipc_node.logger.debug.assert_called_once()
         ipc_node._pubsub.subscribe.assert_called_once()
         assert ipc_node._alive
+        # Routes advertised and registry loaded
+        ipc_node._redis.hset.assert_called_once_with(ipc.ROUTES_REGISTRY, ipc_node.ipc_id, unittest.mock.ANY)
+        ipc_node._redis.publish.assert_called_once()
+        assert list(ipc_node._routes_registry) == ["other"]
         mock_thread.assert_called_once_with(target=ipc_node._listener)
         mock_thread.return_value.start.assert_called_once()
 
@@ -474,12 +631,229 @@ def test_ipc_node_send(ipc_node_kwargs):
         ipc_node.send(channel, payload, concurrent, loopback)
 
         mock_call_data.assert_called_once_with(channel=channel, sender=ipc_node.ipc_id, loopback=loopback,
-                                               payload=payload, concurrent=concurrent)
+                                               payload=payload, concurrent=concurrent, trace=None)
         mock_call_data.return_value.dumps.assert_called_once()
         ipc_node._redis.publish.assert_called_once_with("ipc", "dumps")
         ipc_node.logger.debug.assert_called_once()
 
 
+def test_ipc_node_listened(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+
+    # Registry not loaded, everything is listened
+    assert ipc_node.listened("a:b", False)
+
+    ipc_node._redis.hgetall.return_value = {b"other": b'["^a:.*$"]', b"test_ipc_id": b'["^b:.*$"]'}
+    ipc_node._load_routes_registry()
+    assert ipc_node.listened("a:b", False)
+    assert not ipc_node.listened("c:d", False)
+    # The node itself only listens to loopbacks
+    assert not ipc_node.listened("b:c", False)
+    assert ipc_node.listened("b:c", True)
+    assert ipc_node._listened_channels[("c:d", False)] is False
+
+    # Registry updates reset the cache
+    assert not ipc_node._handle_routes_update(ipc.CallData("c:d", "other", True, {}))
+    assert ipc_node._handle_routes_update(ipc.CallData(ipc.ROUTES_REGISTRY, "new", True, {"regexes": ["^c:.*$"]}))
+    assert not ipc_node._listened_channels
+    assert ipc_node.listened("c:d", False)
+
+    assert ipc_node._handle_routes_update(ipc.CallData(ipc.ROUTES_REGISTRY, "new", True, {"regexes": None}))
+    assert not ipc_node.listened("c:d", False)
+
+
+def test_ipc_node_configure_logger(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(lg.Logger(Mock()))
+
+    # Every node and this node only
+    route = ipc_node._configure_logger.route
+    assert route.match("log:config") and route.match("log:config:test_ipc_id")
+    assert not route.match("log:config:other")
+
+    call_data = ipc.CallData("log:config", "sender", False, {"labels": {"label": lg.Logger.DEBUG}})
+    with unittest.mock.patch("builtins.print"):
+        thresholds = route._wrapped_function(ipc_node, call_data, call_data.payload)
+    assert thresholds == {"level": ipc_node.logger.thresholds["level"], "labels": {"label": "DEBUG"}}
+    assert ipc_node.logger.enabled(lg.Logger.DEBUG, "label")
+
+
+def test_ipc_node_recent_logs(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(lg.Logger(Mock()))
+    with unittest.mock.patch("builtins.print"):
+        ipc_node.logger.info("info", "label")
+        ipc_node.logger.error("error", "label")
+
+    route = ipc_node._recent_logs.route
+    assert route.match("log:recent:test_ipc_id") and not route.match("log:recent:other")
+
+    call_data = ipc.CallData("log:recent:test_ipc_id", "sender", False, {"levels": [lg.Logger.ERROR]})
+    logs = route._wrapped_function(ipc_node, call_data, call_data.payload)
+    assert [(log["message"], log["level"]) for log in logs] == [("error", lg.Logger.ERROR)]
+
+
+def test_ipc_node_send_suppressed(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    ipc_node._routes_registry = {}
+
+    with unittest.mock.patch("utilities.ipc.CallData.dumps") as mock_dumps:
+        ipc_node.send("channel", {})
+        mock_dumps.assert_not_called()
+        ipc_node._redis.publish.assert_not_called()
+        assert ipc_node.stats == {"sent": 0, "suppressed": 1, "received": 0, "local": 0}
+
+        # Responses are never suppressed
+        ipc_node.send("channel", {}, _force=True)
+        ipc_node._redis.publish.assert_called_once()
+        assert ipc_node.stats == {"sent": 1, "suppressed": 1, "received": 0, "local": 0}
+
+
+def test_ipc_node_stats_concurrent(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    ipc_node._routes_registry = {}
+
+    def send():
+        for _ in range(2000):
+            ipc_node.send("channel", {})
+
+    threads = [threading.Thread(target=send) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert ipc_node.stats["suppressed"] == 16000
+
+
+def wait_calls(mock: Mock, count: int, timeout: float = 1.0) -> None:
+    timeout = time.time() + timeout
+    while mock.call_count < count and time.time() < timeout:
+        time.sleep(0.001)
+    assert mock.call_count == count
+
+
+def test_ipc_node_send_loopback(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    ipc_node._alive = True
+    ipc_node._routes_registry = {}
+
+    mock_route = Mock()
+    mock_route.match.side_effect = lambda channel: channel == "channel"
+    mock_route.threaded.return_value = False
+    ipc_node._routes = [mock_route]
+
+    # Dispatched in-process, no other node listens
+    ipc_node.send("channel", {"a": "b"}, loopback=True)
+    wait_calls(mock_route.call, 1)
+    call_data = mock_route.call.call_args.args[0]
+    assert (call_data.channel, call_data.payload, call_data.loopback) == ("channel", {"a": "b"}, True)
+    ipc_node._redis.publish.assert_not_called()
+    assert ipc_node.stats["local"] == 1
+
+    # A copy is published without loopback when another node listens
+    ipc_node._routes_registry = {"other": [re.compile("^channel$")]}
+    ipc_node._listened_channels = {}
+    ipc_node.send("channel", {"a": "b"}, loopback=True)
+    wait_calls(mock_route.call, 2)
+    assert not ipc.CallData.loads(ipc_node._redis.publish.call_args.args[1]).loopback
+
+    # Responses to the node own blocking requests never leave the process
+    ipc_node._redis.publish.reset_mock()
+    request = ipc.CallData("request", "test_ipc_id", True, {}, blocking_response_channel="response")
+    ipc_node._create_blocking_request_response_placeholder(request)
+    ipc_node.send("response", {"response": 1}, loopback=True, _force=True)
+    assert ipc_node._blocking_responses["response"]["response"].payload == {"response": 1}
+    ipc_node._redis.publish.assert_not_called()
+
+    ipc_node._loopback_queue.put(None)
+
+
+def test_ipc_node_send_loopback_queued(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    ipc_node._alive = True
+    ipc_node._routes_registry = {}
+
+    received = []
+    release = threading.Event()
+
+    def call(call_data):
+        release.wait(1)
+        # Sending again from a route is queued, not handled recursively
+        if call_data.payload["i"] < 10:
+            ipc_node.send("channel", {"i": call_data.payload["i"] + 10}, loopback=True)
+        received.append(call_data.payload["i"])
+
+    mock_route = Mock()
+    mock_route.match.side_effect = lambda channel: channel == "channel"
+    mock_route.threaded.return_value = False
+    mock_route.call.side_effect = call
+    ipc_node._routes = [mock_route]
+
+    # The sender never waits for the route
+    for i in range(2):
+        ipc_node.send("channel", {"i": i}, loopback=True)
+    assert received == []
+
+    release.set()
+    wait_calls(mock_route.call, 4)
+    assert received == [0, 1, 10, 11]
+    ipc_node._loopback_queue.put(None)
+
+
+def test_ipc_node_publish_state(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    pipeline = ipc_node._redis.pipeline.return_value
+
+    ipc_node.publish_state("key", "channel", {"a": "b"})
+
+    ipc_node._redis.pipeline.assert_called_once_with(transaction=True)
+    pipeline.set.assert_called_once_with("key", '{"a": "b"}')
+    channel, dumps = pipeline.publish.call_args.args
+    assert channel == "ipc"
+    assert ipc.CallData.loads(dumps).payload == {"a": "b"}
+    pipeline.execute.assert_called_once()
+
+    pipeline.reset_mock()
+    ipc_node.publish_state("key", "channel", {"a": "b"}, value="value")
+    pipeline.set.assert_called_once_with("key", "value")
+
+
+def test_ipc_node_publish_state_loopback(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    ipc_node._alive = True
+    ipc_node._routes_registry = {}
+    pipeline = ipc_node._redis.pipeline.return_value
+
+    mock_route = Mock()
+    mock_route.match.side_effect = lambda channel: channel == "channel"
+    mock_route.threaded.return_value = False
+    ipc_node._routes = [mock_route]
+
+    # Dispatched in-process like send, no other node listens
+    ipc_node.publish_state("key", "channel", {"a": "b"}, loopback=True)
+    pipeline.set.assert_called_once_with("key", '{"a": "b"}')
+    pipeline.publish.assert_not_called()
+    wait_calls(mock_route.call, 1)
+    assert mock_route.call.call_args.args[0].loopback
+    assert ipc_node.stats["local"] == 1
+
+    # A copy is published without loopback when another node listens
+    ipc_node._routes_registry = {"other": [re.compile("^channel$")]}
+    ipc_node._listened_channels = {}
+    ipc_node.publish_state("key", "channel", {"a": "b"}, loopback=True)
+    assert not ipc.CallData.loads(pipeline.publish.call_args.args[1]).loopback
+    wait_calls(mock_route.call, 2)
+
+    ipc_node._loopback_queue.put(None)
+
+
 def test_ipc_node_create_blocking_request_response_placeholder(ipc_node_kwargs):
     ipc_node = ipc.IpcNode(**ipc_node_kwargs)
     ipc_node.set_logger(Mock())
@@ -518,6 +892,157 @@ def test_ipc_node_wait_for_blocking_response(ipc_node_kwargs):
         ipc_node._wait_for_blocking_response(mock_call_data, 1)
 
 
+def test_ipc_node_wait_for_gathered_responses(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+
+    mock_call_data = Mock()
+    mock_call_data.blocking_response_channel = "channel"
+    ipc_node._create_gather_placeholder(mock_call_data)
+
+    responses = {}
+    for sender, response in [("a", 1), ("b", Exception("test"))]:
+        responses[sender] = Mock()
+        responses[sender].payload = {"response": response}
+        ipc_node._blocking_responses["channel"]["responses"][sender] = responses[sender]
+        ipc_node._blocking_responses["channel"]["lock"].release()
+
+    # Expected count reached
+    r = ipc_node._wait_for_gathered_responses(mock_call_data, 1, expected=2)
+    assert mock_call_data.blocking_response_channel not in ipc_node._blocking_responses
+    assert r["a"] == 1
+    assert isinstance(r["b"], Exception)
+
+    # Timeout reached, not an error
+    ipc_node._create_gather_placeholder(mock_call_data)
+    start = time.time()
+    assert ipc_node._wait_for_gathered_responses(mock_call_data, 0.1, expected=1) == {}
+    assert time.time() - start >= 0.1
+
+
+def test_ipc_node_wait_for_gathered_responses_late(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    mock_call_data = Mock()
+    mock_call_data.blocking_response_channel = "response_channel"
+    ipc_node._create_gather_placeholder(mock_call_data)
+    placeholder = ipc_node._blocking_responses["response_channel"]
+
+    class Response:
+        @property
+        def payload(self):
+            # The listener adds a late response while the responses are read
+            placeholder["responses"].setdefault("late", ipc.CallData("response_channel", "late", True, {"response": 2}))
+            return {"response": 1}
+
+    assert ipc_node._handle_blocking_response(ipc.CallData("response_channel", "a", True, {"response": 0}))
+    placeholder["responses"]["b"] = Response()
+    assert ipc_node._wait_for_gathered_responses(mock_call_data, 0.1, expected=2) == {"a": 0, "b": 1}
+
+
+def test_ipc_node_gather(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+
+    with unittest.mock.patch("utilities.ipc.CallData") as mock_call_data:
+        with unittest.mock.patch("utilities.ipc.IpcNode._create_gather_placeholder") as mock_create_placeholder:
+            with unittest.mock.patch("utilities.ipc.IpcNode._wait_for_gathered_responses") as mock_wait:
+                mock_call_data.return_value = Mock()
+                mock_call_data.return_value.dumps.return_value = "dumps"
+                mock_wait.return_value = {"a": 1}
+
+                r = ipc_node.gather("channel", {"a": "b"}, timeout=1, expected=2)
+
+                mock_call_data.assert_called_once_with(channel="channel", sender=ipc_node.ipc_id, loopback=False,
+                                                       payload={"a": "b"}, concurrent=None,
+                                                       blocking_response_channel=unittest.mock.ANY, trace=None)
+                ipc_node._redis.publish.assert_called_once_with("ipc", "dumps")
+                mock_create_placeholder.assert_called_once_with(mock_call_data.return_value)
+                mock_wait.assert_called_once_with(mock_call_data.return_value, timeout=1, expected=2)
+                assert r == {"a": 1}
+
+
+def test_ipc_stream(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+
+    with unittest.mock.patch("utilities.ipc.IpcNode.send") as mock_send:
+        stream = ipc_node.send_stream("channel", {"a": "b"}, credit=4, timeout=0.1)
+        ipc_node._redis.publish.assert_called_once()
+        response_channel = list(ipc_node._streams.keys())[0]
+
+        # Chunks are pushed by the listener, credits are granted back by batches of half the initial credit
+        for i in range(3):
+            chunk = ipc.CallData(response_channel, "responder", True, {"chunk": i})
+            assert ipc_node._handle_blocking_response(chunk)
+        assert next(stream) == 0
+        mock_send.assert_not_called()
+        assert next(stream) == 1
+        mock_send.assert_called_once_with(f"{response_channel}:credit", {"credit": 2}, loopback=False, _nolog=True,
+                                          _force=True)
+
+        # End of stream
+        ipc_node._handle_blocking_response(ipc.CallData(response_channel, "responder", True, {"end": True}))
+        assert list(stream) == [2]
+        assert response_channel not in ipc_node._streams
+
+        # Error raised by the handler
+        stream = ipc_node.send_stream("channel", {"a": "b"}, credit=4, timeout=0.1)
+        response_channel = list(ipc_node._streams.keys())[0]
+        ipc_node._handle_blocking_response(ipc.CallData(response_channel, "r", True, {"error": ValueError("test")}))
+        with pytest.raises(ValueError):
+            next(stream)
+
+        # Timeout cancels the stream
+        mock_send.reset_mock()
+        stream = ipc_node.send_stream("channel", {"a": "b"}, credit=4, timeout=0.1)
+        response_channel = list(ipc_node._streams.keys())[0]
+        with pytest.raises(TimeoutError):
+            next(stream)
+        mock_send.assert_called_once_with(f"{response_channel}:credit", {"cancel": True}, loopback=False, _nolog=True,
+                                          _force=True)
+        assert not ipc_node._streams
+
+
+def test_ipc_node_send_stream_chunks(ipc_node_kwargs):
+    ipc_node = ipc.IpcNode(**ipc_node_kwargs)
+    ipc_node.set_logger(Mock())
+    call_data = ipc.CallData("channel", "requester", False, {}, blocking_response_channel="response", stream_credit=2)
+
+    with unittest.mock.patch("utilities.ipc.IpcNode.send") as mock_send:
+        # Waits for credits once the initial credit is consumed
+        produced = []
+
+        def chunks():
+            for i in range(4):
+                produced.append(i)
+                yield i
+
+        thread = threading.Thread(target=ipc_node.send_stream_chunks, args=(call_data, chunks()))
+        thread.start()
+        time.sleep(0.1)
+        assert produced == [0, 1]
+        assert ipc_node._handle_stream_credit(ipc.CallData("response:credit", "requester", False, {"credit": 3}))
+        thread.join(1)
+
+        assert [c.args[1] for c in mock_send.call_args_list] == [
+            {"chunk": 0}, {"chunk": 1}, {"chunk": 2}, {"chunk": 3}, {"end": True}
+        ]
+        assert not ipc_node._stream_credits
+
+        # Cancellation closes the generator
+        mock_send.reset_mock()
+        generator = chunks()
+        thread = threading.Thread(target=ipc_node.send_stream_chunks, args=(call_data, generator))
+        thread.start()
+        time.sleep(0.1)
+        ipc_node._handle_stream_credit(ipc.CallData("response:credit", "requester", False, {"cancel": True}))
+        thread.join(1)
+
+        assert mock_send.call_count == 2
+        assert generator.gi_frame is None
+
+
 def test_ipc_node_send_blocking(ipc_node_kwargs):
     ipc_node = ipc.IpcNode(**ipc_node_kwargs)
     ipc_node.set_logger(Mock())
@@ -543,7 +1068,7 @@ def test_ipc_node_send_blocking(ipc_node_kwargs):
                 # Assert was called with correct arguments, and blocking_response_channel can be anything
                 mock_call_data.assert_called_once_with(channel=channel, sender=ipc_node.ipc_id, loopback=loopback,
                                                        payload=payload, concurrent=concurrent,
-                                                       blocking_response_channel=unittest.mock.ANY)
+                                                       blocking_response_channel=unittest.mock.ANY, trace=None)
 
                 mock_call_data.return_value.dumps.assert_called_once()
                 ipc_node._redis.publish.assert_called_once_with("ipc", "dumps")
@@ -572,6 +1097,11 @@ def test_ipc_integration():
         def return_pi(self, call_data: ipc.CallData, payload: dict):
             return 3.14159265359
 
+        @ipc.Route(["count"], concurrent=True).decorator
+        def count(self, call_data: ipc.CallData, payload: dict):
+            for i in range(payload["n"]):
+                yield i
+
     # Instantiate the IPC node
     r = redis.StrictRedis(host=os.environ.get("REDIS_HOST"), port=os.environ.get("REDIS_PORT"), db=0)
     node = TestIpcNode(
@@ -586,8 +1116,21 @@ def test_ipc_integration():
 
     node.send("ping", {}, loopback=True)
     assert node.send_blocking('return_pi', {}, loopback=True) == 3.14159265359
+    assert node.gather('return_pi', {}, loopback=True, expected=1) == {"node": 3.14159265359}
+
+    assert list(node.send_stream('count', {"n": 50}, loopback=True, credit=4)) == list(range(50))
+    assert node.send_blocking('count', {"n": 3}, loopback=True) == [0, 1, 2]
+    with node.send_stream('count', {"n": 50}, loopback=True, credit=4) as stream:
+        assert next(stream) == 0
+    assert list(stream) == []
+
+    # No node listens, suppressed before serialization
+    suppressed = node.stats["suppressed"]
+    node.send("nobody:listens", {}, loopback=True)
+    assert node.stats["suppressed"] == suppressed + 1
 
     node.stop()
+    assert r.hget(ipc.ROUTES_REGISTRY, "node") is None
 
 
 if __name__ == "__main__":
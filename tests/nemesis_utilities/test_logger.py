@@ -1,4 +1,10 @@
+import gc
+import json
 import os
+import pickle
+import sys
+import time
+import weakref
 
 import pytest
 from unittest.mock import Mock, patch
@@ -15,8 +21,13 @@ def mock_ipc_node():
 
 
 @pytest.fixture
-def logger_obj(mock_ipc_node):
-    return logger.Logger(mock_ipc_node)
+def mock_sink():
+    return Mock()
+
+
+@pytest.fixture
+def logger_obj(mock_ipc_node, mock_sink):
+    return logger.Logger(mock_ipc_node, sink=mock_sink)
 
 
 @pytest.fixture
@@ -55,6 +66,59 @@ def test_log_dumps_and_loads(log):
     assert loaded_log._timestamp == log._timestamp
 
 
+def test_log_dumps_and_loads_compact():
+    for level, label in [(logger.Logger.ERROR, "label"), ("CUSTOM", None), (logger.Logger.INFO, "é")]:
+        log = logger.Log("Test message é", level, label)
+        dumps = log.dumps()
+        loaded_log = logger.Log.loads(dumps)
+        assert loaded_log.to_dict() == log.to_dict()
+
+    # Standard level as a single byte, no pickle overhead
+    assert len(logger.Log("message", logger.Logger.INFO, "label").dumps()) == 16 + len("label") + len("message")
+
+    # Pickled through its compact encoding, the level and label are interned
+    loaded_log = pickle.loads(pickle.dumps(logger.Log("message", logger.Logger.INFO, "label")))
+    assert loaded_log.message == "message"
+    assert loaded_log.label is sys.intern("label")
+    assert not hasattr(loaded_log, "__dict__")
+
+    # Repeated logs carry their repeat count and first timestamp
+    log = logger.Log("message", logger.Logger.INFO, "label")
+    log._repeat, log._first_timestamp = 3, log.timestamp - 1
+    loaded_log = logger.Log.loads(log.dumps())
+    assert (loaded_log.repeat, loaded_log.first_timestamp, loaded_log.level) == (3, log.timestamp - 1, "INFO")
+    assert "(x3 since" in str(loaded_log)
+
+
+def test_log_lazy_format():
+    calls = []
+
+    def expensive(value):
+        calls.append(value)
+        return value * 2
+
+    log = logger.Log("{} and {name}", logger.Logger.INFO, "label", (logger.Lazy(expensive, 2),), {"name": "field"})
+    assert calls == []
+
+    # Formatted once, on first use
+    assert log.message == "4 and field"
+    assert log.dumps() and calls == [2]
+
+    loaded_log = logger.Log.loads(log.dumps())
+    assert (loaded_log.message, loaded_log.fields) == ("4 and field", {"name": "field"})
+    assert loaded_log.to_dict()["fields"] == {"name": "field"}
+
+    # Fields are sent as JSON values, a bad template does not raise
+    log = logger.Log("{missing}", logger.Logger.ERROR, "label", (), {"error": ValueError("boom")})
+    assert "{missing}" in log.message
+    assert logger.Log.loads(log.dumps()).fields == {"error": "boom"}
+
+    try:
+        raise ValueError("boom")
+    except ValueError as e:
+        assert "Traceback" in str(logger.lazy_traceback(e))
+
+
 def test_log_str(log):
     formatted_time = datetime.fromtimestamp(log.timestamp).strftime('%Y-%m-%d %H:%M:%S')
     expected_str = (
@@ -65,55 +129,317 @@ def test_log_str(log):
     assert str(log) == expected_str
 
 
-def test_logger_log(logger_obj, mock_ipc_node):
-    with patch('builtins.print') as mock_print:
-        logger_obj.log("Test message", "TestLabel", logger.Logger.INFO, extra_channel="extra")
+def test_logger_log(logger_obj, mock_ipc_node, mock_sink):
+    logger_obj.log("Test message", "TestLabel", logger.Logger.INFO, extra_channel="extra")
+    logger_obj.flush()
 
     mock_ipc_node.send.assert_called_once()
-    mock_print.assert_called_once()
+    mock_sink.write.assert_called_once()
 
 
-def test_logger_debug(logger_obj, mock_ipc_node):
-    with patch('builtins.print') as mock_print:
-        logger_obj.debug("Test message", "TestLabel", extra_channel="extra")
+def test_logger_debug(logger_obj, mock_ipc_node, mock_sink):
+    logger_obj.debug("Test message", "TestLabel", extra_channel="extra")
+    logger_obj.flush()
 
-    mock_ipc_node.send.assert_called_once()
-    if os.environ.get("DEBUG") == "1":
-        mock_print.assert_called_once()
+    # Below the default threshold unless DEBUG is set
+    if logger.DEBUG_ENABLED:
+        mock_ipc_node.send.assert_called_once()
+        mock_sink.write.assert_called_once()
     else:
-        mock_print.assert_not_called()
+        mock_ipc_node.send.assert_not_called()
+        mock_sink.write.assert_not_called()
+
+    logger_obj.configure(level=logger.Logger.DEBUG)
+    logger_obj.debug("Test message", "TestLabel", extra_channel="extra")
+    logger_obj.flush()
+
+    assert mock_ipc_node.send.call_args.args[0] == "log:DEBUG:TestLabel:extra"
+    mock_sink.write.assert_called_once()
+
+
+def test_logger_info(logger_obj, mock_ipc_node, mock_sink):
+    logger_obj.info("Test message", "TestLabel", extra_channel="extra")
+    logger_obj.flush()
+
+    mock_ipc_node.send.assert_called_once()
+    mock_sink.write.assert_called_once()
 
 
-def test_logger_info(logger_obj, mock_ipc_node):
-    with patch('builtins.print') as mock_print:
-        logger_obj.info("Test message", "TestLabel", extra_channel="extra")
+def test_logger_warning(logger_obj, mock_ipc_node, mock_sink):
+    logger_obj.warning("Test message", "TestLabel", extra_channel="extra")
+    logger_obj.flush()
 
     mock_ipc_node.send.assert_called_once()
-    mock_print.assert_called_once()
+    mock_sink.write.assert_called_once()
 
 
-def test_logger_warning(logger_obj, mock_ipc_node):
-    with patch('builtins.print') as mock_print:
-        logger_obj.warning("Test message", "TestLabel", extra_channel="extra")
+def test_logger_error(logger_obj, mock_ipc_node, mock_sink):
+    logger_obj.error("Test message", "TestLabel", extra_channel="extra")
+    logger_obj.flush()
 
     mock_ipc_node.send.assert_called_once()
-    mock_print.assert_called_once()
+    mock_sink.write.assert_called_once()
 
 
-def test_logger_error(logger_obj, mock_ipc_node):
-    with patch('builtins.print') as mock_print:
-        logger_obj.error("Test message", "TestLabel", extra_channel="extra")
+def test_logger_critical(logger_obj, mock_ipc_node, mock_sink):
+    logger_obj.critical("Test message", "TestLabel", extra_channel="extra")
+    logger_obj.flush()
 
     mock_ipc_node.send.assert_called_once()
-    mock_print.assert_called_once()
+    mock_sink.write.assert_called_once()
+
+
+def test_logger_fields(logger_obj, mock_sink):
+    logger_obj.info("Connected to {host}", "TestLabel", fields={"host": "base"})
+    log = mock_sink.write.call_args.args[0]
+    assert (log.message, log.fields) == ("Connected to base", {"host": "base"})
+
+    # Misspelled parameters are not taken for fields
+    with pytest.raises(TypeError):
+        logger_obj.info("Test message", "TestLabel", extra_chanel="extra")
+
+
+def test_logger_thresholds(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, level=logger.Logger.WARNING, sink=mock_sink)
+    logger_obj.configure(labels={"Verbose": logger.Logger.DEBUG})
+    assert logger_obj.thresholds == {"level": "WARNING", "labels": {"Verbose": "DEBUG"}}
+    assert logger_obj.enabled("CUSTOM", "TestLabel")
+
+    # Below the threshold, dropped before the record is built
+    with patch('utilities.logger.Log') as mock_log:
+        logger_obj.info("Test message {}", "TestLabel", args=(1,))
+    mock_log.assert_not_called()
+
+    logger_obj.debug("Test message {}", "Verbose", args=(1,))
+    logger_obj.error("Test message {}", "TestLabel", args=(1,))
+    assert [call.args[0].message for call in mock_sink.write.call_args_list] == ["Test message 1"] * 2
+
+    # Labels reset to the default threshold
+    logger_obj.configure(level=logger.Logger.INFO, labels={"Verbose": None})
+    assert not logger_obj.enabled(logger.Logger.DEBUG, "Verbose")
+    assert logger_obj.enabled(logger.Logger.INFO, "TestLabel")
+    logger_obj.configure(labels={"Quiet": logger.Logger.CRITICAL})
+    logger_obj.configure(reset=True)
+    assert logger_obj.thresholds == {"level": "INFO", "labels": {}}
+
+    with pytest.raises(ValueError):
+        logger_obj.configure(labels={"TestLabel": "VERBOSE"})
+
 
+def test_logger_recent(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, recent_size=3, dedup_window=0, sink=mock_sink)
+    assert logger_obj.recent() == []
 
-def test_logger_critical(logger_obj, mock_ipc_node):
-    with patch('builtins.print') as mock_print:
-        logger_obj.critical("Test message", "TestLabel", extra_channel="extra")
+    logger_obj.info("0", "A")
+    logger_obj.error("1", "B")
+    assert [log.message for log in logger_obj.recent()] == ["0", "1"]
 
+    for i in range(2, 5):
+        logger_obj.warning(str(i), "A")
+
+    # Only the last records are kept, oldest first
+    assert [log.message for log in logger_obj.recent()] == ["2", "3", "4"]
+    assert [log.message for log in logger_obj.recent(limit=2)] == ["3", "4"]
+    assert logger_obj.recent(levels=[logger.Logger.ERROR]) == []
+    assert logger_obj.recent(labels=["B"]) == []
+
+    logs = logger_obj.recent()
+    assert logger_obj.recent(start=logs[1].timestamp, end=logs[1].timestamp)[0] is logs[1]
+
+    assert logger.Logger(mock_ipc_node, recent_size=0, sink=mock_sink).recent() == []
+
+
+def test_logger_recent_releases_arguments(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, flush_interval=60, sink=mock_sink)
+
+    class Resource:
+        pass
+
+    def fail(resource):
+        raise ValueError("failed")
+
+    resource = Resource()
+    resource_ref = weakref.ref(resource)
+    try:
+        fail(resource)
+    except ValueError as e:
+        logger_obj.error("Failed: {}", "TestLabel", args=(logger.lazy_traceback(e),), fields={"error": e})
+    del resource
+
+    # Encoded for publishing, the buffered record only keeps the formatted message and the JSON fields
+    logger_obj.flush()
+    pickle.dumps(mock_ipc_node.send.call_args.args[1])
+    gc.collect()
+
+    (log,) = logger_obj.recent()
+    assert resource_ref() is None
+    assert log._args == () and log.fields == {"error": "failed"}
+    assert log.message.startswith("Failed: Traceback")
+
+
+@pytest.mark.parametrize("output_format", [logger.StdoutSink.HUMAN, logger.StdoutSink.JSON])
+def test_stdout_sink(output_format):
+    sink = logger.StdoutSink(output_format)
+    log = logger.Log("Test message {}", logger.Logger.INFO, "TestLabel", (1,), {"key": "value"})
+
+    with patch('sys.stdout') as mock_stdout:
+        sink.write(log)
+        timeout = time.time() + 1
+        while not mock_stdout.flush.called and time.time() < timeout:
+            time.sleep(0.005)
+        sink.stop()
+
+        # Written by the writer thread, in a single write
+        assert not sink._writer_thread.is_alive()
+        mock_stdout.write.assert_called_once()
+        text = mock_stdout.write.call_args.args[0]
+        if output_format == logger.StdoutSink.HUMAN:
+            assert text == str(log)
+        else:
+            record = json.loads(text)
+            assert (record["message"], record["fields"]) == ("Test message 1", {"key": "value"})
+            assert record["time"].startswith(datetime.fromtimestamp(log.timestamp).strftime('%Y-%m-%dT%H:%M:%S.'))
+
+        # Stopped, written on the calling thread
+        sink.write(log)
+        assert mock_stdout.write.call_count == 2
+
+    with pytest.raises(ValueError):
+        logger.StdoutSink("xml")
+
+
+def test_stdout_sink_overflow():
+    sink = logger.StdoutSink(max_buffer_size=2)
+    # Keep the writer thread from writing
+    sink._write_lock.acquire()
+
+    logs = [logger.Log(str(i), logger.Logger.INFO, "TestLabel") for i in range(4)]
+    for log in logs:
+        sink.write(log)
+    assert sink.dropped == 2
+
+    # The oldest records are dropped
+    with patch('sys.stdout') as mock_stdout:
+        sink._write_lock.release()
+        sink.stop()
+    assert "".join(call.args[0] for call in mock_stdout.write.call_args_list) == str(logs[2]) + str(logs[3])
+
+
+def test_logger_batch(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, flush_interval=60, sink=mock_sink)
+
+    for i in range(3):
+        logger_obj.info(f"Test message {i}", "TestLabel")
+    logger_obj.error("Test message", "TestLabel")
+
+    # Nothing sent on the logging thread
+    mock_ipc_node.send.assert_not_called()
+
+    logger_obj.flush()
+
+    # One message per channel holding the whole batch
+    assert mock_ipc_node.send.call_count == 2
+    channel, payload = mock_ipc_node.send.call_args_list[0].args
+    assert channel == "log:INFO:TestLabel"
+    assert [log.message for log in payload["logs"]] == [f"Test message {i}" for i in range(3)]
+    assert mock_ipc_node.send.call_args_list[1].args[0] == "log:ERROR:TestLabel"
+
+
+def test_logger_flusher(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, batch_size=2, flush_interval=0.01, sink=mock_sink)
+
+    logger_obj.info("Test message", "TestLabel")
+
+    timeout = time.time() + 1
+    while not mock_ipc_node.send.called and time.time() < timeout:
+        time.sleep(0.005)
     mock_ipc_node.send.assert_called_once()
-    mock_print.assert_called_once()
+
+    logger_obj.stop()
+    assert not logger_obj._flusher_thread.is_alive()
+
+
+def test_logger_publish_failure(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, flush_interval=60, sink=mock_sink)
+    mock_ipc_node.send.side_effect = ConnectionError("redis is down")
+
+    logger_obj.info("Test message", "TestLabel")
+    mock_sink.write.reset_mock()
+    logger_obj.flush()
+
+    # Reported through the sink, not published
+    assert logger_obj.dropped == 1
+    log = mock_sink.write.call_args.args[0]
+    assert log.level == logger.Logger.ERROR
+    assert log.message == "Failed to publish 1 log records on log:INFO:TestLabel: redis is down"
+    logger_obj.stop()
+
+
+@pytest.mark.parametrize("overflow, messages", [
+    (logger.Logger.DROP_OLDEST, ["2", "3"]),
+    (logger.Logger.DROP_NEWEST, ["0", "1"]),
+])
+def test_logger_overflow(mock_ipc_node, mock_sink, overflow, messages):
+    logger_obj = logger.Logger(mock_ipc_node, max_queue_size=2, overflow=overflow, sink=mock_sink)
+    # Keep the flusher from publishing
+    logger_obj._flush_lock.acquire()
+
+    for i in range(4):
+        logger_obj.info(str(i), "TestLabel")
+
+    assert logger_obj.dropped == 2
+    logger_obj._flush_lock.release()
+    logger_obj.stop()
+    assert [log.message for log in mock_ipc_node.send.call_args.args[1]["logs"]] == messages
+
+    # Stopped, records are only printed
+    mock_sink.write.reset_mock()
+    logger_obj.info("Test message", "TestLabel")
+    mock_sink.write.assert_called_once()
+    assert logger_obj.dropped == 3
+
+
+def test_logger_deduplication(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, flush_interval=60, dedup_window=60, sink=mock_sink)
+
+    for i in range(5):
+        logger_obj.error("Reception error", "TestLabel")
+    logger_obj.error("Other error", "TestLabel")
+    logger_obj.info("Reception error", "TestLabel")
+    assert mock_sink.write.call_count == 3
+    assert logger_obj.deduplicated == 4
+
+    # The repeated record is logged when the window ends
+    mock_sink.write.reset_mock()
+    logger_obj.stop()
+    mock_sink.write.assert_called_once()
+
+    logs = [log for call in mock_ipc_node.send.call_args_list for log in call.args[1]["logs"]]
+    assert [(log.message, log.level, log.repeat) for log in logs] == [
+        ("Reception error", logger.Logger.ERROR, 1),
+        ("Other error", logger.Logger.ERROR, 1),
+        ("Reception error", logger.Logger.ERROR, 4),
+        ("Reception error", logger.Logger.INFO, 1),
+    ]
+    assert logs[0].timestamp <= logs[2].first_timestamp <= logs[2].timestamp
+
+
+def test_logger_deduplication_window(mock_ipc_node, mock_sink):
+    logger_obj = logger.Logger(mock_ipc_node, flush_interval=0.01, dedup_window=0.05, sink=mock_sink)
+
+    for i in range(3):
+        logger_obj.warning("Asking for config", "TestLabel")
+
+    # Logged by the flusher once the window ends, without further logs
+    timeout = time.time() + 1
+    while mock_ipc_node.send.call_count < 2 and time.time() < timeout:
+        time.sleep(0.005)
+    assert mock_ipc_node.send.call_args.args[1]["logs"][0].repeat == 2
+
+    # A new window is opened afterward
+    logger_obj.warning("Asking for config", "TestLabel")
+    logger_obj.stop()
+    assert [log.repeat for call in mock_ipc_node.send.call_args_list for log in call.args[1]["logs"]] == [1, 2, 1]
 
 
 if __name__ == "__main__":
@@ -44,6 +44,67 @@ def test_manager_check_state():
         assert not manager._check_state("hello", component_module.ComponentState.STARTED)
 
 
+def test_manager_get_components_status():
+    mock_ipc_node = Mock()
+    mock_ipc_node.redis = Mock()
+    manager = manager_module.Manager(mock_ipc_node)
+
+    started = component_module.ComponentState.STARTED
+    stopped = component_module.ComponentState.STOPPED
+    names = list(manager._components)
+    mock_ipc_node.redis.mget.return_value = [started.encode()] * 2 + [None] * (len(names) - 2)
+    mock_ipc_node.gather.return_value = {names[0]: started, names[1]: Exception("test"), "unknown": started}
+
+    status = manager.get_components_status(timeout=1)
+
+    mock_ipc_node.redis.mget.assert_called_once_with([f"state:{c}" for c in names])
+    mock_ipc_node.gather.assert_called_once_with("component:status", {}, timeout=1, expected=2)
+    assert status == {c: started if c in names[:2] else stopped for c in names}
+
+
+def test_manager_get_system_snapshot():
+    mock_ipc_node = Mock()
+    mock_ipc_node.redis = Mock()
+    manager = manager_module.Manager(mock_ipc_node)
+
+    names = list(manager._components)
+    values = [b'{"first_range": 100, "second_range": 200}', b"1", b"", b"not json"]
+    values += [None] * (len(manager_module.SNAPSHOT_KEYS) - len(values))
+    mock_ipc_node.redis.mget.return_value = values + [b"started"] + [None] * (len(names) - 1)
+
+    snapshot = manager.get_system_snapshot()
+
+    mock_ipc_node.redis.mget.assert_called_once_with(manager_module.SNAPSHOT_KEYS + [f"state:{c}" for c in names])
+    keys = manager_module.SNAPSHOT_KEYS
+    assert snapshot["values"][keys[0]] == {"first_range": 100, "second_range": 200}
+    assert snapshot["values"][keys[1]] == 1
+    assert snapshot["values"][keys[2]] is None
+    assert snapshot["values"][keys[3]] == "not json"
+    assert snapshot["components"][names[0]] == component_module.ComponentState.STARTED
+    assert snapshot["components"][names[1]] == component_module.ComponentState.STOPPED
+
+    # Callers within the cache time share the snapshot
+    with unittest.mock.patch.object(manager_module, "SNAPSHOT_CACHE_TIME", 60):
+        assert manager.get_system_snapshot() is snapshot
+    mock_ipc_node.redis.mget.assert_called_once()
+
+    with unittest.mock.patch.object(manager_module, "SNAPSHOT_CACHE_TIME", 0):
+        assert manager.get_system_snapshot() is not snapshot
+    assert mock_ipc_node.redis.mget.call_count == 2
+
+
+def test_manager_sensor_history_route():
+    mock_ipc_node = Mock()
+    manager = manager_module.Manager(mock_ipc_node)
+    route = manager._sensor_history_route.route
+    assert route.match("sensors:history")
+
+    call_data = ipc.CallData("sensors:history", "sender", False, {"key": "sensors:vl53:ranges", "seconds": 10})
+    with unittest.mock.patch.object(manager_module.history, "read", return_value={"samples": []}) as mock_read:
+        assert route._wrapped_function(manager, call_data, call_data.payload) == {"samples": []}
+    mock_read.assert_called_once_with(mock_ipc_node.redis, "sensors:vl53:ranges", 10)
+
+
 def test_manager_integration():
     # Components
     class BasicComponent(component.Component):
@@ -0,0 +1,134 @@
+import os
+import time
+import unittest.mock
+
+import pytest
+from unittest.mock import Mock
+
+import redis
+from utilities import ipc, tracing
+from utilities import logger as lg
+
+
+# --- Trace Context --- #
+def test_trace_context_dumps_and_loads():
+    context = tracing.TraceContext("trace", "span")
+    assert context.sent is None
+
+    sent = context.for_send()
+    assert sent.trace_id == "trace"
+    assert sent.span_id == "span"
+    assert sent.sent is not None
+
+    loaded = tracing.TraceContext.loads(sent.dumps())
+    assert (loaded.trace_id, loaded.span_id, loaded.sent) == (sent.trace_id, sent.span_id, sent.sent)
+    assert tracing.TraceContext.loads(None) is None
+
+
+def test_calldata_trace_dumps_and_loads():
+    call_data = ipc.CallData("channel", "sender", False, {}, trace=tracing.TraceContext("trace", "span", 1.0))
+    loaded = ipc.CallData.loads(call_data.dumps())
+    assert loaded.trace.dumps() == ("trace", "span", 1.0)
+
+    assert ipc.CallData.loads(ipc.CallData("channel", "sender", False, {}).dumps()).trace is None
+
+
+# --- Spans --- #
+def test_activate():
+    assert tracing.current() is None
+
+    context = tracing.TraceContext("trace", "span")
+    with tracing.activate(context):
+        assert tracing.current() is context
+    assert tracing.current() is None
+
+
+def test_span():
+    mock_ipc_node = Mock()
+    mock_ipc_node.ipc_id = "node"
+
+    # No active trace, nothing is reported
+    with tracing.span(mock_ipc_node, "name"):
+        assert tracing.current() is None
+    mock_ipc_node.report_span.assert_not_called()
+
+    # Child span of the given parent
+    parent = tracing.TraceContext("trace", "parent")
+    with tracing.span(mock_ipc_node, "name", parent):
+        assert tracing.current().trace_id == "trace"
+        span_id = tracing.current().span_id
+    assert tracing.current() is None
+
+    span = mock_ipc_node.report_span.call_args.args[0]
+    assert (span.name, span.node, span.trace_id, span.span_id, span.parent_id) == (
+        "name", "node", "trace", span_id, "parent"
+    )
+    assert span.end >= span.start
+    assert tracing.Span.loads(span.dumps()).dumps() == span.dumps()
+
+
+def test_trace():
+    mock_ipc_node = Mock()
+    mock_ipc_node.ipc_id = "node"
+
+    with unittest.mock.patch("utilities.tracing.ENABLED", False):
+        with tracing.trace(mock_ipc_node, "root"):
+            assert tracing.current() is None
+    mock_ipc_node.report_span.assert_not_called()
+
+    with unittest.mock.patch("utilities.tracing.ENABLED", True):
+        with tracing.trace(mock_ipc_node, "root"):
+            context = tracing.current()
+    span = mock_ipc_node.report_span.call_args.args[0]
+    assert (span.name, span.trace_id, span.span_id, span.parent_id) == (
+        "root", context.trace_id, context.span_id, None
+    )
+
+
+# --- Integration --- #
+def test_tracing_integration():
+    spans = []
+
+    class TestIpcNode(ipc.IpcNode):
+        @ipc.Route(["command"], False).decorator
+        def command(self, call_data: ipc.CallData, payload: dict):
+            self.send("follow_up", {}, loopback=True)
+
+        @ipc.Route(["follow_up"], True).decorator
+        def follow_up(self, call_data: ipc.CallData, payload: dict):
+            pass
+
+        @ipc.Route([tracing.SPAN_CHANNEL], False).decorator
+        def collect(self, call_data: ipc.CallData, payload: dict):
+            spans.append(tracing.Span.loads(payload))
+
+    r = redis.StrictRedis(host=os.environ.get("REDIS_HOST"), port=os.environ.get("REDIS_PORT"), db=0)
+    node = TestIpcNode("node", r, r.pubsub())
+    node.set_logger(lg.Logger(node))
+    node.start()
+
+    with unittest.mock.patch("utilities.tracing.ENABLED", True):
+        with tracing.trace(node, "root"):
+            node.send("command", {}, loopback=True)
+
+    timeout = time.time() + 2
+    while len(spans) < 5 and time.time() < timeout:
+        time.sleep(0.01)
+    node.stop()
+
+    # Root, transport and handler spans of both hops, all part of the same trace
+    assert sorted((s.category, s.name) for s in spans) == sorted([
+        ("trace", "root"),
+        ("ipc", "command"),
+        ("handler", "test_tracing_integration.<locals>.TestIpcNode.command"),
+        ("ipc", "follow_up"),
+        ("handler", "test_tracing_integration.<locals>.TestIpcNode.follow_up"),
+    ])
+    assert len({s.trace_id for s in spans}) == 1
+
+    by_name = {s.name: s for s in spans}
+    assert by_name["follow_up"].parent_id == by_name["test_tracing_integration.<locals>.TestIpcNode.command"].span_id
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,133 @@
+import os
+import threading
+import unittest.mock
+from unittest.mock import Mock
+
+import pytest
+
+from flight_recorder import flight_recorder
+from replay import replay
+from utilities import ipc
+
+
+@pytest.fixture
+def flight(tmp_path):
+    """A flight recorded by the flight recorder, with samples of several streams sharing reception timestamps"""
+    with unittest.mock.patch.object(flight_recorder.FlightRecorderComponent, "DIRECTORY", str(tmp_path)):
+        recorder = flight_recorder.FlightRecorderComponent(Mock())
+
+    for t, channel, payload in [
+        (100.0, "sensors:vl53:ranges", {"first_range": 100, "second_range": 200}),
+        (100.0, "sensors:sense_hat:data", {"roll": 1.5, "armed": True, "accel": [0.1, 0.2, 9.8]}),
+        (100.0, "sensors:vl53:ranges", {"first_range": 101, "second_range": 201}),
+        (99.5, "sensors:sense_hat:data", {"roll": 1.0, "armed": False, "accel": [0.0, 0.0, 9.8]}),
+        (100.2, "propulsion:speed", 0.5),
+        (100.4, "sensors:vl53:ranges", {"first_range": 102, "second_range": 202}),
+    ]:
+        call_data = ipc.CallData(channel, "sender", False, payload)
+        with unittest.mock.patch.object(flight_recorder.time, "time", return_value=t):
+            recorder.record.route._wrapped_function(recorder, call_data, payload)
+    recorder._write_pending()
+    for stream in recorder._streams.values():
+        stream.close()
+    return recorder._flight_directory
+
+
+@pytest.fixture
+def component():
+    return replay.ReplayComponent(Mock())
+
+
+# --- Schedule --- #
+def test_load(flight):
+    streams = replay.ReplayComponent.load(flight, ["sensors:*"])
+    # Sorted by stream name, only the matching channels
+    assert [channel for channel, _, _ in streams] == ["sensors:sense_hat:data", "sensors:vl53:ranges"]
+    assert [len(samples) for _, samples, _ in streams] == [2, 3]
+
+
+def test_schedule(flight):
+    streams = replay.ReplayComponent.load(flight, ["*"])
+    first = replay.ReplayComponent.schedule(streams)
+    second = replay.ReplayComponent.schedule(replay.ReplayComponent.load(flight, ["*"]))
+    assert [list(a) for a in first] == [list(a) for a in second]
+
+    # By timestamp, then stream, then sample index, samples are not always received in timestamp order
+    order = [(streams[s][0], streams[s][1]["t"][i].item(), i) for s, i in zip(*first)]
+    assert order == [
+        ("sensors:sense_hat:data", 99.5, 1),
+        ("sensors:sense_hat:data", 100.0, 0),
+        ("sensors:vl53:ranges", 100.0, 0),
+        ("sensors:vl53:ranges", 100.0, 1),
+        ("propulsion:speed", 100.2, 0),
+        ("sensors:vl53:ranges", 100.4, 2),
+    ]
+
+
+def test_schedule_empty():
+    stream_indices, sample_indices = replay.ReplayComponent.schedule([])
+    assert len(stream_indices) == len(sample_indices) == 0
+
+
+# --- Replay --- #
+def test_replay_payloads(flight, component):
+    streams = replay.ReplayComponent.load(flight, ["*"])
+    component._replay(streams, *replay.ReplayComponent.schedule(streams), 0, threading.Event())
+
+    # Sensors are published as states, the original shapes are restored
+    states = [call.args[1:] for call in component.ipc_node.publish_state.call_args_list]
+    assert states[0] == ("replay:status", {"replaying": True})
+    assert states[1:-1] == [
+        ("sensors:sense_hat:data", {"roll": 1.0, "armed": False, "accel": (0.0, 0.0, 9.8)}),
+        ("sensors:sense_hat:data", {"roll": 1.5, "armed": True, "accel": (0.1, 0.2, 9.8)}),
+        ("sensors:vl53:ranges", {"first_range": 100, "second_range": 200}),
+        ("sensors:vl53:ranges", {"first_range": 101, "second_range": 201}),
+        ("sensors:vl53:ranges", {"first_range": 102, "second_range": 202}),
+    ]
+    assert states[-1] == ("replay:status", {"replaying": False, "published": 6})
+    assert all(isinstance(payload["first_range"], int) for channel, payload in states[3:-1])
+
+    # Other channels are sent, scalar payloads are restored as scalars
+    component.ipc_node.send.assert_called_once_with("propulsion:speed", 0.5)
+
+
+@pytest.mark.parametrize("speed, delays", [
+    (1, [0.5, 0.5, 0.5, 0.7, 0.9]),
+    (2, [0.25, 0.25, 0.25, 0.35, 0.45]),
+    (0, []),
+])
+def test_replay_speed(flight, component, speed, delays):
+    streams = replay.ReplayComponent.load(flight, ["*"])
+    stop = Mock()
+    stop.is_set.return_value = False
+    stop.wait.return_value = False
+
+    with unittest.mock.patch.object(replay.time, "monotonic", return_value=10.0):
+        component._replay(streams, *replay.ReplayComponent.schedule(streams), speed, stop)
+
+    # Each sample waits for its offset from the first one, scaled by the speed, as fast as possible at speed 0
+    assert [call.args[0] for call in stop.wait.call_args_list] == pytest.approx(delays)
+    assert component.ipc_node.publish_state.call_args.args[2]["published"] == 6
+
+
+def test_replay_stop(flight, component):
+    streams = replay.ReplayComponent.load(flight, ["*"])
+    stop = Mock()
+    stop.is_set.return_value = False
+    # Stopped while waiting for the second sample
+    stop.wait.return_value = True
+
+    component._replay(streams, *replay.ReplayComponent.schedule(streams), 1, stop)
+    assert component.ipc_node.publish_state.call_args.args[2] == {"replaying": False, "published": 1}
+
+
+def test_start_replay(flight, component):
+    with unittest.mock.patch.object(flight_recorder.FlightRecorderComponent, "DIRECTORY", flight + "-missing"):
+        assert component._start(None, 0, ["*"]) == 0
+    component.logger.warning.assert_called_once()
+
+    # The latest flight by default
+    with unittest.mock.patch.object(flight_recorder.FlightRecorderComponent, "DIRECTORY", os.path.dirname(flight)):
+        assert component._start(None, 0, ["sensors:vl53:*"]) == 3
+    component._replay_thread.join(1)
+    assert component.ipc_node.publish_state.call_args.args[2] == {"replaying": False, "published": 3}
@@ -0,0 +1,97 @@
+import json
+import os
+import unittest.mock
+from unittest.mock import Mock
+
+import pytest
+
+from tracer import tracer
+from utilities import ipc, tracing
+
+
+def make_span(name, node, span_id, parent_id, start, end, trace_id="trace"):
+    return tracing.Span(name, "handler", node, trace_id, span_id, parent_id, start, end, thread=7)
+
+
+@pytest.fixture
+def component(tmp_path):
+    component = tracer.TracerComponent(Mock())
+    component.DIRECTORY = str(tmp_path / "traces")
+    return component
+
+
+def call(route, component, channel, payload):
+    call_data = ipc.CallData(channel, "sender", False, payload)
+    return route.route._wrapped_function(component, call_data, payload)
+
+
+# --- Trace Events --- #
+def test_to_trace_events():
+    spans = [
+        make_span("handler", "b", "2", "1", 10.5, 10.75),
+        make_span("command", "a", "1", None, 10.0, 11.0),
+        make_span("late", "a", "3", "2", 10.8, 10.7),
+    ]
+    events = tracer.to_trace_events(spans)
+    assert events["displayTimeUnit"] == "ms"
+
+    # One process per node, named by a metadata event, in the order of the first span
+    metadata = [e for e in events["traceEvents"] if e["ph"] == "M"]
+    assert [(e["pid"], e["args"]["name"]) for e in metadata] == [(1, "a"), (2, "b")]
+
+    # Complete events sorted by start, timestamps and durations in microseconds
+    complete = [e for e in events["traceEvents"] if e["ph"] == "X"]
+    assert [(e["name"], e["pid"], e["tid"]) for e in complete] == [("command", 1, 7), ("handler", 2, 7), ("late", 1, 7)]
+    assert [e["ts"] for e in complete] == pytest.approx([10.0e6, 10.5e6, 10.8e6])
+    assert [e["dur"] for e in complete] == pytest.approx([1.0e6, 0.25e6, 0])
+
+    # Parent and child spans are linked by their ids
+    by_id = {e["args"]["span_id"]: e for e in complete}
+    assert by_id["1"]["args"]["parent_id"] is None
+    assert by_id["2"]["args"]["parent_id"] == "1"
+    assert by_id[by_id["3"]["args"]["parent_id"]]["name"] == "handler"
+    assert all(e["args"]["trace_id"] == "trace" for e in complete)
+
+
+def test_to_trace_events_empty():
+    assert tracer.to_trace_events([]) == {"traceEvents": [], "displayTimeUnit": "ms"}
+
+
+# --- Tracer Component --- #
+def test_tracer_collect_export_clear(component):
+    call(component.collect_span, component, tracing.SPAN_CHANNEL, make_span("a", "n", "1", None, 1.0, 2.0).dumps())
+    call(component.collect_span, component, tracing.SPAN_CHANNEL, make_span("b", "n", "2", None, 1.5, 2.0, "t").dumps())
+
+    events = call(component.export, component, "trace:export", {})
+    assert [e["name"] for e in events["traceEvents"] if e["ph"] == "X"] == ["a", "b"]
+    events = call(component.export, component, "trace:export", {"trace_id": "t"})
+    assert [e["name"] for e in events["traceEvents"] if e["ph"] == "X"] == ["b"]
+
+    call(component.clear, component, "trace:clear", {})
+    assert call(component.export, component, "trace:export", {})["traceEvents"] == []
+
+
+def test_tracer_collect_max_spans():
+    with unittest.mock.patch.object(tracer.TracerComponent, "MAX_SPANS", 2):
+        component = tracer.TracerComponent(Mock())
+    for i in range(3):
+        span = make_span(str(i), "n", str(i), None, i, i)
+        call(component.collect_span, component, tracing.SPAN_CHANNEL, span.dumps())
+
+    # The oldest spans are dropped first
+    assert [span.name for span in component._spans] == ["1", "2"]
+
+
+def test_tracer_export_path(component):
+    call(component.collect_span, component, tracing.SPAN_CHANNEL, make_span("a", "n", "1", None, 1.0, 2.0).dumps())
+
+    events = call(component.export, component, "trace:export", {"path": "flights/trace.json"})
+    with open(os.path.join(component.DIRECTORY, "flights", "trace.json")) as f:
+        assert json.load(f) == events
+    component.logger.info.assert_called_once()
+
+    # Only written inside the export directory
+    for path in ["../trace.json", "/tmp/trace.json", "flights/../../trace.json", "."]:
+        with pytest.raises(ValueError):
+            call(component.export, component, "trace:export", {"path": path})
+    assert sorted(os.listdir(os.path.dirname(component.DIRECTORY))) == ["traces"]